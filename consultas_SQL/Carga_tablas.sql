@@ -65,6 +65,17 @@ ADD COLUMN fib_61_8 NUMERIC(12,3),
 ADD COLUMN fib_100 NUMERIC(12,3),
 ADD COLUMN nivel_fib_cercano VARCHAR(10),
 ADD COLUMN estado_fibonacci VARCHAR(20);
+
+-- Fibonacci sobre ventana de 6 meses (126 ruedas); fib_* usa 52 semanas (252 ruedas)
+ALTER TABLE indicadores_tecnicos
+ADD COLUMN fib_0_0_6m NUMERIC(12,3),
+ADD COLUMN fib_23_6_6m NUMERIC(12,3),
+ADD COLUMN fib_38_2_6m NUMERIC(12,3),
+ADD COLUMN fib_50_0_6m NUMERIC(12,3),
+ADD COLUMN fib_61_8_6m NUMERIC(12,3),
+ADD COLUMN fib_100_6m NUMERIC(12,3),
+ADD COLUMN nivel_fib_cercano_6m VARCHAR(10),
+ADD COLUMN estado_fibonacci_6m VARCHAR(20);
 ---------------------------------------------------------------------------
 CREATE TABLE IF NOT EXISTS resumen_inversion (
     ticker VARCHAR(10) PRIMARY KEY,
@@ -97,3 +108,56 @@ CREATE TABLE IF NOT EXISTS precios_variaciones (
     PRIMARY KEY (date, ticker),
     FOREIGN KEY (ticker) REFERENCES empresas(ticker)
 );
+
+---------------------------------------------------------------------------
+-- Resumen de inversión para cada fecha: particionada por año (las particiones
+-- resumen_inversion_historico_AAAA las crea load.py al cargar)
+CREATE TABLE IF NOT EXISTS resumen_inversion_historico (
+    date DATE NOT NULL,
+    ticker VARCHAR(10) NOT NULL,
+    pct_tecnico_buy NUMERIC(5,2),
+    pct_fundamental_buy NUMERIC(5,2),
+    decision_final VARCHAR(20),
+    estado_bollingerbands VARCHAR(20),
+    sma_vs_ema VARCHAR(10),
+    macd VARCHAR(10),
+    rsi VARCHAR(10),
+    per VARCHAR(10),
+    roe VARCHAR(10),
+    eps_growth_yoy VARCHAR(10),
+    deuda_patrimonio VARCHAR(10),
+    estado_fibonacci VARCHAR(20),
+    PRIMARY KEY (date, ticker),
+    FOREIGN KEY (ticker) REFERENCES empresas(ticker)
+) PARTITION BY RANGE (date);
+
+CREATE INDEX IF NOT EXISTS idx_resumen_historico_ticker_date
+    ON resumen_inversion_historico (ticker, date);
+
+---------------------------------------------------------------------------
+-- Marcas de agua de las cargas incrementales: última fecha cargada por tabla y ticker
+-- (las actualiza load.py en la misma transacción que cada carga)
+CREATE TABLE IF NOT EXISTS etl_watermarks (
+    tabla VARCHAR(50) NOT NULL,
+    ticker VARCHAR(10) NOT NULL,
+    max_date DATE NOT NULL,
+    PRIMARY KEY (tabla, ticker)
+);
+
+-- Fechas insertadas o modificadas por las cargas y todavía no refrescadas en las tablas
+-- analíticas (las anota load.py en la transacción de cada carga, las consume analiticas.py).
+-- Una fila por tabla y fecha: cargas de tablas distintas no esperan unas a otras
+CREATE TABLE IF NOT EXISTS etl_fechas_pendientes (
+    tabla VARCHAR(50) NOT NULL,
+    date DATE NOT NULL,
+    PRIMARY KEY (tabla, date)
+);
+
+-- (ticker, date): inicializar las marcas (MAX(date) GROUP BY ticker) sin recorrer toda la tabla
+CREATE INDEX IF NOT EXISTS idx_precios_historicos_ticker_date ON precios_historicos (ticker, date);
+CREATE INDEX IF NOT EXISTS idx_indicadores_tecnicos_ticker_date ON indicadores_tecnicos (ticker, date);
+CREATE INDEX IF NOT EXISTS idx_precios_variaciones_ticker_date ON precios_variaciones (ticker, date);
+
+---------------------------------------------------------------------------
+-- precios_historicos e indicadores_tecnicos particionadas por año (+ BRIN sobre date):
+-- ver Migracion_particiones.sql
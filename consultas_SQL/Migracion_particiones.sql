@@ -0,0 +1,90 @@
+-- ========================
+-- Migración: precios_historicos e indicadores_tecnicos particionadas por año
+-- ========================
+-- Ejecutar una vez después de Carga_tablas.sql (también sirve con las tablas vacías).
+-- Cada tabla se recrea como PARTITION BY RANGE (date) con una partición por año
+-- (tabla_AAAA, las mismas que crea load.py al cargar), se copian los datos ordenados
+-- por fecha y se reemplaza la tabla original en una sola transacción.
+-- Consultas con filtro de fecha y cargas diarias solo tocan las particiones recientes;
+-- el índice BRIN sobre date es mínimo porque los datos llegan en orden de fecha.
+
+BEGIN;
+
+-- ========================
+-- 1. precios_historicos
+-- ========================
+CREATE TABLE precios_historicos_particionada (
+    LIKE precios_historicos INCLUDING DEFAULTS,
+    PRIMARY KEY (date, ticker),
+    FOREIGN KEY (ticker) REFERENCES empresas(ticker)
+) PARTITION BY RANGE (date);
+
+DO $$
+DECLARE anio INTEGER;
+BEGIN
+    FOR anio IN
+        SELECT generate_series(
+            COALESCE(EXTRACT(YEAR FROM MIN(date)), EXTRACT(YEAR FROM CURRENT_DATE))::INTEGER,
+            GREATEST(EXTRACT(YEAR FROM MAX(date)), EXTRACT(YEAR FROM CURRENT_DATE))::INTEGER)
+        FROM precios_historicos
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE precios_historicos_%s PARTITION OF precios_historicos_particionada '
+            'FOR VALUES FROM (%L) TO (%L);', anio, make_date(anio, 1, 1), make_date(anio + 1, 1, 1));
+    END LOOP;
+END $$;
+
+INSERT INTO precios_historicos_particionada
+SELECT * FROM precios_historicos ORDER BY date, ticker;
+
+DROP TABLE precios_historicos;
+ALTER TABLE precios_historicos_particionada RENAME TO precios_historicos;
+ALTER TABLE precios_historicos RENAME CONSTRAINT precios_historicos_particionada_pkey TO precios_historicos_pkey;
+
+CREATE INDEX IF NOT EXISTS idx_precios_historicos_date_brin ON precios_historicos USING BRIN (date);
+CREATE INDEX IF NOT EXISTS idx_precios_historicos_ticker_date ON precios_historicos (ticker, date);
+
+-- ========================
+-- 2. indicadores_tecnicos
+-- ========================
+CREATE TABLE indicadores_tecnicos_particionada (
+    LIKE indicadores_tecnicos INCLUDING DEFAULTS,
+    PRIMARY KEY (date, ticker),
+    FOREIGN KEY (ticker) REFERENCES empresas(ticker)
+) PARTITION BY RANGE (date);
+
+DO $$
+DECLARE anio INTEGER;
+BEGIN
+    FOR anio IN
+        SELECT generate_series(
+            COALESCE(EXTRACT(YEAR FROM MIN(date)), EXTRACT(YEAR FROM CURRENT_DATE))::INTEGER,
+            GREATEST(EXTRACT(YEAR FROM MAX(date)), EXTRACT(YEAR FROM CURRENT_DATE))::INTEGER)
+        FROM indicadores_tecnicos
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE indicadores_tecnicos_%s PARTITION OF indicadores_tecnicos_particionada '
+            'FOR VALUES FROM (%L) TO (%L);', anio, make_date(anio, 1, 1), make_date(anio + 1, 1, 1));
+    END LOOP;
+END $$;
+
+INSERT INTO indicadores_tecnicos_particionada
+SELECT * FROM indicadores_tecnicos ORDER BY date, ticker;
+
+DROP TABLE indicadores_tecnicos;
+ALTER TABLE indicadores_tecnicos_particionada RENAME TO indicadores_tecnicos;
+ALTER TABLE indicadores_tecnicos RENAME CONSTRAINT indicadores_tecnicos_particionada_pkey TO indicadores_tecnicos_pkey;
+
+CREATE INDEX IF NOT EXISTS idx_indicadores_tecnicos_date_brin ON indicadores_tecnicos USING BRIN (date);
+CREATE INDEX IF NOT EXISTS idx_indicadores_tecnicos_ticker_date ON indicadores_tecnicos (ticker, date);
+
+-- ========================
+-- 3. resumen_inversion_historico (ya particionada): mismo índice BRIN
+-- ========================
+CREATE INDEX IF NOT EXISTS idx_resumen_historico_date_brin ON resumen_inversion_historico USING BRIN (date);
+
+COMMIT;
+
+-- Las particiones se pueden revisar con:
+-- SELECT inhrelid::regclass AS particion FROM pg_inherits
+-- WHERE inhparent = 'precios_historicos'::regclass ORDER BY 1;
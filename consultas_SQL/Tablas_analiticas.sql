@@ -0,0 +1,101 @@
+-- ========================
+-- Tablas analíticas precalculadas (las mantiene src/etl/analiticas.py después de cada carga)
+-- ========================
+-- Ejecutar una vez después de Carga_tablas.sql. Las cargas por fecha registran en
+-- etl_fechas_pendientes (creada en Carga_tablas.sql) las fechas que insertaron o modificaron
+-- y el refresco recalcula solo esas fechas (y los meses/años que las contienen).
+
+-- ========================
+-- 1. Última foto por ticker (precio, técnicos, variaciones, fundamentales y decisión)
+-- ========================
+CREATE TABLE IF NOT EXISTS ultimo_por_ticker (
+    ticker VARCHAR(10) PRIMARY KEY,
+    name TEXT,
+    sector TEXT,
+    industry TEXT,
+    date DATE,
+    close NUMERIC(12,3),
+    volume BIGINT,
+    sma_20 NUMERIC(12,3),
+    ema_20 NUMERIC(12,3),
+    rsi_14 NUMERIC(6,2),
+    macd NUMERIC(12,6),
+    macd_signal NUMERIC(12,6),
+    volatility_20 NUMERIC(12,6),
+    bb_upper NUMERIC(12,3),
+    bb_lower NUMERIC(12,3),
+    estado_macd VARCHAR(10),
+    estado_bollinger VARCHAR(20),
+    var_daily NUMERIC(8,4),
+    var_weekly NUMERIC(8,4),
+    var_monthly NUMERIC(8,4),
+    var_annual NUMERIC(8,4),
+    var_5y NUMERIC(8,4),
+    per NUMERIC,
+    roe NUMERIC,
+    market_cap BIGINT,
+    pct_tecnico_buy NUMERIC(5,2),
+    pct_fundamental_buy NUMERIC(5,2),
+    decision_final VARCHAR(20),
+    FOREIGN KEY (ticker) REFERENCES empresas(ticker)
+);
+
+CREATE INDEX IF NOT EXISTS idx_ultimo_por_ticker_sector ON ultimo_por_ticker (sector, industry);
+
+-- ========================
+-- 2. Agregados diarios por sector e industria (industry = 'TOTAL': todo el sector)
+-- ========================
+CREATE TABLE IF NOT EXISTS agregados_sector (
+    date DATE NOT NULL,
+    sector TEXT NOT NULL,
+    industry TEXT NOT NULL,
+    tickers INTEGER,
+    var_daily_prom NUMERIC(8,4),
+    var_monthly_prom NUMERIC(8,4),
+    var_annual_prom NUMERIC(8,4),
+    rsi_prom NUMERIC(6,2),
+    pct_sobrecompra NUMERIC(5,2),
+    pct_sobreventa NUMERIC(5,2),
+    volumen_total BIGINT,
+    PRIMARY KEY (sector, industry, date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_agregados_sector_date ON agregados_sector (date);
+
+-- ========================
+-- 3. Rendimientos mensuales y anuales por ticker
+-- ========================
+-- rendimiento = último cierre del período / último cierre del período anterior - 1
+CREATE TABLE IF NOT EXISTS rendimientos_mensuales (
+    ticker VARCHAR(10) NOT NULL,
+    periodo DATE NOT NULL,  -- primer día del mes
+    close_inicio NUMERIC(12,3),
+    close_cierre NUMERIC(12,3),
+    close_min NUMERIC(12,3),
+    close_max NUMERIC(12,3),
+    close_prom NUMERIC(12,3),
+    volumen_total BIGINT,
+    rendimiento NUMERIC(10,4),
+    PRIMARY KEY (ticker, periodo)
+);
+
+CREATE TABLE IF NOT EXISTS rendimientos_anuales (
+    ticker VARCHAR(10) NOT NULL,
+    periodo DATE NOT NULL,  -- 1 de enero
+    close_inicio NUMERIC(12,3),
+    close_cierre NUMERIC(12,3),
+    close_min NUMERIC(12,3),
+    close_max NUMERIC(12,3),
+    close_prom NUMERIC(12,3),
+    volumen_total BIGINT,
+    rendimiento NUMERIC(10,4),
+    PRIMARY KEY (ticker, periodo)
+);
+
+CREATE INDEX IF NOT EXISTS idx_rendimientos_mensuales_periodo ON rendimientos_mensuales (periodo);
+CREATE INDEX IF NOT EXISTS idx_rendimientos_anuales_periodo ON rendimientos_anuales (periodo);
+
+-- Primera vez: todas las fechas ya cargadas quedan pendientes de calcular
+INSERT INTO etl_fechas_pendientes (tabla, date)
+SELECT DISTINCT 'precios_historicos', date FROM precios_historicos
+ON CONFLICT DO NOTHING;
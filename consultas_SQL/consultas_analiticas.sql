@@ -0,0 +1,50 @@
+-- ========================
+-- Consultas de dashboard sobre las tablas analíticas (Tablas_analiticas.sql)
+-- ========================
+-- Mismas preguntas que consultas_APPL*.sql, resueltas con búsquedas por clave primaria.
+
+-- 1. Última foto de AAPL: precio, técnicos, estados MACD/Bollinger, variaciones y decisión
+SELECT *
+FROM ultimo_por_ticker
+WHERE ticker = 'AAPL';
+
+-- 2. Performance anual de AAPL
+SELECT
+    EXTRACT(YEAR FROM periodo) AS año,
+    close_min,
+    close_max,
+    close_prom,
+    rendimiento
+FROM rendimientos_anuales
+WHERE ticker = 'AAPL'
+ORDER BY periodo DESC;
+
+-- 3. Rendimientos mensuales de AAPL (último año)
+SELECT periodo, close_cierre, rendimiento
+FROM rendimientos_mensuales
+WHERE ticker = 'AAPL'
+  AND periodo >= date_trunc('month', CURRENT_DATE - INTERVAL '1 year')
+ORDER BY periodo DESC;
+
+-- 4. Sector de AAPL: agregados de los últimos 30 días
+SELECT a.date, a.tickers, a.var_daily_prom, a.rsi_prom, a.pct_sobrecompra
+FROM agregados_sector a
+JOIN ultimo_por_ticker u ON u.sector = a.sector
+WHERE u.ticker = 'AAPL'
+  AND a.industry = 'TOTAL'
+  AND a.date >= CURRENT_DATE - INTERVAL '30 days'
+ORDER BY a.date DESC;
+
+-- 5. Mejores sectores del último día cargado
+SELECT sector, tickers, var_daily_prom, var_monthly_prom, var_annual_prom
+FROM agregados_sector
+WHERE industry = 'TOTAL'
+  AND date = (SELECT MAX(date) FROM agregados_sector)
+ORDER BY var_daily_prom DESC;
+
+-- 6. Empresas con señal de COMPRA en sobreventa (RSI < 30)
+SELECT ticker, name, sector, close, rsi_14, estado_bollinger, decision_final
+FROM ultimo_por_ticker
+WHERE decision_final = 'COMPRAR'
+  AND rsi_14 < 30
+ORDER BY rsi_14;
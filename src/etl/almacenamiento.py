@@ -0,0 +1,436 @@
+import os
+import glob
+import json
+import shutil
+import operator
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+from dotenv import load_dotenv
+from esquema import compactar, reporte_memoria, REPORTE_MEMORIA, COLUMNAS_FECHA
+from metricas import midiendo, registrar_lectura, registrar_escritura, tamanio_en_disco
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAY_PARQUET = True
+except ImportError:
+    HAY_PARQUET = False
+
+load_dotenv()
+
+# Formato de los datasets intermedios: Parquet si está pyarrow, CSV si no (o si se fuerza por .env)
+FORMATO = os.getenv("ETL_FORMATO", "parquet" if HAY_PARQUET else "csv")
+
+PARTICION_ANIO = "Anio"  # columna derivada de Date usada para particionar por año
+PARTICION_MES = "Mes"    # ídem por mes (AAAA-MM), usada por el historial append-only
+MANIFIESTO = "_manifiesto.json"  # pyarrow ignora los archivos que empiezan con "_"
+
+_PARTICIONES_DERIVADAS = {
+    PARTICION_ANIO: lambda fechas: fechas.dt.year,
+    PARTICION_MES: lambda fechas: fechas.dt.strftime("%Y-%m"),
+}
+
+_OPERADORES = {
+    "==": operator.eq, "!=": operator.ne,
+    ">": operator.gt, ">=": operator.ge,
+    "<": operator.lt, "<=": operator.le,
+}
+
+def ruta_dataset(directorio, nombre, formato=None):
+    """Ruta de un dataset con la extensión del formato configurado (p. ej. precios_historicos_ready.parquet)."""
+    return os.path.join(directorio, f"{nombre}.{formato or FORMATO}")
+
+def _es_parquet(ruta):
+    return ruta.rstrip("/").endswith(".parquet")
+
+def _ruta_existente(ruta):
+    """Si el Parquet todavía no existe pero sí su versión CSV anterior, se usa el CSV (migración)."""
+    if _es_parquet(ruta) and not os.path.exists(ruta):
+        ruta_csv = ruta.rstrip("/")[:-len(".parquet")] + ".csv"
+        if os.path.exists(ruta_csv):
+            return ruta_csv
+    return ruta
+
+def existe_tabla(ruta):
+    return os.path.exists(_ruta_existente(ruta))
+
+def _aplicar_filtros(df, filtros):
+    """Aplica filtros estilo pyarrow [(columna, operador, valor), ...] sobre un DataFrame."""
+    for columna, op, valor in filtros or []:
+        if op == "in":
+            mascara = df[columna].isin(valor)
+        elif op == "not in":
+            mascara = ~df[columna].isin(valor)
+        else:
+            mascara = _OPERADORES[op](df[columna], valor)
+        df = df[mascara]
+    return df
+
+def _tipar_fechas(df):
+    for columna in COLUMNAS_FECHA:
+        if columna in df.columns and not pd.api.types.is_datetime64_any_dtype(df[columna]):
+            df[columna] = pd.to_datetime(df[columna])
+    return df
+
+# ================
+# Memoria compartida entre etapas (ver dag.py)
+# ================
+_memoria = None
+_lock_memoria = threading.Lock()
+
+@contextmanager
+def memoria_compartida():
+    """
+    Mientras está activa, lo que se escribe con guardar_tabla queda también en memoria y
+    leer_tabla lo devuelve desde ahí (una copia) sin volver a leer el disco. El disco se sigue
+    escribiendo igual, así que cada etapa puede ejecutarse sola más tarde.
+    """
+    global _memoria
+    _memoria = {}
+    try:
+        yield
+    finally:
+        _memoria = None
+
+def _clave_memoria(ruta):
+    return os.path.abspath(ruta.rstrip("/"))
+
+def _recordar(ruta, df):
+    with _lock_memoria:
+        if _memoria is not None:
+            _memoria[_clave_memoria(ruta)] = df.copy()
+
+def _olvidar(ruta):
+    with _lock_memoria:
+        if _memoria is not None:
+            _memoria.pop(_clave_memoria(ruta), None)
+
+def _desde_memoria(ruta, columnas, filtros):
+    with _lock_memoria:
+        df = None if _memoria is None else _memoria.get(_clave_memoria(ruta))
+    if df is None:
+        return None
+    df = _aplicar_filtros(df, filtros)
+    df = df[list(columnas)] if columnas is not None else df
+    return df.copy().reset_index(drop=True)
+
+def leer_tabla(ruta, columnas=None, filtros=None):
+    """
+    Lee un dataset (archivo o directorio particionado) con las columnas tipadas.
+
+    Args:
+        ruta (str): Archivo .csv/.parquet o directorio de un dataset Parquet particionado.
+        columnas (list): Proyección de columnas a leer (None = todas).
+        filtros (list): Filtros [(columna, operador, valor)]; en Parquet se empujan al lector
+            y solo se leen las particiones/row groups necesarios.
+    """
+    df = _desde_memoria(ruta, columnas, filtros)
+    if df is not None:
+        registrar_lectura(len(df))
+        return df
+
+    ruta = _ruta_existente(ruta)
+    if _es_parquet(ruta):
+        if not HAY_PARQUET:
+            raise ImportError("Se necesita pyarrow para leer datasets Parquet.")
+        df = pd.read_parquet(ruta, columns=columnas, filters=filtros or None)
+        derivadas = [c for c in _PARTICIONES_DERIVADAS if c in df.columns and (columnas is None or c not in columnas)]
+        df = df.drop(columns=derivadas)
+        return _informar(compactar(df).reset_index(drop=True), "leído", ruta)
+
+    usecols = None
+    if columnas is not None:
+        usecols = list(dict.fromkeys(list(columnas) + [c for c, _, _ in filtros or []]))
+    archivos = sorted(glob.glob(os.path.join(ruta, "**", "*.csv"), recursive=True)) if os.path.isdir(ruta) else [ruta]
+    df = pd.concat([pd.read_csv(archivo, usecols=usecols, float_precision="round_trip") for archivo in archivos],
+                   ignore_index=True)
+    df = _tipar_fechas(df)
+    df = _aplicar_filtros(df, filtros)
+    if columnas is not None:
+        df = df[list(columnas)]
+    return _informar(compactar(df).reset_index(drop=True), "leído", ruta)
+
+def _posteriores(df, marcas):
+    """Máscara de filas posteriores a la marca de su ticker (tickers sin marca: todas)."""
+    marca = pd.Series(marcas.reindex(df["Ticker"].astype(str)).to_numpy(), index=df.index)
+    return (marca.isna() | (df["Date"] > marca)).to_numpy()
+
+def leer_posteriores(ruta, marcas, columnas=None):
+    """
+    Lee solo las filas posteriores a la marca de su ticker.
+
+    `marcas` es una Serie ticker -> última fecha ya procesada; los tickers sin marca se leen
+    completos. La lectura filtra desde la marca más vieja y el resto se descarta en memoria.
+    """
+    if marcas.empty:
+        return leer_tabla(ruta, columnas=columnas)
+
+    desde = marcas.min()
+    df = leer_tabla(ruta, columnas=columnas, filtros=[("Date", ">", desde)])
+    sin_marca = sorted(set(leer_tabla(ruta, columnas=["Ticker"])["Ticker"].dropna().astype(str)) - set(marcas.index))
+    if sin_marca:
+        anteriores = leer_tabla(ruta, columnas=columnas, filtros=[("Ticker", "in", sin_marca), ("Date", "<=", desde)])
+        df = pd.concat([anteriores, df], ignore_index=True)
+    return df[_posteriores(df, marcas)].reset_index(drop=True)
+
+def _informar(df, accion, ruta):
+    if accion == "leído":
+        registrar_lectura(len(df), tamanio_en_disco(ruta) if midiendo() else 0)
+    if REPORTE_MEMORIA:
+        reporte_memoria(df, f"{accion} {os.path.basename(ruta.rstrip('/'))}")
+    return df
+
+def _registrar_escritura(filas, ruta, antes=0):
+    """Filas escritas y crecimiento del dataset en disco para la etapa que se está midiendo."""
+    if midiendo():
+        registrar_escritura(filas, tamanio_en_disco(ruta) - antes)
+
+def _borrar(ruta):
+    if os.path.isdir(ruta):
+        shutil.rmtree(ruta)
+    elif os.path.exists(ruta):
+        os.remove(ruta)
+
+def borrar_tabla(ruta):
+    """Elimina un dataset (archivo o directorio) y su copia en memoria."""
+    _olvidar(ruta)
+    _borrar(_ruta_existente(ruta))
+
+def _tabla_arrow(df, particion=None):
+    if particion in _PARTICIONES_DERIVADAS:
+        df = df.assign(**{particion: _PARTICIONES_DERIVADAS[particion](df["Date"])})
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    # Categorías siempre con índices int32: pandas usa int8/int16 según la cantidad de valores y
+    # un dataset con archivos de distinto ancho de índice no se puede leer junto
+    campos = [pa.field(c.name, pa.dictionary(pa.int32(), c.type.value_type)) if pa.types.is_dictionary(c.type) else c
+              for c in tabla.schema]
+    return tabla.cast(pa.schema(campos, metadata=tabla.schema.metadata))
+
+def _particion_de(ruta):
+    """Nombre de la columna de partición de un directorio Parquet (carpetas columna=valor)."""
+    for nombre in sorted(os.listdir(ruta)):
+        if "=" in nombre:
+            return nombre.split("=", 1)[0]
+    return None
+
+def guardar_tabla(df, ruta, particion=None, en_memoria=True):
+    """
+    Guarda un dataset reemplazando el anterior.
+
+    Con `particion` (PARTICION_ANIO o el nombre de una columna, p. ej. "Ticker") el Parquet se
+    escribe como directorio particionado. En CSV la partición se ignora (un único archivo).
+    Con `en_memoria=False` no se guarda copia en la memoria compartida (archivos temporales).
+    """
+    directorio = os.path.dirname(ruta.rstrip("/"))
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+
+    df = _informar(compactar(df), "guardado", ruta)
+    if not _es_parquet(ruta):
+        df.to_csv(ruta, index=False)
+    else:
+        _borrar(ruta)
+        if particion is None:
+            df.to_parquet(ruta, index=False)
+        else:
+            pq.write_to_dataset(_tabla_arrow(df, particion), ruta, partition_cols=[particion])
+    _registrar_escritura(len(df), ruta)
+    if en_memoria:
+        _recordar(ruta, df)
+
+def anexar_tabla(df, ruta, particion=None):
+    """
+    Agrega filas al final de un dataset sin reescribir lo existente.
+
+    En CSV se escribe en modo append; en Parquet particionado se agrega un archivo nuevo en
+    cada partición afectada. Un Parquet sin particionar se reescribe completo.
+    """
+    _olvidar(ruta)
+    if not existe_tabla(ruta):
+        guardar_tabla(df, ruta, particion)
+        return
+
+    df = _informar(compactar(df), "anexado", ruta)
+    if not _es_parquet(ruta):
+        antes = tamanio_en_disco(ruta) if midiendo() else 0
+        df.to_csv(ruta, mode="a", header=False, index=False)
+        _registrar_escritura(len(df), ruta, antes)
+    elif os.path.isdir(ruta):
+        particion = particion or _particion_de(ruta)
+        sello = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        antes = tamanio_en_disco(ruta) if midiendo() else 0
+        pq.write_to_dataset(_tabla_arrow(df, particion), ruta, partition_cols=[particion],
+                            basename_template=f"parte-{sello}-{{i}}.parquet",
+                            existing_data_behavior="overwrite_or_ignore")
+        _registrar_escritura(len(df), ruta, antes)
+    else:
+        guardar_tabla(pd.concat([leer_tabla(ruta), df], ignore_index=True), ruta)
+
+
+# ================
+# Lectura/escritura por partes (memoria acotada)
+# ================
+def leer_por_partes(ruta, filas, columnas=None, tipos=None):
+    """
+    Itera un dataset en DataFrames de ~`filas` filas sin cargarlo entero.
+
+    Los archivos se recorren en orden de nombre (particiones por año/mes en orden de fecha).
+    `tipos` ({columna: dtype}) fija el tipo de cada columna en todas las partes: en CSV se pasa
+    a read_csv y en Parquet se castea cada parte.
+    """
+    ruta = _ruta_existente(ruta)
+    registrar_lectura(0, tamanio_en_disco(ruta) if midiendo() else 0)
+    for parte in _partes(ruta, filas, columnas, tipos):
+        registrar_lectura(len(parte))
+        yield parte
+
+def _partes(ruta, filas, columnas, tipos):
+    if _es_parquet(ruta):
+        if not HAY_PARQUET:
+            raise ImportError("Se necesita pyarrow para leer datasets Parquet.")
+        import pyarrow.dataset as ds
+        dataset = ds.dataset(ruta, format="parquet", partitioning="hive")
+        columnas = columnas or [c for c in dataset.schema.names if c not in _PARTICIONES_DERIVADAS]
+        lotes, acumuladas = [], 0
+        for lote in dataset.to_batches(columns=list(columnas), batch_size=filas, batch_readahead=1, fragment_readahead=1):
+            lotes.append(lote)
+            acumuladas += lote.num_rows
+            if acumuladas >= filas:
+                yield _parte_tipada(pa.Table.from_batches(lotes).to_pandas(), tipos)
+                lotes, acumuladas = [], 0
+        if acumuladas:
+            yield _parte_tipada(pa.Table.from_batches(lotes).to_pandas(), tipos)
+        return
+
+    archivos = sorted(glob.glob(os.path.join(ruta, "**", "*.csv"), recursive=True)) if os.path.isdir(ruta) else [ruta]
+    for archivo in archivos:
+        for parte in pd.read_csv(archivo, usecols=columnas, dtype=tipos, chunksize=filas,
+                                 float_precision="round_trip"):
+            yield _tipar_fechas(parte)
+
+def _parte_tipada(df, tipos):
+    tipos = {c: t for c, t in (tipos or {}).items() if c in df.columns}
+    return _tipar_fechas(df.astype(tipos) if tipos else df)
+
+def guardar_por_partes(partes, ruta, particion=None):
+    """
+    Guarda un dataset a partir de un iterable de DataFrames, reemplazando el anterior.
+
+    Se escribe parte por parte en un dataset temporal y se reemplaza al final, así una falla
+    a mitad de camino no deja el dataset a medias. No se guarda copia en memoria compartida.
+    Devuelve la cantidad de filas escritas.
+    """
+    base, extension = os.path.splitext(ruta.rstrip("/"))
+    temporal = f"{base}.tmp{extension}"
+    _borrar(temporal)
+    filas = 0
+    escritor = None
+    try:
+        for parte in partes:
+            if parte.empty:
+                continue
+            if _es_parquet(temporal) and particion is None:
+                # Parquet de un solo archivo: un row group por parte, todas con el esquema de la primera
+                tabla = _tabla_arrow(compactar(parte))
+                escritor = escritor or pq.ParquetWriter(temporal, tabla.schema)
+                escritor.write_table(tabla if tabla.schema.equals(escritor.schema) else tabla.cast(escritor.schema))
+                registrar_escritura(len(parte))
+            elif filas == 0:
+                guardar_tabla(parte, temporal, particion, en_memoria=False)
+            else:
+                anexar_tabla(parte, temporal, particion)
+            filas += len(parte)
+    finally:
+        if escritor is not None:
+            escritor.close()
+
+    _olvidar(ruta)
+    _borrar(ruta)
+    if os.path.exists(temporal):
+        os.replace(temporal, ruta.rstrip("/"))
+        if escritor is not None:
+            _registrar_escritura(0, ruta)
+    return filas
+
+# ================
+# Historial append-only (particiones mensuales + manifiesto)
+# ================
+def leer_manifiesto(ruta):
+    """Manifiesto del historial: watermark (última fecha) y archivos escritos por partición."""
+    ruta_manifiesto = os.path.join(ruta, MANIFIESTO)
+    if not os.path.exists(ruta_manifiesto):
+        return None
+    with open(ruta_manifiesto, encoding="utf-8") as f:
+        return json.load(f)
+
+def _guardar_manifiesto(ruta, manifiesto):
+    ruta_manifiesto = os.path.join(ruta, MANIFIESTO)
+    temporal = ruta_manifiesto + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, indent=2)
+    os.replace(temporal, ruta_manifiesto)
+
+def actualizar_manifiesto(ruta, **campos):
+    """Guarda datos adicionales en el manifiesto del historial (p. ej. días sin datos en la fuente)."""
+    manifiesto = leer_manifiesto(ruta) or {"watermark": None, "filas": 0, "archivos": {}}
+    manifiesto.update(campos)
+    _guardar_manifiesto(ruta, manifiesto)
+
+def anexar_historial(df, ruta):
+    """
+    Agrega filas al historial escribiendo un archivo nuevo por cada mes afectado.
+
+    No lee ni reescribe los archivos existentes: solo actualiza el manifiesto (watermark y
+    filas por archivo). El que llama es responsable de no enviar filas ya guardadas.
+    """
+    if df.empty:
+        return
+    _olvidar(ruta)
+    manifiesto = leer_manifiesto(ruta) or {"watermark": None, "filas": 0, "archivos": {}}
+    formato = "parquet" if _es_parquet(ruta) else "csv"
+    sello = datetime.now().strftime("%Y%m%d%H%M%S%f")
+
+    df = _tipar_fechas(df.copy())
+    # Mismo esquema en todos los archivos: los enteros (p. ej. Volume sin NaN) se guardan como float
+    enteros = df.select_dtypes(include="integer").columns
+    df[enteros] = df[enteros].astype("float64")
+    meses = _PARTICIONES_DERIVADAS[PARTICION_MES](df["Date"])
+    for mes, parte in df.groupby(meses, sort=True):
+        relativa = os.path.join(f"{PARTICION_MES}={mes}", f"parte-{sello}.{formato}")
+        destino = os.path.join(ruta, relativa)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        if formato == "parquet":
+            parte.to_parquet(destino, index=False)
+        else:
+            parte.to_csv(destino, index=False)
+        _registrar_escritura(len(parte), destino)
+        manifiesto["archivos"][relativa] = {
+            "filas": len(parte),
+            "desde": parte["Date"].min().strftime("%Y-%m-%d"),
+            "hasta": parte["Date"].max().strftime("%Y-%m-%d"),
+        }
+
+    ultima = df["Date"].max().strftime("%Y-%m-%d")
+    manifiesto["watermark"] = max(filter(None, [manifiesto["watermark"], ultima]))
+    manifiesto["filas"] += len(df)
+    _guardar_manifiesto(ruta, manifiesto)
+
+def guardar_historial(df, ruta):
+    """Reescribe el historial completo (descarga inicial) como particiones mensuales."""
+    _borrar(ruta)
+    os.makedirs(ruta, exist_ok=True)
+    anexar_historial(df, ruta)
+
+def migrar_historial(ruta):
+    """
+    Convierte un historial guardado como archivo único (CSV/Parquet anterior) al formato
+    append-only. Se hace una sola vez; después el manifiesto ya existe y no hace nada.
+    """
+    if leer_manifiesto(ruta) is not None:
+        return
+    ruta_anterior = _ruta_existente(ruta)
+    if not os.path.isfile(ruta_anterior):
+        return
+    guardar_historial(leer_tabla(ruta_anterior), ruta)
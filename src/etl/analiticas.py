@@ -0,0 +1,144 @@
+from load import get_connection
+
+# ================
+# Tablas analíticas (consultas_SQL/Tablas_analiticas.sql)
+# ================
+# Las cargas por fecha dejan en etl_fechas_pendientes (por tabla) las fechas de las filas que
+# insertaron o actualizaron. El refresco toma esas fechas en una transacción y recalcula solo lo afectado:
+# los agregados de esas fechas y los meses/años que las contienen (más el siguiente, cuyo
+# rendimiento parte del último cierre del anterior). La última foto por ticker son ~500 filas
+# que se leen por índice y solo se escriben si cambiaron.
+
+_TOMAR_PENDIENTES = """
+CREATE TEMP TABLE fechas_refresco (date DATE PRIMARY KEY) ON COMMIT DROP;
+WITH tomadas AS (DELETE FROM etl_fechas_pendientes RETURNING date)
+INSERT INTO fechas_refresco SELECT DISTINCT date FROM tomadas;
+"""
+
+_AGREGADOS_SECTOR = """
+DELETE FROM agregados_sector WHERE date IN (SELECT date FROM fechas_refresco);
+
+INSERT INTO agregados_sector (date, sector, industry, tickers, var_daily_prom, var_monthly_prom,
+                              var_annual_prom, rsi_prom, pct_sobrecompra, pct_sobreventa, volumen_total)
+SELECT date, sector, COALESCE(industry, 'TOTAL'),
+       COUNT(*),
+       AVG(var_daily), AVG(var_monthly), AVG(var_annual), AVG(rsi_14),
+       100.0 * COUNT(*) FILTER (WHERE rsi_14 > 70) / COUNT(*),
+       100.0 * COUNT(*) FILTER (WHERE rsi_14 < 30) / COUNT(*),
+       SUM(volume)
+FROM (
+    SELECT ph.date, COALESCE(e.sector, 'Sin sector') AS sector,
+           COALESCE(e.industry, 'Sin industria') AS industry,
+           ph.volume, pv.var_daily, pv.var_monthly, pv.var_annual, it.rsi_14
+    FROM precios_historicos ph
+    JOIN fechas_refresco f ON f.date = ph.date
+    JOIN empresas e ON e.ticker = ph.ticker
+    LEFT JOIN precios_variaciones pv ON pv.ticker = ph.ticker AND pv.date = ph.date
+    LEFT JOIN indicadores_tecnicos it ON it.ticker = ph.ticker AND it.date = ph.date
+) base
+GROUP BY GROUPING SETS ((date, sector), (date, sector, industry));
+"""
+
+# {tabla}: rendimientos_mensuales / rendimientos_anuales; {unidad}: month / year
+_RENDIMIENTOS = """
+CREATE TEMP TABLE periodos_refresco ON COMMIT DROP AS
+SELECT DISTINCT p.periodo
+FROM fechas_refresco f,
+     LATERAL (VALUES (date_trunc('{unidad}', f.date)::date),
+                     ((date_trunc('{unidad}', f.date) + INTERVAL '1 {unidad}')::date)) AS p(periodo);
+
+DELETE FROM {tabla} WHERE periodo IN (SELECT periodo FROM periodos_refresco);
+
+WITH agregados AS (
+    SELECT ph.ticker, pr.periodo,
+           (ARRAY_AGG(ph.close ORDER BY ph.date))[1] AS close_inicio,
+           (ARRAY_AGG(ph.close ORDER BY ph.date DESC))[1] AS close_cierre,
+           MIN(ph.close) AS close_min, MAX(ph.close) AS close_max, AVG(ph.close) AS close_prom,
+           SUM(ph.volume) AS volumen_total
+    FROM periodos_refresco pr
+    JOIN precios_historicos ph
+      ON ph.date >= pr.periodo AND ph.date < (pr.periodo + INTERVAL '1 {unidad}')::date
+    GROUP BY ph.ticker, pr.periodo
+)
+INSERT INTO {tabla} (ticker, periodo, close_inicio, close_cierre, close_min, close_max,
+                     close_prom, volumen_total, rendimiento)
+SELECT a.ticker, a.periodo, a.close_inicio, a.close_cierre, a.close_min, a.close_max,
+       a.close_prom, a.volumen_total,
+       a.close_cierre / NULLIF(COALESCE(anterior.close, a.close_inicio), 0) - 1
+FROM agregados a
+LEFT JOIN LATERAL (
+    SELECT close FROM precios_historicos ph
+    WHERE ph.ticker = a.ticker AND ph.date < a.periodo
+    ORDER BY ph.date DESC LIMIT 1
+) anterior ON TRUE;
+
+DROP TABLE periodos_refresco;
+"""
+
+_COLUMNAS_ULTIMO = [
+    "name", "sector", "industry", "date", "close", "volume", "sma_20", "ema_20", "rsi_14", "macd",
+    "macd_signal", "volatility_20", "bb_upper", "bb_lower", "estado_macd", "estado_bollinger",
+    "var_daily", "var_weekly", "var_monthly", "var_annual", "var_5y", "per", "roe", "market_cap",
+    "pct_tecnico_buy", "pct_fundamental_buy", "decision_final",
+]
+
+_ULTIMO_POR_TICKER = """
+INSERT INTO ultimo_por_ticker AS u (ticker, {columnas})
+SELECT e.ticker, e.name, e.sector, e.industry, ph.date, ph.close, ph.volume,
+       it.sma_20, it.ema_20, it.rsi_14, it.macd, it.macd_signal, it.volatility_20, it.bb_upper, it.bb_lower,
+       CASE WHEN it.macd > it.macd_signal THEN 'COMPRA'
+            WHEN it.macd < it.macd_signal THEN 'VENTA'
+            WHEN it.macd = it.macd_signal THEN 'NEUTRO' END,
+       CASE WHEN ph.close > it.bb_upper THEN 'Sobrecompra'
+            WHEN ph.close < it.bb_lower THEN 'Sobreventa'
+            WHEN ph.close BETWEEN it.bb_lower AND it.bb_upper THEN 'Normal' END,
+       pv.var_daily, pv.var_weekly, pv.var_monthly, pv.var_annual, pv.var_5y,
+       f.per, f.roe, f.market_cap,
+       r.pct_tecnico_buy, r.pct_fundamental_buy, r.decision_final
+FROM empresas e
+JOIN LATERAL (
+    SELECT date, close, volume FROM precios_historicos p
+    WHERE p.ticker = e.ticker ORDER BY p.date DESC LIMIT 1
+) ph ON TRUE
+LEFT JOIN indicadores_tecnicos it ON it.ticker = e.ticker AND it.date = ph.date
+LEFT JOIN precios_variaciones pv ON pv.ticker = e.ticker AND pv.date = ph.date
+LEFT JOIN indicadores_fundamentales f ON f.ticker = e.ticker
+LEFT JOIN resumen_inversion r ON r.ticker = e.ticker
+ON CONFLICT (ticker) DO UPDATE SET {asignaciones}
+WHERE ROW({actuales}) IS DISTINCT FROM ROW({nuevos});
+""".format(
+    columnas=", ".join(_COLUMNAS_ULTIMO),
+    asignaciones=", ".join(f"{c} = EXCLUDED.{c}" for c in _COLUMNAS_ULTIMO),
+    actuales=", ".join(f"u.{c}" for c in _COLUMNAS_ULTIMO),
+    nuevos=", ".join(f"EXCLUDED.{c}" for c in _COLUMNAS_ULTIMO),
+)
+
+def actualizar_tablas_analiticas():
+    """
+    Refresca las tablas analíticas para las fechas cargadas desde el último refresco.
+
+    Todo ocurre en una transacción: si falla, las fechas vuelven a quedar pendientes.
+    """
+    print("\n📊 Actualizando tablas analíticas...")
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(_TOMAR_PENDIENTES)
+            cursor.execute("SELECT COUNT(*) FROM fechas_refresco;")
+            fechas = cursor.fetchone()[0]
+            if fechas:
+                cursor.execute(_AGREGADOS_SECTOR)
+                cursor.execute(_RENDIMIENTOS.format(tabla="rendimientos_mensuales", unidad="month"))
+                cursor.execute(_RENDIMIENTOS.format(tabla="rendimientos_anuales", unidad="year"))
+            cursor.execute(_ULTIMO_POR_TICKER)
+            actualizados = cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    print(f"✅ Tablas analíticas: {fechas} fechas recalculadas, {actualizados} tickers con foto nueva.")
+
+if __name__ == "__main__":
+    actualizar_tablas_analiticas()
@@ -0,0 +1,245 @@
+import os
+import copy
+import numpy as np
+import pandas as pd
+from almacenamiento import leer_tabla, guardar_tabla, ruta_dataset
+from reglas import cargar_reglas, evaluar_reglas, resumir_senales
+from transform import COLUMNAS_TECNICOS_RESUMEN
+from matriz_precios import MatrizPrecios, DIR_MATRICES, META
+
+DIR_READY = "../../data/clean_data/"
+DIAS_ANIO = 252
+
+# Variantes de umbrales: {nombre: {senal: campos de la regla a reemplazar}}
+VARIANTES_POR_DEFECTO = {
+    "rsi_25_75": {"RSI": {"condiciones": [["<", 25, "COMPRAR"], [">", 75, "VENDER"]]}},
+    "rsi_35_65": {"RSI": {"condiciones": [["<", 35, "COMPRAR"], [">", 65, "VENDER"]]}},
+    "per_15_25": {"PER": {"condiciones": [["<", 15, "COMPRAR"], [">", 25, "VENDER"]]}},
+}
+
+# ================
+# Matrices fechas x tickers
+# ================
+def indices_matriz(df):
+    """Fechas y tickers ordenados, y la posición (fila, columna) de cada registro de `df`."""
+    codigos_fecha, fechas = pd.factorize(df["Date"], sort=True)
+    codigos_ticker, tickers = pd.factorize(df["Ticker"], sort=True)
+    return pd.DatetimeIndex(fechas), pd.Index(tickers), codigos_fecha, codigos_ticker
+
+def a_matriz(valores, filas, columnas, forma, relleno=np.nan, dtype="float64"):
+    """Vuelca una columna tidy en una matriz fechas x tickers sin pivot_table."""
+    matriz = np.full(forma, relleno, dtype=dtype)
+    matriz[filas, columnas] = valores
+    return matriz
+
+def ubicar(df, fechas, tickers):
+    """(fila, columna) de cada registro de `df` en la matriz; -1 si la fecha o el ticker no están."""
+    fila = fechas.get_indexer(df["Date"])
+    codigos, unicos = pd.factorize(df["Ticker"])
+    columna = np.where(codigos >= 0, tickers.get_indexer(unicos)[codigos], -1)
+    return fila, columna
+
+def _codigos_decision(decisiones, corto):
+    """COMPRAR -> 1, VENDER -> 0 (o -1 si se permite corto), MANTENER/sin dato -> NaN (se mantiene)."""
+    codigos, unicos = pd.factorize(decisiones)
+    mapa = {"COMPRAR": 1.0, "VENDER": -1.0 if corto else 0.0}
+    valores = np.array([mapa.get(u, np.nan) for u in unicos] + [np.nan])
+    return valores[codigos]
+
+def _ultimo_valido(matriz):
+    """Cada celda con el último valor no NaN de su columna hasta esa fila (NaN si todavía no hubo)."""
+    filas = np.arange(matriz.shape[0])[:, None]
+    ultima = np.where(~np.isnan(matriz), filas, -1)
+    np.maximum.accumulate(ultima, axis=0, out=ultima)
+    columnas = np.broadcast_to(np.arange(matriz.shape[1]), matriz.shape)
+    return np.where(ultima >= 0, matriz[np.maximum(ultima, 0), columnas], np.nan)
+
+def posiciones(decisiones):
+    """
+    Posición vigente en cada fecha: la última decisión COMPRAR/VENDER de cada ticker.
+
+    Args:
+        decisiones (np.ndarray): Matriz fechas x tickers con 1/0/-1 y NaN donde se mantiene.
+    """
+    return np.nan_to_num(_ultimo_valido(decisiones), nan=0.0)
+
+# ================
+# Métricas
+# ================
+def _drawdown(equity):
+    """Caída desde el máximo previo (por columna si es matriz)."""
+    return equity / np.maximum.accumulate(equity, axis=0) - 1
+
+def _metricas(retornos, invertido, turnover):
+    """Métricas de una serie de retornos diarios de cartera."""
+    equity = np.cumprod(1 + retornos)
+    anios = len(retornos) / DIAS_ANIO
+    volatilidad = retornos.std() * np.sqrt(DIAS_ANIO)
+    dias_invertido = invertido.sum()
+    return {
+        "retorno_total": equity[-1] - 1 if len(equity) else np.nan,
+        "retorno_anual": equity[-1] ** (1 / anios) - 1 if anios > 0 else np.nan,
+        "volatilidad_anual": volatilidad,
+        "sharpe": retornos.mean() * DIAS_ANIO / volatilidad if volatilidad > 0 else np.nan,
+        "max_drawdown": _drawdown(equity).min() if len(equity) else np.nan,
+        "turnover_medio": turnover.mean(),
+        "hit_rate": (retornos[invertido] > 0).sum() / dias_invertido if dias_invertido else np.nan,
+        "dias_invertido": int(dias_invertido),
+    }
+
+def _cartera(tenencia, retornos, costo):
+    """Cartera equiponderada entre los tickers con posición. Devuelve (retorno, turnover, invertido)."""
+    exposicion = np.abs(tenencia).sum(axis=1, keepdims=True)
+    pesos = np.divide(tenencia, exposicion, out=np.zeros_like(tenencia), where=exposicion > 0)
+    turnover = 0.5 * np.abs(np.diff(pesos, axis=0, prepend=0)).sum(axis=1)
+    retorno = (pesos * retornos).sum(axis=1) - costo * turnover
+    return retorno, turnover, exposicion[:, 0] > 0
+
+def backtest(decisiones, close, sectores=None, corto=False, costo=0.0):
+    """
+    Backtest vectorizado de una matriz de decisiones sobre la matriz de cierres.
+
+    La decisión de la fecha t se ejecuta al cierre de t y gana el retorno de t+1 (sin
+    look-ahead). Cartera equiponderada entre los tickers con posición.
+
+    Args:
+        decisiones (np.ndarray): Fechas x tickers con "COMPRAR"/"VENDER"/"MANTENER" o códigos 1/0/-1/NaN.
+        close (np.ndarray): Cierres fechas x tickers (NaN donde no hay precio).
+        sectores (np.ndarray): Sector de cada ticker (columna) para agregar por sector.
+        corto (bool): VENDER abre posición corta en lugar de salir.
+        costo (float): Costo por unidad de turnover (p. ej. 0.001 = 10 pb).
+
+    Returns:
+        dict: "cartera" (serie diaria), "resumen", "por_ticker" y "por_sector" (arrays/dicts).
+    """
+    if decisiones.dtype == object:
+        decisiones = _codigos_decision(decisiones.ravel(), corto).reshape(decisiones.shape)
+
+    # Retorno contra el último cierre válido: una posición abierta gana también el movimiento
+    # a través de un día sin precio (ese día rinde 0 y el siguiente acumula los dos)
+    anterior = _ultimo_valido(close)
+    retornos = np.zeros_like(close)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        retornos[1:] = close[1:] / anterior[:-1] - 1
+    con_dato = np.isfinite(retornos)
+    retornos = np.where(con_dato, retornos, 0.0)
+
+    tenencia = np.zeros_like(close)
+    tenencia[1:] = posiciones(decisiones)[:-1]
+
+    retorno, turnover, invertido = _cartera(tenencia, retornos, costo)
+    equity = np.cumprod(1 + retorno)
+
+    # Por ticker: estrategia aislada de cada ticker
+    retorno_ticker = tenencia * retornos
+    con_posicion = (tenencia != 0) & con_dato
+    dias = con_posicion.sum(axis=0)
+    por_ticker = {
+        "retorno_total": np.prod(1 + retorno_ticker, axis=0) - 1,
+        "max_drawdown": _drawdown(np.cumprod(1 + retorno_ticker, axis=0)).min(axis=0),
+        "hit_rate": np.divide((retorno_ticker > 0).sum(axis=0), dias, out=np.full(dias.shape, np.nan), where=dias > 0),
+        "dias_invertido": dias,
+        "operaciones": (np.abs(np.diff(tenencia, axis=0)) > 0).sum(axis=0),
+    }
+
+    por_sector = {}
+    if sectores is not None:
+        for sector in pd.unique(sectores):
+            columnas = sectores == sector
+            r, t, inv = _cartera(tenencia[:, columnas], retornos[:, columnas], costo)
+            por_sector[sector] = _metricas(r, inv, t)
+
+    return {
+        "cartera": {"retorno": retorno, "equity": equity, "drawdown": _drawdown(equity), "turnover": turnover},
+        "resumen": _metricas(retorno, invertido, turnover),
+        "por_ticker": por_ticker,
+        "por_sector": por_sector,
+    }
+
+# ================
+# Variantes de umbrales
+# ================
+def variar_reglas(reglas, cambios):
+    """Copia de `reglas` con los campos de `cambios` ({senal: {campo: valor}}) reemplazados."""
+    reglas = copy.deepcopy(reglas)
+    por_senal = {regla["senal"]: regla for regla in reglas}
+    for senal, campos in cambios.items():
+        if senal not in por_senal:
+            raise KeyError(f"No existe la señal '{senal}' en las reglas")
+        por_senal[senal].update(campos)
+    return reglas
+
+def decisiones_por_variante(df_base, reglas, variantes):
+    """{nombre: array de Decision_Final por fila de df_base} re-puntuando con cada variante."""
+    return {
+        nombre: resumir_senales(evaluar_reglas(df_base, reglas_variante), reglas_variante)["Decision_Final"].array
+        for nombre, reglas_variante in ((n, variar_reglas(reglas, c)) for n, c in variantes.items())
+    }
+
+def ejecutar_backtest(
+    precios_file=ruta_dataset(DIR_READY, "precios_historicos_ready"),
+    empresas_file=ruta_dataset(DIR_READY, "empresas_ready"),
+    tecnicos_file=ruta_dataset(DIR_READY, "indicadores_tecnicos_ready"),
+    fundamentales_file=ruta_dataset(DIR_READY, "indicadores_fundamentales_ready"),
+    output_dir=DIR_READY + "backtest/",
+    variantes=VARIANTES_POR_DEFECTO,
+    reglas_file=None,
+    corto=False,
+    costo=0.0,
+    matrices_dir=DIR_MATRICES
+):
+    """
+    Backtest de Decision_Final con las reglas vigentes (variante "base") y con cada variante de
+    umbrales. Todas se puntúan sobre los mismos indicadores técnicos + fundamentales actuales,
+    así las diferencias entre variantes son solo de umbrales (el resumen histórico guardado
+    mezcla los fundamentales vigentes en cada día).
+
+    Guarda en `output_dir`: resumen (una fila por variante), cartera (serie diaria),
+    por_ticker y por_sector. Los cierres salen de las matrices mapeadas de matriz_precios.py
+    si existen; si no, se arman desde `precios_file`.
+    """
+    print("📐 Ejecutando backtest de señales...")
+    if os.path.exists(os.path.join(matrices_dir, META)):
+        matriz = MatrizPrecios(matrices_dir)
+        fechas, tickers, close = matriz.fechas, matriz.tickers, matriz.matriz("Close")
+    else:
+        df_precios = leer_tabla(precios_file, columnas=["Date", "Ticker", "Close"])
+        fechas, tickers, filas, columnas = indices_matriz(df_precios)
+        close = a_matriz(df_precios["Close"].to_numpy(), filas, columnas, (len(fechas), len(tickers)))
+    forma = close.shape
+
+    df_empresas = leer_tabla(empresas_file, columnas=["Ticker", "Sector"])
+    sectores = df_empresas.set_index("Ticker")["Sector"].reindex(tickers).fillna("Sin sector").to_numpy()
+
+    # Cada señal se ubica una sola vez en la matriz de precios (las fechas/tickers sin precio se descartan)
+    df_base = pd.merge(leer_tabla(tecnicos_file, columnas=COLUMNAS_TECNICOS_RESUMEN),
+                       leer_tabla(fundamentales_file), on="Ticker", how="inner")
+    ubicacion = ubicar(df_base, fechas, tickers)
+    todas = {"base": {}, **(variantes or {})}
+    decisiones = {nombre: (ubicacion, valores)
+                  for nombre, valores in decisiones_por_variante(df_base, cargar_reglas(reglas_file), todas).items()}
+
+    resumenes, carteras, por_ticker, por_sector = [], [], [], []
+    for nombre, ((fila, columna), valores) in decisiones.items():
+        validas = (fila >= 0) & (columna >= 0)
+        codigos = _codigos_decision(valores[validas], corto)
+        matriz = a_matriz(codigos, fila[validas], columna[validas], forma)
+
+        resultado = backtest(matriz, close, sectores=sectores, corto=corto, costo=costo)
+        resumenes.append({"Variante": nombre, **resultado["resumen"]})
+        carteras.append(pd.DataFrame({"Date": fechas, "Variante": nombre, **resultado["cartera"]}))
+        por_ticker.append(pd.DataFrame({"Ticker": tickers, "Sector": sectores, "Variante": nombre, **resultado["por_ticker"]}))
+        por_sector.append(pd.DataFrame([{"Sector": s, "Variante": nombre, **m} for s, m in resultado["por_sector"].items()]))
+
+    df_resumen_bt = pd.DataFrame(resumenes)
+    guardar_tabla(df_resumen_bt, ruta_dataset(output_dir, "resumen"))
+    guardar_tabla(pd.concat(carteras, ignore_index=True), ruta_dataset(output_dir, "cartera"))
+    guardar_tabla(pd.concat(por_ticker, ignore_index=True), ruta_dataset(output_dir, "por_ticker"))
+    guardar_tabla(pd.concat(por_sector, ignore_index=True), ruta_dataset(output_dir, "por_sector"))
+
+    print(df_resumen_bt.to_string(index=False))
+    print(f"✅ Backtest guardado en: {output_dir}")
+    return df_resumen_bt
+
+if __name__ == "__main__":
+    ejecutar_backtest()
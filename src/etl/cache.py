@@ -0,0 +1,122 @@
+import os
+import time
+import glob
+import pickle
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Caché local de respuestas de red (Yahoo Finance, Wikipedia) para que reejecutar el ETL
+# después de un fallo o mientras se depura no vuelva a descargar todo.
+DIR_CACHE = os.getenv("ETL_CACHE_DIR", "../../data/cache/")
+OFFLINE = os.getenv("ETL_OFFLINE", "0") == "1"  # solo se sirve desde la caché
+MAX_BYTES = int(os.getenv("ETL_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+HORA = 3600
+TTL_POR_TIPO = {
+    "info": 24 * HORA,                # fundamentales / market cap
+    "historico_abierto": 1 * HORA,    # rangos que incluyen el día de hoy
+    "historico_cerrado": 7 * 24 * HORA,  # rangos pasados (yfinance reajusta por dividendos/splits)
+    "sp500": 7 * 24 * HORA,
+}
+
+class SinCacheError(LookupError):
+    """En modo offline se pidió algo que no está en la caché."""
+
+_lock = threading.Lock()
+_bytes_en_uso = None
+
+def _ruta(tipo, clave):
+    texto = repr((tipo,) + tuple(clave))
+    return os.path.join(DIR_CACHE, tipo, hashlib.sha256(texto.encode("utf-8")).hexdigest() + ".pkl")
+
+def _tamanio_total():
+    return sum(os.path.getsize(a) for a in glob.glob(os.path.join(DIR_CACHE, "*", "*.pkl")))
+
+def _desalojar():
+    """Borra las entradas usadas hace más tiempo hasta quedar por debajo de MAX_BYTES."""
+    global _bytes_en_uso
+    archivos = []
+    for archivo in glob.glob(os.path.join(DIR_CACHE, "*", "*.pkl")):
+        try:
+            estado = os.stat(archivo)
+            archivos.append((estado.st_mtime, estado.st_size, archivo))
+        except FileNotFoundError:
+            pass
+    _bytes_en_uso = sum(tamanio for _, tamanio, _ in archivos)
+    for _, tamanio, archivo in sorted(archivos):
+        if _bytes_en_uso <= MAX_BYTES:
+            break
+        try:
+            os.remove(archivo)
+            _bytes_en_uso -= tamanio
+        except FileNotFoundError:
+            pass
+
+def _guardar(ruta, valor):
+    global _bytes_en_uso
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.{threading.get_ident()}.tmp"
+    with open(temporal, "wb") as f:
+        pickle.dump({"creado": time.time(), "valor": valor}, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    with _lock:
+        # Al reemplazar una entrada (p. ej. vencida) solo se suma la diferencia con la anterior
+        try:
+            anterior = os.path.getsize(ruta)
+        except FileNotFoundError:
+            anterior = 0
+        os.replace(temporal, ruta)
+        if _bytes_en_uso is None:
+            _bytes_en_uso = _tamanio_total()
+        else:
+            _bytes_en_uso += os.path.getsize(ruta) - anterior
+        if _bytes_en_uso > MAX_BYTES:
+            _desalojar()
+
+def _tiene_datos(valor):
+    if valor is None:
+        return False
+    if hasattr(valor, "empty"):
+        return not valor.empty
+    try:
+        return len(valor) > 0
+    except TypeError:
+        return True
+
+def obtener(tipo, clave, calcular, ttl=None, guardar_si=_tiene_datos):
+    """
+    Devuelve el valor cacheado para (tipo, clave) o lo calcula con `calcular()` y lo guarda.
+
+    Args:
+        tipo (str): Tipo de dato; define el TTL por defecto (TTL_POR_TIPO) y la subcarpeta.
+        clave (tuple): Partes de la clave (ticker/s, fecha inicio, fecha fin...).
+        calcular (callable): Consulta real, solo se llama si no hay entrada vigente.
+        ttl (float): Segundos de validez; por defecto el del tipo.
+        guardar_si (callable): Solo se cachean los valores para los que devuelve True
+            (por defecto se descartan respuestas vacías).
+
+    En modo offline (ETL_OFFLINE=1) se devuelven entradas vencidas y, si no hay entrada,
+    se lanza SinCacheError en lugar de ir a la red.
+    """
+    ruta = _ruta(tipo, clave)
+    ttl = TTL_POR_TIPO.get(tipo, 24 * HORA) if ttl is None else ttl
+
+    try:
+        with open(ruta, "rb") as f:
+            entrada = pickle.load(f)
+        if OFFLINE or time.time() - entrada["creado"] <= ttl:
+            os.utime(ruta)  # la fecha de modificación marca el último uso (para desalojar)
+            return entrada["valor"]
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        pass
+
+    if OFFLINE:
+        raise SinCacheError(f"{tipo} {clave} no está en la caché (modo offline)")
+
+    valor = calcular()
+    if guardar_si(valor):
+        _guardar(ruta, valor)
+    return valor
@@ -0,0 +1,99 @@
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from tqdm import tqdm
+
+class LimitadorTasa:
+    """Token bucket: como máximo `tasa` llamadas por segundo, con ráfagas de hasta `capacidad`."""
+
+    def __init__(self, tasa, capacidad=None):
+        self.tasa = tasa
+        self.capacidad = capacidad or tasa
+        self._tokens = self.capacidad
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def adquirir(self):
+        """Bloquea hasta que haya un token disponible."""
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.tasa)
+                self._ultimo = ahora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.tasa
+            time.sleep(espera)
+
+def _ejecutar_ronda(funcion, items, max_workers, limitador, timeout, descripcion):
+    """Una ronda en el pool de hilos. Devuelve (resultados, errores) por item."""
+    resultados, errores, inicios = {}, {}, {}
+
+    def tarea(item):
+        if limitador is not None:
+            limitador.adquirir()
+        inicios[item] = time.monotonic()
+        return funcion(item)
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    futuros = {pool.submit(tarea, item): item for item in items}
+    pendientes = set(futuros)
+
+    with tqdm(total=len(futuros), desc=descripcion) as barra:
+        while pendientes:
+            hechos, pendientes = wait(pendientes, timeout=1 if timeout else None, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                item = futuros[futuro]
+                try:
+                    resultados[item] = futuro.result()
+                except Exception as e:
+                    errores[item] = e
+                barra.update()
+
+            if timeout:
+                ahora = time.monotonic()
+                vencidos = {f for f in pendientes if futuros[f] in inicios and ahora - inicios[futuros[f]] > timeout}
+                for futuro in vencidos:
+                    errores[futuros[futuro]] = TimeoutError(f"sin respuesta después de {timeout}s")
+                    barra.update()
+                pendientes -= vencidos
+
+    # Las llamadas vencidas no se pueden interrumpir: se abandonan sin esperar a que terminen. El
+    # proceso igual las espera al salir, así que `funcion` tiene que tener su propio timeout de red
+    # (ver fuentes.TIMEOUT_HTTP) para que terminen solas
+    pool.shutdown(wait=False, cancel_futures=True)
+    return resultados, errores
+
+def ejecutar_concurrente(funcion, items, max_workers=8, limitador=None, reintentos=3,
+                         timeout=None, espera_base=1.0, descripcion=None, no_reintentables=()):
+    """
+    Ejecuta `funcion(item)` para cada item en un pool de hilos acotado.
+
+    Cada llamada pasa antes por el `limitador` (si hay). Los items que fallan (excepción o más
+    de `timeout` segundos) se reintentan solos, hasta `reintentos` rondas más, esperando
+    `espera_base * 2**intento` segundos con jitter entre rondas. Los errores de los tipos
+    `no_reintentables` se devuelven sin reintentar. El `timeout` solo deja de esperar la llamada
+    (el hilo sigue hasta que termina): lo que corte una llamada colgada tiene que estar en `funcion`.
+
+    Returns:
+        tuple: (resultados {item: valor}, errores {item: excepción} de los que nunca funcionaron).
+    """
+    resultados, errores, definitivos = {}, {}, {}
+    pendientes = list(dict.fromkeys(items))
+
+    for intento in range(reintentos + 1):
+        if not pendientes:
+            break
+        if intento > 0:
+            tqdm.write(f"🔁 Reintento {intento}/{reintentos} para {len(pendientes)} elementos...")
+            time.sleep(espera_base * 2 ** (intento - 1) * random.uniform(0.5, 1.5))
+
+        nuevos, errores = _ejecutar_ronda(funcion, pendientes, max_workers, limitador, timeout, descripcion)
+        resultados.update(nuevos)
+        definitivos.update({item: e for item, e in errores.items() if isinstance(e, no_reintentables)})
+        pendientes = [item for item in errores if item not in definitivos]
+
+    errores.update(definitivos)
+    return resultados, errores
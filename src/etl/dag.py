@@ -0,0 +1,110 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from almacenamiento import memoria_compartida
+from metricas import medir_etapa, guardar_metricas, resumen, METRICAS
+
+class Etapa:
+    """
+    Un paso del ETL con sus entradas y salidas declaradas.
+
+    Las entradas/salidas son nombres libres: rutas de datasets o recursos como "db:empresas"
+    (tabla cargada) para ordenar cargas que dependen de claves foráneas.
+    """
+
+    def __init__(self, nombre, funcion, entradas=(), salidas=()):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.entradas = list(entradas)
+        self.salidas = list(salidas)
+
+    def __repr__(self):
+        return f"Etapa({self.nombre!r})"
+
+def dependencias(etapas):
+    """{nombre: nombres de las etapas que producen alguna de sus entradas}."""
+    productores = {}
+    for etapa in etapas:
+        for salida in etapa.salidas:
+            if salida in productores:
+                raise ValueError(f"'{salida}' lo producen {productores[salida]} y {etapa.nombre}")
+            productores[salida] = etapa.nombre
+    return {
+        etapa.nombre: {productores[e] for e in etapa.entradas if e in productores} - {etapa.nombre}
+        for etapa in etapas
+    }
+
+def orden_topologico(etapas):
+    """Niveles del DAG: cada nivel solo depende de los anteriores. Falla si hay ciclos."""
+    pendientes = dependencias(etapas)
+    niveles = []
+    while pendientes:
+        listas = sorted(n for n, deps in pendientes.items() if not deps)
+        if not listas:
+            raise ValueError(f"Hay un ciclo entre las etapas: {sorted(pendientes)}")
+        niveles.append(listas)
+        pendientes = {n: deps - set(listas) for n, deps in pendientes.items() if n not in listas}
+    return niveles
+
+def ejecutar_dag(etapas, max_workers=4, solo=None):
+    """
+    Ejecuta las etapas respetando sus dependencias; las independientes corren en paralelo.
+
+    Los DataFrames que una etapa guarda quedan en memoria para las siguientes (ver
+    almacenamiento.memoria_compartida). Si una etapa falla no se lanzan las que dependen de
+    ella, se espera a las que ya estaban corriendo y se relanza el primer error. Cada etapa
+    se mide (tiempo, CPU, filas, bytes, memoria; ver metricas.py) y con ETL_METRICAS=1 las
+    mediciones se guardan al final, también si hubo un error.
+
+    Args:
+        etapas (list[Etapa]): Etapas del proceso.
+        max_workers (int): Etapas simultáneas como máximo.
+        solo (list[str]): Ejecutar solo estas etapas (sin sus dependencias, que se leen del disco).
+
+    Returns:
+        dict: Segundos que tardó cada etapa ejecutada.
+    """
+    if solo:
+        desconocidas = set(solo) - {e.nombre for e in etapas}
+        if desconocidas:
+            raise ValueError(f"Etapas desconocidas: {sorted(desconocidas)}")
+        etapas = [e for e in etapas if e.nombre in solo]
+
+    orden_topologico(etapas)  # valida ciclos antes de empezar
+    por_nombre = {e.nombre: e for e in etapas}
+    faltan = dependencias(etapas)
+    tiempos, error, mediciones = {}, None, []
+
+    def correr(etapa):
+        with medir_etapa(etapa.nombre, mediciones) as medicion:
+            etapa.funcion()
+        return medicion.segundos
+
+    with memoria_compartida(), ThreadPoolExecutor(max_workers=max_workers) as pool:
+        corriendo = {}
+        while faltan or corriendo:
+            if error is None:
+                for nombre in sorted(n for n, deps in faltan.items() if not deps):
+                    print(f"\n▶️ {nombre}")
+                    corriendo[pool.submit(correr, por_nombre[nombre])] = nombre
+                    del faltan[nombre]
+            if not corriendo:
+                break
+
+            hechos, _ = wait(corriendo, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                nombre = corriendo.pop(futuro)
+                try:
+                    tiempos[nombre] = futuro.result()
+                    print(f"✔️ {nombre} ({tiempos[nombre]:.1f}s)")
+                except Exception as e:
+                    print(f"❌ {nombre}: {e}")
+                    error = error or e
+                    continue
+                for deps in faltan.values():
+                    deps.discard(nombre)
+
+    if METRICAS and mediciones:
+        resumen(mediciones)
+        guardar_metricas(mediciones)
+    if error is not None:
+        raise error
+    return tiempos
@@ -0,0 +1,107 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ================
+# Esquema de tipos de los datasets
+# ================
+# Todos los datasets que pasan por almacenamiento.py (lectura y escritura) se compactan con
+# `compactar`:
+# - Texto repetido (Ticker, sector, señales, estados de Fibonacci/Bollinger, decisiones):
+#   category, un código entero por fila en lugar de un string por fila.
+# - float32 solo en columnas redondeadas al calcularse (variaciones a 4 decimales, % de
+#   compra). Precios, medias, RSI, MACD y demás quedan en float64: float32 tiene ~7 dígitos
+#   significativos, no conserva los 3 decimales de un precio de 5-6 cifras y puede mover un
+#   RSI sin redondear al otro lado de un umbral de reglas.py; además el modo incremental de
+#   indicadores necesita float64 para reproducir las EMAs bit a bit.
+# - Volume/OBV como Int64 (admite nulos) si todos los valores son enteros.
+# - Date como datetime64.
+
+# Tipos de lectura del historial en el modo por partes (tipos iguales en todas las partes)
+TIPOS_PRECIOS = {"Ticker": "str", "Open": "float64", "High": "float64", "Low": "float64",
+                 "Close": "float64", "Volume": "float64"}
+
+COLUMNAS_FECHA = ["Date"]
+COLUMNAS_FLOAT32 = ["var_daily", "var_weekly", "var_monthly", "var_annual", "var_5y",
+                    "%_Tecnico_Buy", "%_Fundamental_Buy"]
+COLUMNAS_ENTERAS = ["Volume", "OBV"]
+
+# Texto con a lo sumo esta proporción de valores distintos pasa a category (Name, único por
+# ticker, se queda como texto)
+MAX_PROPORCION_CATEGORIAS = 0.5
+
+# Con ETL_REPORTE_MEMORIA=1 cada lectura/escritura de almacenamiento.py informa la memoria del dataset
+REPORTE_MEMORIA = os.getenv("ETL_REPORTE_MEMORIA", "0") == "1"
+
+def _es_texto(serie):
+    return pd.api.types.is_string_dtype(serie.dtype) and not isinstance(serie.dtype, pd.CategoricalDtype)
+
+def _categoria_ordenada(serie):
+    """Category con las categorías en orden alfabético (el orden de sort_values no depende de la lectura)."""
+    if not isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.astype("category")
+    categorias = serie.cat.categories
+    if categorias.is_monotonic_increasing:
+        return serie
+    return serie.cat.reorder_categories(categorias.sort_values())
+
+def _entero(serie):
+    if pd.api.types.is_integer_dtype(serie.dtype):
+        return serie.astype("Int64")
+    if not pd.api.types.is_float_dtype(serie.dtype):
+        return serie
+    valores = serie.to_numpy(dtype="float64", na_value=np.nan)
+    finitos = valores[~np.isnan(valores)]
+    if not np.array_equal(finitos, np.round(finitos)):
+        return serie
+    return serie.astype("Int64")
+
+def compactar(df):
+    """Devuelve `df` con los tipos del esquema (sin copiar las columnas que ya los tienen)."""
+    cambios = {}
+    for columna in df.columns:
+        serie = df[columna]
+        if columna in COLUMNAS_FECHA:
+            if not pd.api.types.is_datetime64_any_dtype(serie.dtype):
+                cambios[columna] = pd.to_datetime(serie)
+        elif columna in COLUMNAS_FLOAT32:
+            if pd.api.types.is_numeric_dtype(serie.dtype) and serie.dtype != "float32":
+                cambios[columna] = serie.astype("float32")
+        elif columna in COLUMNAS_ENTERAS:
+            if serie.dtype != "Int64":
+                cambios[columna] = _entero(serie)
+        elif isinstance(serie.dtype, pd.CategoricalDtype):
+            cambios[columna] = _categoria_ordenada(serie)
+        elif _es_texto(serie) and len(serie) and serie.nunique() <= MAX_PROPORCION_CATEGORIAS * len(serie):
+            cambios[columna] = serie.astype("category")
+    return df.assign(**cambios) if cambios else df
+
+def memoria(df):
+    """MB por columna (incluye el contenido de los strings)."""
+    return (df.memory_usage(deep=True, index=False) / 2**20).round(2)
+
+def reporte_memoria(df, nombre, detalle=False):
+    """Informa la memoria de `df` (y por columna con `detalle`). Devuelve el total en MB."""
+    por_columna = memoria(df)
+    total = float(por_columna.sum())
+    print(f"📏 {nombre}: {total:.1f} MB ({len(df)} filas)")
+    if detalle:
+        for columna, mb in por_columna.sort_values(ascending=False).items():
+            print(f"     {columna:<25} {str(df[columna].dtype):<16} {mb:>10.2f} MB")
+    return total
+
+if __name__ == "__main__":
+    # python esquema.py <dataset>...  -> memoria con los tipos inferidos vs con el esquema
+    from almacenamiento import leer_tabla
+    for ruta in sys.argv[1:]:
+        compacto = leer_tabla(ruta)
+        inferido = compacto.astype({c: "object" for c in compacto.columns
+                                    if isinstance(compacto[c].dtype, pd.CategoricalDtype)})
+        inferido = inferido.astype({c: "float64" for c in COLUMNAS_FLOAT32 + COLUMNAS_ENTERAS if c in inferido})
+        antes = reporte_memoria(inferido, f"{ruta} (tipos por defecto)")
+        despues = reporte_memoria(compacto, f"{ruta} (esquema)", detalle=True)
+        print(f"   -> {100 * (1 - despues / antes):.0f}% menos memoria")
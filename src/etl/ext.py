@@ -1,15 +1,84 @@
+import os
+import json
 import pandas as pd
-import yfinance as yf
+import cache
 from tqdm import tqdm
-from datetime import datetime
+from datetime import datetime, timedelta
+from fuentes import descargar_info, descargar_historico, limpiar_progreso
+from almacenamiento import leer_tabla, guardar_tabla, guardar_historial, ruta_dataset
 
-def extract_top_500_marketcap(output_file="../../data/raw_data/top_500_marketcap.csv"):
+DIR_RAW = "../../data/raw_data/"
+URL_SP500 = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
+SNAPSHOT_INFO = DIR_RAW + "info_snapshot.json"
+MAX_HORAS_SNAPSHOT = 24  # un snapshot más viejo no se reutiliza
+
+def extraer_snapshot_info(tickers, output_file=SNAPSHOT_INFO, fuente=None):
+    """
+    Descarga una sola vez el `info` de cada ticker y guarda el snapshot crudo en JSON.
+
+    El ranking por market cap y la tabla de fundamentales se derivan de este snapshot,
+    así una carga completa hace una consulta por ticker en lugar de dos.
+
+    Returns:
+        tuple: (info por ticker, error por ticker de los que fallaron).
+    """
+    print(f"📡 Descargando info de {len(tickers)} tickers...")
+    infos, errores = descargar_info(tickers, fuente)
+
+    snapshot = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "info": infos,
+        "errores": {ticker: str(error) for ticker, error in errores.items()},
+    }
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, default=str)
+    print(f"✅ Snapshot de info guardado en: {output_file}")
+
+    return infos, errores
+
+def leer_snapshot_info(snapshot_file=SNAPSHOT_INFO, max_horas=MAX_HORAS_SNAPSHOT):
+    """
+    Devuelve (info por ticker, error por ticker) de un snapshot guardado, o None si no existe
+    o tiene más de `max_horas` horas.
+    """
+    if not snapshot_file or not os.path.exists(snapshot_file):
+        return None
+    with open(snapshot_file, encoding="utf-8") as f:
+        snapshot = json.load(f)
+    if datetime.now() - datetime.fromisoformat(snapshot["fecha"]) > timedelta(hours=max_horas):
+        return None
+    return snapshot["info"], snapshot["errores"]
+
+def construir_ranking_marketcap(tickers, infos, errores, top=500):
+    """Ranking de los `top` tickers con mayor capitalización a partir del snapshot de info."""
+    results = []
+    for ticker in tickers:
+        info = infos.get(ticker)
+        if ticker in errores or not isinstance(info, dict):
+            tqdm.write(f"⚠️ Error con {ticker}: {errores.get(ticker, 'sin info')}")
+            continue
+        results.append({
+            "Ticker": ticker,
+            "Name": info.get("shortName", ""),
+            "Sector": info.get("sector", ""),
+            "Industry": info.get("industry", ""),
+            "MarketCap": info.get("marketCap", 0)
+        })
+
+    df = pd.DataFrame(results)
+    df.sort_values("MarketCap", ascending=False, inplace=True)
+    return df.head(top)
+
+def extract_top_500_marketcap(output_file=ruta_dataset(DIR_RAW, "top_500_marketcap"),
+                              snapshot_file=SNAPSHOT_INFO, fuente=None):
     """
     Extrae los 500 tickers del S&P 500 con mayor capitalización de mercado.
+    El info descargado queda en `snapshot_file` para reutilizarlo en los fundamentales.
     """
     print("🔍 Obteniendo lista del S&P 500 desde Wikipedia...")
     try:
-        sp500_df = pd.read_html("https://en.wikipedia.org/wiki/List_of_S%26P_500_companies")[0]
+        sp500_df = cache.obtener("sp500", (URL_SP500,), lambda: pd.read_html(URL_SP500)[0])
     except Exception as e:
         print(f"❌ Error al leer la página de Wikipedia: {e}")
         return
@@ -17,120 +86,133 @@ def extract_top_500_marketcap(output_file="../../data/raw_data/top_500_marketcap
     sp500_df["Symbol"] = sp500_df["Symbol"].str.replace(".", "-", regex=False)
     tickers = sp500_df["Symbol"].tolist()
 
-    results = []
     print("📊 Descargando market caps (esto puede tardar unos minutos)...")
-    for ticker in tqdm(tickers):
-        try:
-            info = yf.Ticker(ticker).info
-            results.append({
-                "Ticker": ticker,
-                "Name": info.get("shortName", ""),
-                "Sector": info.get("sector", ""),
-                "Industry": info.get("industry", ""),
-                "MarketCap": info.get("marketCap", 0)
-            })
-        except Exception as e:
-            tqdm.write(f"⚠️ Error con {ticker}: {e}")
-
-    df = pd.DataFrame(results)
-    df.sort_values("MarketCap", ascending=False, inplace=True)
-    df_top500 = df.head(500)
+    infos, errores = extraer_snapshot_info(tickers, snapshot_file, fuente)
+    df_top500 = construir_ranking_marketcap(tickers, infos, errores)
 
-    df_top500.to_csv(output_file, index=False)
+    guardar_tabla(df_top500, output_file)
     print(f"✅ Top 500 empresas guardadas en: {output_file}")
 
 
 def descargar_datos_historicos(tickers_csv_path: str,
                                salida_csv_path: str,
                                fecha_inicio: str = "2007-01-01",
-                               fecha_fin: str = None) -> pd.DataFrame:
+                               fecha_fin: str = None,
+                               fuente=None) -> pd.DataFrame:
     """
-    Descarga datos históricos de acciones desde Yahoo Finance en formato tidy y los guarda en un CSV.
+    Descarga datos históricos de acciones desde Yahoo Finance en formato tidy y los guarda en el historial particionado por mes.
+
+    La descarga va por lotes de tickers con reintentos y se retoma si se corta (ver fuentes.descargar_historico).
     """
     if fecha_fin is None:
         fecha_fin = datetime.today().strftime('%Y-%m-%d')
 
-    tickers_df = pd.read_csv(tickers_csv_path)
+    tickers_df = leer_tabla(tickers_csv_path, columnas=["Ticker"])
     tickers = tickers_df["Ticker"].dropna().unique().tolist()
 
     print(f"📥 Descargando datos históricos para {len(tickers)} tickers desde {fecha_inicio} hasta {fecha_fin}...")
 
-    data = yf.download(tickers, start=fecha_inicio, end=fecha_fin, group_by='ticker', threads=True)
-
-    data_tidy = data.stack(level=0).rename_axis(['Date', 'Ticker']).reset_index()
+    data_tidy, sin_datos = descargar_historico(tickers, fecha_inicio, fecha_fin, fuente)
+    if sin_datos:
+        print(f"⚠️ {len(sin_datos)} tickers sin datos después de los reintentos: {', '.join(sin_datos[:20])}")
 
-    data_tidy.to_csv(salida_csv_path, index=False)
+    guardar_historial(data_tidy, salida_csv_path)
+    limpiar_progreso()
     print(f"✅ Datos históricos guardados en {salida_csv_path}")
 
     return data_tidy
 
 
 
+INDICADORES_FUNDAMENTALES = {
+    "Name": "shortName",
+    "PER": "trailingPE",
+    "ROE": "returnOnEquity",
+    "EPS Growth YoY": "earningsQuarterlyGrowth",
+    "Deuda/Patrimonio": "debtToEquity",
+    "Market Cap": "marketCap",
+    "Margen Neto": "profitMargins",
+    "Dividend Yield": "dividendYield",
+    "Industria": "industry",
+    "Sector": "sector",
+    "Acciones en Circulación": "sharesOutstanding"  # campo agregado
+}
+
+def construir_fundamentales(tickers, infos, errores):
+    """
+    Arma la tabla de fundamentales a partir del `info` de cada ticker.
+
+    Los tickers que fallaron en todos los intentos se informan y quedan fuera; los que no
+    devolvieron info quedan con los indicadores vacíos.
+    """
+    fundamentals_list = []
+    for ticker in tickers:
+        if ticker in errores:
+            tqdm.write(f"❌ Error al obtener datos de {ticker}: {errores[ticker]}")
+            continue
+
+        info = infos.get(ticker)
+        data = {"Ticker": ticker}
+        if info and isinstance(info, dict):
+            for indicador, key in INDICADORES_FUNDAMENTALES.items():
+                data[indicador] = info.get(key, None)
+        else:
+            tqdm.write(f"⚠️ No se pudo obtener info para {ticker}")
+            for indicador in INDICADORES_FUNDAMENTALES:
+                data[indicador] = None
+
+        fundamentals_list.append(data)
+
+    return pd.DataFrame(fundamentals_list)
+
 def extract_fundamentals_indicators(
-    info_csv="../../data/raw_data/top_500_marketcap.csv",
-    output_file="../../data/raw_data/nyse_top_500_fundamentals_indicators.csv"
+    info_csv=ruta_dataset(DIR_RAW, "top_500_marketcap"),
+    output_file=ruta_dataset(DIR_RAW, "nyse_top_500_fundamentals_indicators"),
+    fuente=None,
+    snapshot_file=SNAPSHOT_INFO
 ):
     """
     Extrae indicadores fundamentales para cada ticker que aparece en el CSV inicial,
     incluyendo acciones en circulación.
+
+    Si hay un snapshot de info reciente (guardado por extract_top_500_marketcap) se deriva
+    de él sin volver a consultar; si no, se descarga (en paralelo, ver fuentes.py).
     """
     try:
-        tickers_df = pd.read_csv(info_csv)
+        tickers_df = leer_tabla(info_csv, columnas=["Ticker"])
     except Exception as e:
         print("❌ Error al leer el CSV de tickers:", e)
         return
 
-    indicators_keys = {
-        "Name": "shortName",
-        "PER": "trailingPE",
-        "ROE": "returnOnEquity",
-        "EPS Growth YoY": "earningsQuarterlyGrowth",
-        "Deuda/Patrimonio": "debtToEquity",
-        "Market Cap": "marketCap",
-        "Margen Neto": "profitMargins",
-        "Dividend Yield": "dividendYield",
-        "Industria": "industry",
-        "Sector": "sector",
-        "Acciones en Circulación": "sharesOutstanding"  # campo agregado
-    }
-
-    fundamentals_list = []
+    tickers = tickers_df["Ticker"].tolist()
 
     print("📊 Extrayendo indicadores fundamentales...")
-    for ticker in tqdm(tickers_df["Ticker"]):
-        try:
-            yf_obj = yf.Ticker(ticker)
-            info = getattr(yf_obj, "info", None)
-
-            data = {"Ticker": ticker}
-
-            if info and isinstance(info, dict):
-                for indicador, key in indicators_keys.items():
-                    data[indicador] = info.get(key, None)
-            else:
-                tqdm.write(f"⚠️ No se pudo obtener info para {ticker}")
-                for indicador in indicators_keys:
-                    data[indicador] = None
-
-            fundamentals_list.append(data)
-
-        except Exception as e:
-            tqdm.write(f"❌ Error al obtener datos de {ticker}: {e}")
-
-    df_fundamentals = pd.DataFrame(fundamentals_list)
-    df_fundamentals.to_csv(output_file, index=False)
+    snapshot = leer_snapshot_info(snapshot_file)
+    if snapshot is not None:
+        infos, errores = snapshot
+        faltantes = [t for t in tickers if t not in infos and t not in errores]
+        if faltantes:
+            nuevos, nuevos_errores = descargar_info(faltantes, fuente)
+            infos.update(nuevos)
+            errores.update(nuevos_errores)
+    else:
+        infos, errores = descargar_info(tickers, fuente)
+
+    df_fundamentals = construir_fundamentales(tickers, infos, errores)
+    guardar_tabla(df_fundamentals, output_file)
     print(f"✅ Tabla de indicadores fundamentales guardada en: {output_file}")
 
 
 
 if __name__ == "__main__":
     # Rutas
-    marketcap_path = "../../data/raw_data/top_500_marketcap.csv"
-    historicos_path = "../../data/raw_data/nyse_top500_data.csv"
-    fundamentales_path = "../../data/raw_data/nyse_top_500_fundamentals_indicators.csv"
+    marketcap_path = ruta_dataset(DIR_RAW, "top_500_marketcap")
+    historicos_path = ruta_dataset(DIR_RAW, "nyse_top500_data")
+    fundamentales_path = ruta_dataset(DIR_RAW, "nyse_top_500_fundamentals_indicators")
 
     # Ejecutar procesos
-    extract_top_500_marketcap(output_file=marketcap_path)
+    # Una sola consulta de info por ticker: el ranking y los fundamentales salen del mismo snapshot
+    extract_top_500_marketcap(output_file=marketcap_path, snapshot_file=SNAPSHOT_INFO)
 
     descargar_datos_historicos(
         tickers_csv_path=marketcap_path,
@@ -140,5 +222,6 @@ if __name__ == "__main__":
 
     extract_fundamentals_indicators(
         info_csv=marketcap_path,
-        output_file=fundamentales_path
+        output_file=fundamentales_path,
+        snapshot_file=SNAPSHOT_INFO
     )
@@ -1,27 +1,65 @@
 import pandas as pd
-import yfinance as yf
 from datetime import datetime, timedelta
 from tqdm import tqdm
 import os
+from dotenv import load_dotenv
+from fuentes import FuenteYahoo, descargar_historico, limpiar_progreso
+from ext import construir_fundamentales, extraer_snapshot_info, SNAPSHOT_INFO
+from huecos import calendario, detectar_huecos, planificar_descargas, sin_datos_registrados
+from almacenamiento import (leer_tabla, guardar_tabla, ruta_dataset, leer_manifiesto, actualizar_manifiesto,
+                            anexar_historial, migrar_historial)
+
+load_dotenv()
+
+DIR_RAW = "../../data/raw_data/"
+# Con ETL_RELLENAR_HUECOS=0 la actualización diaria no busca huecos en el historial
+RELLENAR_HUECOS = os.getenv("ETL_RELLENAR_HUECOS", "1") == "1"
+# Los huecos en los últimos días del calendario no se dan por perdidos (la fuente puede publicarlos tarde)
+DIAS_GRACIA = 5
 
 def actualizar_datos_historicos(
-    historicos_path="../../data/raw_data/nyse_top500_data.csv",
-    tickers_path="../../data/raw_data/top_500_marketcap.csv"
+    historicos_path=ruta_dataset(DIR_RAW, "nyse_top500_data"),
+    tickers_path=ruta_dataset(DIR_RAW, "top_500_marketcap"),
+    fuente=None,
+    rellenar=RELLENAR_HUECOS
 ):
     """
-    Actualiza el CSV de datos históricos solo con las fechas nuevas.
+    Actualiza el historial de precios solo con las fechas nuevas.
+
+    La última fecha se toma del manifiesto del historial (sin leer los precios) y los días
+    nuevos se agregan como archivos nuevos de su partición mensual. Con `rellenar` antes se
+    completan los huecos de cada ticker (ver rellenar_huecos).
+
+    Returns:
+        dict: Ticker -> primera fecha agregada antes de su última fecha, pendientes de confirmar
+            (ver rellenar_huecos y confirmar_reescritos).
     """
     print("📅 Verificando última fecha disponible en históricos...")
 
-    # Cargar data existente
-    if not os.path.exists(historicos_path):
+    # Historial guardado en un único archivo por versiones anteriores: se convierte una vez
+    migrar_historial(historicos_path)
+
+    manifiesto = leer_manifiesto(historicos_path)
+    if manifiesto is None or manifiesto["watermark"] is None:
         print("❌ Archivo histórico no encontrado. Ejecutá el script principal primero.")
-        return
+        return {}
+
+    ultima_fecha = pd.Timestamp(manifiesto["watermark"]).date()
+    tickers_df = leer_tabla(tickers_path, columnas=["Ticker"])
+    tickers = tickers_df["Ticker"].dropna().astype(str).unique().tolist()
 
-    historico_df = pd.read_csv(historicos_path)
-    historico_df["Date"] = pd.to_datetime(historico_df["Date"])
-    ultima_fecha = historico_df["Date"].max().date()
+    fuente = fuente or FuenteYahoo()
+    # Primero los huecos: un ticker nuevo en la lista todavía no tiene filas y pide su historia completa
+    if rellenar:
+        rellenar_huecos(historicos_path, tickers, fuente)
+    _anexar_fechas_nuevas(historicos_path, tickers, ultima_fecha, fuente)
+    return (leer_manifiesto(historicos_path) or {}).get("reescritos", {})
 
+def confirmar_reescritos(historicos_path=ruta_dataset(DIR_RAW, "nyse_top500_data")):
+    """Marca como atendidos los tickers reescritos (estado incremental descartado y marcas de agua retrocedidas)."""
+    actualizar_manifiesto(historicos_path, reescritos={})
+
+def _anexar_fechas_nuevas(historicos_path, tickers, ultima_fecha, fuente):
     fecha_inicio = ultima_fecha + timedelta(days=1)
     fecha_fin = datetime.today().date()
 
@@ -29,88 +67,150 @@ def actualizar_datos_historicos(
         print("✅ No hay datos nuevos para actualizar.")
         return
 
-    tickers_df = pd.read_csv(tickers_path)
-    tickers = tickers_df["Ticker"].dropna().unique().tolist()
-
     print(f"📈 Descargando datos desde {fecha_inicio} hasta {fecha_fin} para {len(tickers)} tickers...")
 
-    nuevos_datos = yf.download(
+    nuevos_datos_tidy, sin_datos = descargar_historico(
         tickers,
-        start=str(fecha_inicio),
-        end=str(fecha_fin + timedelta(days=1)),  # para que incluya el último día
-        group_by='ticker',
-        threads=True
+        fecha_inicio,
+        fecha_fin + timedelta(days=1),  # para que incluya el último día
+        fuente
     )
 
-    if nuevos_datos.empty:
+    if nuevos_datos_tidy.empty:
         print("⚠️ No se encontraron nuevos datos.")
+        limpiar_progreso()
         return
+    if sin_datos:
+        # Quedan como huecos: la próxima actualización los vuelve a pedir (ver rellenar_huecos)
+        print(f"⚠️ {len(sin_datos)} tickers sin datos nuevos: {', '.join(sin_datos[:20])}")
 
-    nuevos_datos_tidy = nuevos_datos.stack(level=0).rename_axis(['Date', 'Ticker']).reset_index()
-    nuevos_datos_tidy["Date"] = pd.to_datetime(nuevos_datos_tidy["Date"])
+    nuevos_datos_tidy = nuevos_datos_tidy[nuevos_datos_tidy["Date"].dt.date > ultima_fecha]
+    nuevos_datos_tidy = nuevos_datos_tidy.drop_duplicates(subset=["Date", "Ticker"], keep="last")
 
-    df_actualizado = pd.concat([historico_df, nuevos_datos_tidy], ignore_index=True)
-    df_actualizado.drop_duplicates(subset=["Date", "Ticker"], keep="last", inplace=True)
+    anexar_historial(nuevos_datos_tidy, historicos_path)
+    limpiar_progreso()
+    print(f"✅ Históricos actualizados: {historicos_path} ({len(nuevos_datos_tidy)} filas nuevas)")
 
-    df_actualizado.to_csv(historicos_path, index=False)
-    print(f"✅ Históricos actualizados: {historicos_path}")
+def _registrar_sin_datos(historicos_path, historial, sin_datos, tickers):
+    """
+    Registra como sin datos los días que siguen faltando a `tickers` después de descargarlos,
+    salvo los últimos DIAS_GRACIA del calendario (la fuente puede publicarlos tarde).
+    """
+    cal = calendario(historial)
+    if len(cal) <= DIAS_GRACIA or not tickers:
+        return
+    presentes = pd.concat([historial.astype({"Ticker": str}), sin_datos], ignore_index=True)
+    faltan = detectar_huecos(presentes, sorted(tickers), cal, max_dias_entre_huecos=0)
+    faltan = faltan[faltan["Desde"] <= cal[-DIAS_GRACIA - 1]]
+    if faltan.empty:
+        return
+    registrados = (leer_manifiesto(historicos_path) or {}).get("sin_datos", {})
+    for ticker, desde, hasta in faltan[["Ticker", "Desde", "Hasta"]].itertuples(index=False):
+        fechas = cal[(cal >= desde) & (cal <= min(hasta, cal[-DIAS_GRACIA - 1]))].strftime("%Y-%m-%d")
+        registrados[ticker] = sorted(set(registrados.get(ticker, [])) | set(fechas))
+    actualizar_manifiesto(historicos_path, sin_datos=registrados)
+    print(f"ℹ️ {len(faltan)} huecos sin datos en la fuente: no se vuelven a pedir")
+
+def rellenar_huecos(historicos_path, tickers, fuente=None):
+    """
+    Completa los huecos (ticker, fecha) del historial: días que le faltan a un ticker frente al
+    calendario del panel (descargas fallidas) y tickers agregados a la lista sin historia.
+
+    Solo se descargan los rangos del plan de huecos.py, agrupando en una descarga los tickers
+    con el mismo rango, y se anexan las filas que no estaban guardadas. Los días que la fuente
+    tampoco tiene quedan registrados en el manifiesto y no se vuelven a pedir.
+
+    Los tickers con días agregados antes de su última fecha quedan anotados en el manifiesto
+    (`reescritos`, con la primera fecha agregada) hasta que se confirman: lo calculado y cargado
+    en forma incremental a partir de ellos quedó desactualizado (main.py descarta el estado de
+    indicadores y retrocede las marcas de agua de la base).
+
+    Returns:
+        dict: Ticker -> primera fecha agregada antes de su última fecha, en esta llamada.
+    """
+    historial = leer_tabla(historicos_path, columnas=["Date", "Ticker"])
+    sin_datos = sin_datos_registrados(leer_manifiesto(historicos_path))
+    plan = planificar_descargas(historial, tickers, sin_datos)
+    if plan.empty:
+        print("✅ El historial no tiene huecos.")
+        return {}
+
+    print(f"🩹 {int(plan['Dias'].sum())} días faltantes en {plan['Tickers'].map(len).sum()} rangos "
+          f"(ticker, fechas): {len(plan)} descargas...")
+    fuente = fuente or FuenteYahoo()
+    partes, descargados = [], set()
+    for desde, hasta, lista in tqdm(plan[["Desde", "Hasta", "Tickers"]].itertuples(index=False), total=len(plan)):
+        try:
+            datos = fuente.historico(lista, desde.date(), hasta.date() + timedelta(days=1))
+        except Exception as e:
+            tqdm.write(f"❌ Error al descargar {desde.date()} → {hasta.date()} ({len(lista)} tickers): {e}")
+            continue
+        descargados.update(lista)
+        if not datos.empty:
+            partes.append(datos[datos["Ticker"].isin(lista) & datos["Date"].between(desde, hasta)])
+
+    nuevos = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+    if not nuevos.empty:
+        # Solo las filas que no estaban guardadas (los rangos unidos incluyen días ya presentes)
+        nuevos = nuevos.drop_duplicates(subset=["Date", "Ticker"], keep="last")
+        guardadas = historial[historial["Ticker"].isin(nuevos["Ticker"].unique())].astype({"Ticker": str})
+        nuevos = nuevos.merge(guardadas, on=["Date", "Ticker"], how="left", indicator=True)
+        nuevos = nuevos[nuevos["_merge"] == "left_only"].drop(columns="_merge").reset_index(drop=True)
+
+    if not nuevos.empty:
+        anexar_historial(nuevos, historicos_path)
+        print(f"✅ Huecos rellenados: {len(nuevos)} filas de {nuevos['Ticker'].nunique()} tickers")
+    else:
+        print("⚠️ La fuente no devolvió datos para los huecos.")
+
+    # Tickers con historia descargados sin error: lo que sigue faltando no está en la fuente
+    con_historia = descargados & set(historial["Ticker"].dropna().unique().astype(str))
+    completo = pd.concat([historial, nuevos[["Date", "Ticker"]]], ignore_index=True) if not nuevos.empty else historial
+    _registrar_sin_datos(historicos_path, completo, sin_datos, con_historia)
+
+    if nuevos.empty:
+        return {}
+    ultima_por_ticker = guardadas.groupby("Ticker")["Date"].max()
+    anteriores = nuevos[nuevos["Date"] < nuevos["Ticker"].map(ultima_por_ticker)]
+    reescritos = {ticker: fecha.strftime("%Y-%m-%d")
+                  for ticker, fecha in anteriores.groupby("Ticker")["Date"].min().items()}
+    if reescritos:
+        # Con pendientes sin confirmar de otra corrida se conserva la fecha más antigua
+        pendientes = (leer_manifiesto(historicos_path) or {}).get("reescritos", {})
+        actualizar_manifiesto(historicos_path, reescritos={
+            ticker: min(fecha for fecha in (pendientes.get(ticker), reescritos.get(ticker)) if fecha)
+            for ticker in sorted(set(pendientes) | set(reescritos))})
+    return reescritos
 
 
 def actualizar_fundamentales(
-    tickers_path="../../data/raw_data/top_500_marketcap.csv",
-    output_file="../../data/raw_data/nyse_top_500_fundamentals_indicators.csv"
+    tickers_path=ruta_dataset(DIR_RAW, "top_500_marketcap"),
+    output_file=ruta_dataset(DIR_RAW, "nyse_top_500_fundamentals_indicators"),
+    fuente=None,
+    snapshot_file=SNAPSHOT_INFO
 ):
     """
     Re-extrae la tabla de fundamentales con datos actualizados,
-    incluyendo acciones en circulación.
+    incluyendo acciones en circulación. El info crudo queda guardado en `snapshot_file`.
     """
     print("📊 Reextrayendo fundamentales...")
 
     try:
-        tickers_df = pd.read_csv(tickers_path)
+        tickers_df = leer_tabla(tickers_path, columnas=["Ticker"])
     except Exception as e:
         print("❌ Error al leer tickers:", e)
         return
 
-    indicators_keys = {
-        "Name": "shortName",
-        "PER": "trailingPE",
-        "ROE": "returnOnEquity",
-        "EPS Growth YoY": "earningsQuarterlyGrowth",
-        "Deuda/Patrimonio": "debtToEquity",
-        "Market Cap": "marketCap",
-        "Margen Neto": "profitMargins",
-        "Dividend Yield": "dividendYield",
-        "Industria": "industry",
-        "Sector": "sector",
-        "Acciones en Circulación": "sharesOutstanding"  # nuevo campo
-    }
-
-    data_fundamentals = []
-
-    for ticker in tqdm(tickers_df["Ticker"]):
-        try:
-            yf_obj = yf.Ticker(ticker)
-            info = getattr(yf_obj, "info", None)
-
-            fila = {"Ticker": ticker}
-            if info and isinstance(info, dict):
-                for indicador, key in indicators_keys.items():
-                    fila[indicador] = info.get(key, None)
-            else:
-                tqdm.write(f"⚠️ Sin info para {ticker}")
-                for indicador in indicators_keys:
-                    fila[indicador] = None
-
-            data_fundamentals.append(fila)
-
-        except Exception as e:
-            tqdm.write(f"❌ Error al obtener datos de {ticker}: {e}")
+    tickers = tickers_df["Ticker"].tolist()
+    infos, errores = extraer_snapshot_info(tickers, snapshot_file, fuente)
 
-    df = pd.DataFrame(data_fundamentals)
-    df.to_csv(output_file, index=False)
+    df = construir_fundamentales(tickers, infos, errores)
+    guardar_tabla(df, output_file)
     print(f"✅ Fundamentales actualizados: {output_file}")
 
 if __name__ == "__main__":
-    actualizar_datos_historicos()
+    reescritos = actualizar_datos_historicos()
+    if reescritos:
+        print(f"⚠️ Historial modificado antes de la última fecha de {len(reescritos)} tickers: "
+              "los indicadores incrementales y sus cargas se rehacen en la próxima corrida de main.py")
     actualizar_fundamentales()
@@ -0,0 +1,222 @@
+import os
+import time
+import random
+import hashlib
+import functools
+from datetime import date
+from typing import Protocol
+import pandas as pd
+import yfinance as yf
+from dotenv import load_dotenv
+from tqdm import tqdm
+import cache
+
+try:
+    from curl_cffi import requests as http  # el backend que usa yfinance si está instalado
+    OPCIONES_SESION = {"impersonate": "chrome"}
+except ImportError:
+    import requests as http
+    OPCIONES_SESION = {}
+from concurrencia import LimitadorTasa, ejecutar_concurrente
+from almacenamiento import leer_tabla, guardar_tabla, borrar_tabla, ruta_dataset
+
+load_dotenv()
+
+# Parámetros por defecto para consultar Yahoo Finance sin que corte las conexiones
+MAX_WORKERS = 8
+LLAMADAS_POR_SEGUNDO = 4
+REINTENTOS = 3
+TIMEOUT_TICKER = 30  # segundos
+# Tope de cada request HTTP: una llamada colgada falla sola (y se reintenta) antes de que venza la
+# ronda. El timeout por ronda de concurrencia.py solo deja de esperarla, no puede cortar el hilo
+TIMEOUT_HTTP = 20  # segundos
+
+# Descarga de precios por lotes de tickers (en lugar de un yf.download con los 500)
+TICKERS_POR_LOTE = int(os.getenv("ETL_TICKERS_POR_LOTE", "50"))
+MAX_LOTES_SIMULTANEOS = 4
+LOTES_POR_SEGUNDO = 1
+TIMEOUT_LOTE = 300  # segundos
+ESPERA_BASE_LOTES = 2.0  # segundos antes del primer reintento
+# Los lotes terminados se guardan acá hasta que el historial queda escrito (para retomar tras un corte)
+DIR_PROGRESO = "../../data/raw_data/descarga_en_curso/"
+
+class FuenteDatos(Protocol):
+    """
+    Interfaz de una fuente de datos de mercado.
+
+    Cualquier objeto con estos métodos sirve, sin heredar de esta clase (p. ej. una fuente
+    local con datos fijos para probar la extracción sin red).
+    """
+
+    def info(self, ticker):
+        """Diccionario con la información del ticker (equivalente a yf.Ticker(t).info)."""
+        ...
+
+    def historico(self, tickers, inicio, fin):
+        """Precios diarios en formato tidy (Date, Ticker, Open, High, Low, Close, Volume) entre [inicio, fin)."""
+        ...
+
+@functools.lru_cache(maxsize=None)
+def sesion_con_timeout(segundos=TIMEOUT_HTTP):
+    """
+    Sesión HTTP para yfinance en la que ningún request espera más de `segundos`. Es una por
+    tope (yfinance guarda cookie y crumb de la sesión: cambiarla en cada llamada los pierde).
+    """
+    class SesionConTimeout(http.Session):
+        def request(self, *args, **kwargs):
+            pedido = kwargs.get("timeout")
+            kwargs["timeout"] = pedido if isinstance(pedido, (int, float)) and 0 < pedido <= segundos else segundos
+            return super().request(*args, **kwargs)
+
+    return SesionConTimeout(**OPCIONES_SESION)
+
+class FuenteYahoo(FuenteDatos):
+    """
+    Fuente por defecto: Yahoo Finance vía yfinance, con caché local en disco (ver cache.py).
+
+    Todas las consultas usan una sesión con tope de `timeout_http` segundos por request.
+    """
+
+    def __init__(self, timeout_http=TIMEOUT_HTTP):
+        self.timeout_http = timeout_http
+        self.sesion = sesion_con_timeout(timeout_http)
+
+    def info(self, ticker):
+        return cache.obtener("info", (ticker,),
+                             lambda: getattr(yf.Ticker(ticker, session=self.sesion), "info", None))
+
+    def historico(self, tickers, inicio, fin):
+        tickers = sorted(tickers)
+        cerrado = pd.Timestamp(fin).date() <= date.today()
+        return cache.obtener(
+            "historico_cerrado" if cerrado else "historico_abierto",
+            (tuple(tickers), str(inicio), str(fin)),
+            lambda: self._descargar(tickers, inicio, fin),
+        )
+
+    def _descargar(self, tickers, inicio, fin):
+        data = yf.download(tickers, start=str(inicio), end=str(fin), group_by='ticker', threads=True,
+                           timeout=self.timeout_http, session=self.sesion)
+        if data.empty:
+            return pd.DataFrame()
+        data_tidy = data.stack(level=0).rename_axis(['Date', 'Ticker']).reset_index()
+        data_tidy["Date"] = pd.to_datetime(data_tidy["Date"])
+        # Un ticker que falló en la descarga viene sin precios: no se guarda, queda como hueco
+        precios = [c for c in ("Open", "High", "Low", "Close") if c in data_tidy.columns]
+        return data_tidy.dropna(subset=precios, how="all")
+
+def descargar_info(tickers, fuente=None, max_workers=MAX_WORKERS, llamadas_por_segundo=LLAMADAS_POR_SEGUNDO,
+                   reintentos=REINTENTOS, timeout=TIMEOUT_TICKER):
+    """
+    Descarga el `info` de cada ticker en paralelo, con límite de tasa y reintentos solo de los fallidos.
+
+    Returns:
+        tuple: (info por ticker, error por ticker de los que fallaron en todos los intentos).
+    """
+    fuente = fuente or FuenteYahoo()
+    return ejecutar_concurrente(
+        fuente.info, tickers,
+        max_workers=max_workers,
+        limitador=LimitadorTasa(llamadas_por_segundo),
+        reintentos=reintentos,
+        timeout=timeout,
+        no_reintentables=(cache.SinCacheError,),
+    )
+
+def _lotes(tickers, tamanio):
+    return [tuple(tickers[i:i + tamanio]) for i in range(0, len(tickers), tamanio)]
+
+def _dir_progreso(dir_progreso, tickers, inicio, fin):
+    """Subcarpeta de progreso de esta descarga; la de una descarga distinta que quedó cortada se descarta."""
+    clave = hashlib.sha256(repr((tickers, str(inicio), str(fin))).encode("utf-8")).hexdigest()[:16]
+    if os.path.isdir(dir_progreso):
+        for otra in os.listdir(dir_progreso):
+            if otra != clave:
+                borrar_tabla(os.path.join(dir_progreso, otra))
+    ruta = os.path.join(dir_progreso, clave)
+    os.makedirs(ruta, exist_ok=True)
+    return ruta
+
+def _lotes_guardados(progreso):
+    if progreso is None:
+        return []
+    return [leer_tabla(os.path.join(progreso, archivo)) for archivo in sorted(os.listdir(progreso))
+            if archivo.startswith("lote_")]
+
+def descargar_historico(tickers, inicio, fin, fuente=None, tickers_por_lote=TICKERS_POR_LOTE,
+                        max_workers=MAX_LOTES_SIMULTANEOS, reintentos=REINTENTOS, espera_base=ESPERA_BASE_LOTES,
+                        timeout=TIMEOUT_LOTE, dir_progreso=DIR_PROGRESO):
+    """
+    Descarga precios diarios entre [inicio, fin) por lotes de tickers, en paralelo.
+
+    Un ticker sin filas en la respuesta de su lote (o cuyo lote falló) se vuelve a pedir en la
+    ronda siguiente, solo él: hasta `reintentos` rondas más, con lotes y paralelismo cada vez
+    menores y una espera que crece con la ronda y con la proporción de fallas. Si una ronda
+    no trae ninguna fila y ningún lote falló, el rango no tiene datos y no se reintenta.
+
+    Cada lote terminado se guarda en `dir_progreso`: si el proceso se corta, la misma descarga
+    retoma solo los tickers que faltaban. El que llama borra el progreso con `limpiar_progreso`
+    una vez guardado el resultado.
+
+    Returns:
+        tuple: (precios tidy, tickers sin datos después de todos los intentos).
+    """
+    fuente = fuente or FuenteYahoo()
+    tickers = sorted(set(tickers))
+    progreso = _dir_progreso(dir_progreso, tickers, inicio, fin) if dir_progreso else None
+    partes = _lotes_guardados(progreso)
+    if partes:
+        tqdm.write(f"↩️ Retomando descarga: {len(partes)} lotes ya guardados")
+    descargados = set().union(*(set(p["Ticker"].astype(str)) for p in partes))
+    pendientes = [t for t in tickers if t not in descargados]
+    limitador = LimitadorTasa(LOTES_POR_SEGUNDO)
+    numero = len(partes)
+
+    def descargar_lote(lote):
+        datos = fuente.historico(list(lote), inicio, fin)
+        datos = None if datos is None or datos.empty else datos[datos["Ticker"].isin(lote)]
+        if datos is None or datos.empty:
+            return None
+        if progreso is not None:
+            guardar_tabla(datos, ruta_dataset(progreso, f"lote_{numero:04d}_{lote[0]}"), en_memoria=False)
+        return datos
+
+    for intento in range(reintentos + 1):
+        if not pendientes:
+            break
+        if intento > 0:
+            proporcion = len(pendientes) / len(tickers)
+            tickers_por_lote = max(1, tickers_por_lote // 2)
+            if proporcion > 0.5:
+                max_workers = max(1, max_workers // 2)
+            espera = espera_base * 2 ** (intento - 1) * (0.5 + proporcion) * random.uniform(0.5, 1.5)
+            tqdm.write(f"🔁 Reintento {intento}/{reintentos} para {len(pendientes)} tickers "
+                       f"(lotes de {tickers_por_lote}, espera {espera:.1f}s)...")
+            time.sleep(espera)
+
+        resultados, errores = ejecutar_concurrente(
+            descargar_lote, _lotes(pendientes, tickers_por_lote),
+            max_workers=max_workers, limitador=limitador, reintentos=0, timeout=timeout,
+            descripcion="Lotes de precios", no_reintentables=(cache.SinCacheError,))
+        numero += 1
+        for lote, error in errores.items():
+            tqdm.write(f"⚠️ Falló el lote {lote[0]}…{lote[-1]} ({len(lote)} tickers): {error}")
+        if any(isinstance(e, cache.SinCacheError) for e in errores.values()):
+            break
+
+        nuevas = [datos for datos in resultados.values() if datos is not None]
+        partes.extend(nuevas)
+        descargados.update(*(set(d["Ticker"].astype(str)) for d in nuevas))
+        pendientes = [t for t in pendientes if t not in descargados]
+        if not nuevas and not errores:
+            break  # el rango no tiene datos para ninguno: reintentar no cambia nada
+
+    if not partes:
+        return pd.DataFrame(), pendientes
+    precios = pd.concat(partes, ignore_index=True).astype({"Ticker": str})
+    precios = precios.drop_duplicates(subset=["Date", "Ticker"], keep="last")
+    return precios.sort_values(["Date", "Ticker"], ignore_index=True), pendientes
+
+def limpiar_progreso(dir_progreso=DIR_PROGRESO):
+    """Borra los lotes guardados de la última descarga (después de escribir el historial)."""
+    borrar_tabla(dir_progreso)
@@ -0,0 +1,125 @@
+import sys
+import numpy as np
+import pandas as pd
+
+# ================
+# Detección de huecos en el historial de precios
+# ================
+# El calendario de referencia son las fechas del propio panel en las que cotizó al menos
+# MIN_COBERTURA_CALENDARIO de los tickers (así una fila suelta en un feriado no abre un hueco
+# en todos los demás). Para cada ticker se buscan las fechas del calendario que le faltan entre
+# su primera fecha y la última del panel: lo anterior a su primera fecha es su salida a bolsa,
+# no un hueco. Los tickers sin ninguna fila piden la historia completa desde `fecha_inicio`.
+
+MIN_COBERTURA_CALENDARIO = 0.2
+# Huecos del mismo ticker separados por a lo sumo estos días con datos se piden en una sola
+# descarga (los días ya guardados se descartan al anexar)
+MAX_DIAS_ENTRE_HUECOS = 5
+FECHA_INICIO_HISTORIAL = "2007-01-01"
+
+def calendario(df, min_cobertura=MIN_COBERTURA_CALENDARIO):
+    """Fechas de cotización del panel: las que tienen filas de al menos `min_cobertura` de los tickers."""
+    por_fecha = df.groupby("Date")["Ticker"].nunique()
+    return pd.DatetimeIndex(por_fecha.index[por_fecha >= min_cobertura * df["Ticker"].nunique()]).sort_values()
+
+def _codigos(serie, tickers):
+    """Posición de cada fila en `tickers` (-1 si no está), sin pasar a texto fila por fila."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return np.r_[tickers.get_indexer(serie.cat.categories.astype(str)), -1][serie.cat.codes.to_numpy()]
+    return tickers.get_indexer(serie.astype(str))
+
+def detectar_huecos(df, tickers=None, calendario_panel=None, max_dias_entre_huecos=MAX_DIAS_ENTRE_HUECOS):
+    """
+    Rangos de fechas del calendario que le faltan a cada ticker.
+
+    Args:
+        df (pd.DataFrame): Historial con al menos Date y Ticker.
+        tickers (list): Tickers a revisar (por defecto los del historial).
+        calendario_panel (pd.DatetimeIndex): Calendario de referencia (por defecto `calendario(df)`).
+        max_dias_entre_huecos (int): Huecos separados por hasta estos días con datos se unen.
+
+    Returns:
+        pd.DataFrame: Ticker, Desde, Hasta (fechas del calendario, inclusive) y Dias faltantes.
+    """
+    cal = calendario(df) if calendario_panel is None else calendario_panel
+    tickers = pd.Index(df["Ticker"].unique() if tickers is None else tickers).astype(str).unique()
+    if cal.empty or tickers.empty:
+        return pd.DataFrame(columns=["Ticker", "Desde", "Hasta", "Dias"])
+
+    # Posición de cada fila en el calendario; fechas fuera del calendario no cuentan
+    codigo = _codigos(df["Ticker"], tickers)
+    posicion = cal.get_indexer(pd.DatetimeIndex(df["Date"]))
+    validas = (codigo >= 0) & (posicion >= 0)
+    claves = np.sort(codigo[validas].astype(np.int64) * len(cal) + posicion[validas])
+    claves = claves[np.r_[True, claves[1:] != claves[:-1]]]
+    codigo, posicion = np.divmod(claves, len(cal))
+
+    # Entre dos fechas consecutivas del mismo ticker falta todo lo intermedio
+    mismo = codigo[1:] == codigo[:-1]
+    salto = mismo & (posicion[1:] - posicion[:-1] > 1)
+    inicio = [posicion[:-1][salto] + 1]
+    fin = [posicion[1:][salto] - 1]
+    ticker = [codigo[:-1][salto]]
+
+    # Después de la última fecha del ticker falta hasta el final del calendario
+    ultimas = np.r_[~mismo, True]
+    cortados = ultimas & (posicion < len(cal) - 1)
+    inicio.append(posicion[cortados] + 1)
+    fin.append(np.full(cortados.sum(), len(cal) - 1))
+    ticker.append(codigo[cortados])
+
+    huecos = pd.DataFrame({"codigo": np.concatenate(ticker), "inicio": np.concatenate(inicio),
+                           "fin": np.concatenate(fin)}).sort_values(["codigo", "inicio"], ignore_index=True)
+    huecos["Dias"] = huecos["fin"] - huecos["inicio"] + 1
+
+    # Une huecos cercanos del mismo ticker: un rango por descarga
+    separados = (huecos["codigo"].diff() != 0) | (huecos["inicio"] - huecos["fin"].shift() - 1 > max_dias_entre_huecos)
+    huecos = huecos.groupby(separados.cumsum()).agg(
+        codigo=("codigo", "first"), inicio=("inicio", "first"), fin=("fin", "last"), Dias=("Dias", "sum"))
+
+    return pd.DataFrame({"Ticker": tickers[huecos["codigo"].to_numpy()],
+                         "Desde": cal[huecos["inicio"].to_numpy()], "Hasta": cal[huecos["fin"].to_numpy()],
+                         "Dias": huecos["Dias"].to_numpy(dtype="int64")})
+
+def sin_datos_registrados(manifiesto):
+    """Pares (Date, Ticker) que la fuente ya confirmó que no tiene (`sin_datos` del manifiesto del historial)."""
+    registrados = (manifiesto or {}).get("sin_datos", {})
+    return pd.DataFrame(
+        [(fecha, ticker) for ticker, fechas in registrados.items() for fecha in fechas],
+        columns=["Date", "Ticker"]).astype({"Date": "datetime64[ns]", "Ticker": str})
+
+def planificar_descargas(df, tickers, sin_datos=None, fecha_inicio=FECHA_INICIO_HISTORIAL, **opciones):
+    """
+    Plan de descargas para completar el historial: una por rango de fechas, con todos los
+    tickers que comparten ese rango.
+
+    Los pares (Date, Ticker) de `sin_datos` (la fuente ya confirmó que no tiene datos) no
+    cuentan como huecos. Los tickers de `tickers` sin ninguna fila en el historial piden
+    desde `fecha_inicio` hasta la última fecha del calendario.
+
+    Returns:
+        pd.DataFrame: Desde, Hasta, Tickers (lista) y Dias (faltantes en total).
+    """
+    cal = calendario(df)
+    presentes = df if sin_datos is None or sin_datos.empty else pd.concat(
+        [df[["Date", "Ticker"]].astype({"Ticker": str}), sin_datos[["Date", "Ticker"]]], ignore_index=True)
+    huecos = detectar_huecos(presentes, tickers, cal, **opciones)
+    faltantes = sorted(set(tickers) - set(df["Ticker"].dropna().unique().astype(str)))
+    if faltantes and not cal.empty:
+        completos = pd.DataFrame({"Ticker": faltantes, "Desde": pd.Timestamp(fecha_inicio),
+                                  "Hasta": cal[-1], "Dias": len(cal)})
+        huecos = pd.concat([huecos[~huecos["Ticker"].isin(faltantes)], completos], ignore_index=True)
+    if huecos.empty:
+        return pd.DataFrame(columns=["Desde", "Hasta", "Tickers", "Dias"])
+    return (huecos.groupby(["Desde", "Hasta"], sort=True)
+                  .agg(Tickers=("Ticker", lambda t: sorted(t)), Dias=("Dias", "sum"))
+                  .reset_index())
+
+if __name__ == "__main__":
+    # python huecos.py <historial> [<tickers>]  -> huecos y plan de descargas, sin descargar nada
+    from almacenamiento import leer_tabla, leer_manifiesto
+    historial = leer_tabla(sys.argv[1], columnas=["Date", "Ticker"])
+    lista = (leer_tabla(sys.argv[2], columnas=["Ticker"])["Ticker"].dropna().astype(str).tolist()
+             if len(sys.argv) > 2 else historial["Ticker"].astype(str).unique().tolist())
+    print(detectar_huecos(historial, lista).to_string(index=False))
+    print(planificar_descargas(historial, lista, sin_datos_registrados(leer_manifiesto(sys.argv[1]))).to_string(index=False))
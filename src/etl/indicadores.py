@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+
+# ================
+# Cálculos agrupados por ticker
+# ================
+def _por_ticker(serie, grupos):
+    """Agrupa la serie por ticker cuando se calcula sobre el panel completo."""
+    return serie if grupos is None else serie.groupby(grupos, sort=False)
+
+def _desapilar(resultado, grupos):
+    """Quita el nivel de ticker que agregan rolling/ewm agrupados y devuelve el índice original."""
+    return resultado if grupos is None else resultado.droplevel(0)
+
+def _rolling(serie, window, agregacion, grupos=None, min_periods=None):
+    ventana = _por_ticker(serie, grupos).rolling(window=window, min_periods=min_periods)
+    return _desapilar(getattr(ventana, agregacion)(), grupos)
+
+def _ewm(serie, span, grupos=None):
+    return _desapilar(_por_ticker(serie, grupos).ewm(span=span, adjust=False).mean(), grupos)
+
+# ================
+# Registro de indicadores
+# ================
+# Cada entrada calcula una serie a partir de otras del registro (o columnas del panel:
+# Close, High, Low, Volume). Los intermedios compartidos (diff, medias y desvíos móviles,
+# true range, EMAs) se calculan una sola vez por panel y los reutiliza quien los declare.
+REGISTRO = {}
+
+def registrar(nombre, dependencias=()):
+    """Decorador: agrega `funcion(*dependencias, grupos)` al registro con el nombre dado."""
+    def decorador(funcion):
+        REGISTRO[nombre] = (tuple(dependencias), funcion)
+        return funcion
+    return decorador
+
+class PanelIndicadores:
+    """
+    Calcula indicadores del registro sobre un panel (Ticker, Date, OHLCV) ordenado por Ticker y
+    Date, memorizando cada serie (intermedia o final) para no recalcularla.
+
+    Ejemplo:
+        panel = PanelIndicadores(df)
+        df['BB_Upper'] = panel['BB_Upper']      # calcula media_20 y desvio_20
+        df['Volatility_20'] = panel['Volatility_20']  # reutiliza desvio_20
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.grupos = df['Ticker']
+        self._series = {}
+
+    def __getitem__(self, nombre):
+        if nombre not in self._series:
+            if nombre in REGISTRO:
+                dependencias, funcion = REGISTRO[nombre]
+                self._series[nombre] = funcion(*(self[d] for d in dependencias), grupos=self.grupos)
+            elif nombre in self.df.columns:
+                return self.df[nombre]
+            else:
+                raise KeyError(f"'{nombre}' no es una columna del panel ni un indicador registrado")
+        return self._series[nombre]
+
+# Intermedios compartidos
+@registrar("close_anterior", ["Close"])
+def _close_anterior(close, grupos):
+    return _por_ticker(close, grupos).shift()
+
+@registrar("delta", ["Close"])
+def _delta(close, grupos):
+    return _por_ticker(close, grupos).diff()
+
+@registrar("ganancia", ["delta"])
+def _ganancia(delta, grupos):
+    return delta.clip(lower=0)
+
+@registrar("perdida", ["delta"])
+def _perdida(delta, grupos):
+    return -delta.clip(upper=0)
+
+@registrar("media_20", ["Close"])
+def _media_20(close, grupos):
+    return _rolling(close, 20, "mean", grupos)
+
+@registrar("media_50", ["Close"])
+def _media_50(close, grupos):
+    return _rolling(close, 50, "mean", grupos)
+
+@registrar("desvio_20", ["Close"])
+def _desvio_20(close, grupos):
+    return _rolling(close, 20, "std", grupos)
+
+@registrar("max_252", ["Close"])
+def _max_252(close, grupos):
+    # rolling max/min de pandas usa una deque monótona: O(n) sin importar la ventana
+    return _rolling(close, 252, "max", grupos, min_periods=1)
+
+@registrar("min_252", ["Close"])
+def _min_252(close, grupos):
+    return _rolling(close, 252, "min", grupos, min_periods=1)
+
+@registrar("max_126", ["Close"])
+def _max_126(close, grupos):
+    return _rolling(close, 126, "max", grupos, min_periods=1)
+
+@registrar("min_126", ["Close"])
+def _min_126(close, grupos):
+    return _rolling(close, 126, "min", grupos, min_periods=1)
+
+@registrar("true_range", ["High", "Low", "close_anterior"])
+def _true_range(high, low, close_prev, grupos):
+    high_low = high - low
+    high_close = (high - close_prev).abs()
+    low_close = (low - close_prev).abs()
+    return pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
+
+@registrar("ema_12", ["Close"])
+def _ema_12(close, grupos):
+    return _ewm(close, 12, grupos)
+
+@registrar("ema_26", ["Close"])
+def _ema_26(close, grupos):
+    return _ewm(close, 26, grupos)
+
+# Indicadores
+@registrar("SMA_20", ["media_20"])
+def _sma_20(media, grupos):
+    return media
+
+@registrar("SMA_50", ["media_50"])
+def _sma_50(media, grupos):
+    return media
+
+@registrar("EMA_20", ["Close"])
+def _ema_20(close, grupos):
+    return _ewm(close, 20, grupos)
+
+@registrar("RSI_14", ["ganancia", "perdida"])
+def _rsi_14(gain, loss, grupos):
+    avg_gain = _rolling(gain, 14, "mean", grupos)
+    avg_loss = _rolling(loss, 14, "mean", grupos)
+    rs = avg_gain / avg_loss
+    return 100 - (100 / (1 + rs))
+
+@registrar("MACD", ["ema_12", "ema_26"])
+def _macd(ema_short, ema_long, grupos):
+    return ema_short - ema_long
+
+@registrar("MACD_Signal", ["MACD"])
+def _macd_signal(macd, grupos):
+    return _ewm(macd, 9, grupos)
+
+@registrar("MACD_Hist", ["MACD", "MACD_Signal"])
+def _macd_hist(macd, macd_signal, grupos):
+    return macd - macd_signal
+
+@registrar("ATR_14", ["true_range"])
+def _atr_14(true_range, grupos):
+    return _rolling(true_range, 14, "mean", grupos)
+
+@registrar("OBV", ["delta", "Volume"])
+def _obv(delta, volume, grupos):
+    return _por_ticker((np.sign(delta) * volume).fillna(0), grupos).cumsum()
+
+@registrar("BB_Middle", ["media_20"])
+def _bb_middle(media, grupos):
+    return media
+
+@registrar("BB_Upper", ["BB_Middle", "desvio_20"])
+def _bb_upper(media, desvio, grupos):
+    return media + 2 * desvio
+
+@registrar("BB_Lower", ["BB_Middle", "desvio_20"])
+def _bb_lower(media, desvio, grupos):
+    return media - 2 * desvio
+
+@registrar("Volatility_20", ["desvio_20"])
+def _volatility_20(desvio, grupos):
+    return desvio
@@ -1,10 +1,12 @@
 import pandas as pd
 import psycopg2
 from psycopg2 import sql
-from tqdm import tqdm
+import io
 import os
 from dotenv import load_dotenv
 from datetime import datetime
+from almacenamiento import leer_tabla, leer_posteriores, guardar_tabla, existe_tabla, ruta_dataset
+from metricas import registrar_escritura
 
 # Cargar variables de entorno
 load_dotenv()
@@ -15,6 +17,10 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 
+# Con ETL_CARGA_DIFERENCIAL=1 las cargas por fecha también reenvían las filas ya cargadas que cambiaron
+CARGA_DIFERENCIAL = os.getenv("ETL_CARGA_DIFERENCIAL", "0") == "1"
+DIR_HUELLAS = "../../data/clean_data/huellas_carga/"
+
 def get_connection():
     """Establece conexión a la base de datos PostgreSQL."""
     return psycopg2.connect(
@@ -25,119 +31,311 @@ def get_connection():
         port=DB_PORT
     )
 
-def upsert_empresas(filepath):
-    """Carga o actualiza la tabla empresas."""
-    df = pd.read_csv(filepath)
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    insert_query = """
-        INSERT INTO empresas (ticker, name, sector, industry)
-        VALUES (%s, %s, %s, %s)
-        ON CONFLICT (ticker) DO UPDATE
-        SET name = EXCLUDED.name,
-            sector = EXCLUDED.sector,
-            industry = EXCLUDED.industry;
+def _copiar_y_upsert(conn, df, tabla, columnas, claves, actualizar=True, enteros=(), marca_agua=None):
     """
-
-    print("\n🏢 Cargando tabla de EMPRESAS...")
-    for _, row in tqdm(df.iterrows(), total=len(df)):
-        cursor.execute(insert_query, (
-            row['Ticker'], row['Name'], row['Sector'], row['Industry']
+    Carga `df` en `tabla` con COPY a una tabla temporal y un único INSERT ... ON CONFLICT.
+
+    `columnas` mapea columnas del DataFrame -> columnas de la tabla; las de `claves` forman la
+    clave de conflicto. Con `actualizar=True` se actualizan los registros existentes (como
+    DO UPDATE), si no se ignoran (DO NOTHING). Los NaN se cargan como NULL y las columnas de
+    `enteros` se redondean para poder copiarse a BIGINT/INTEGER.
+    Con DO UPDATE solo se escriben las filas cuyo contenido difiere del que ya está en la tabla:
+    las iguales no generan versiones nuevas (ni WAL, ni tuplas muertas para el autovacuum).
+    Si la clave es (date, ticker), en la misma transacción se avanza la marca de agua de cada
+    ticker en etl_watermarks (con el nombre `marca_agua`, por defecto `tabla`) y se anotan las
+    fechas insertadas/actualizadas en etl_fechas_pendientes (refresco de analiticas.py): si la
+    carga se corta no queda la marca avanzada con fechas sin refrescar. Las fechas van por tabla,
+    así las cargas en paralelo de tablas distintas no se esperan entre sí.
+    Devuelve {"insertados", "actualizados", "sin_cambios"}.
+    """
+    df = df.reindex(columns=list(columnas)).rename(columns=columnas)
+    # Igual que fila a fila: con DO UPDATE gana la última fila repetida, con DO NOTHING la primera
+    df = df.drop_duplicates(subset=claves, keep='last' if actualizar else 'first')
+    for columna in enteros:
+        df[columna] = pd.to_numeric(df[columna], errors='coerce').round().astype('Int64')
+
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False, na_rep='')
+    enviados = buffer.tell()
+    buffer.seek(0)
+
+    staging = sql.Identifier(f"{tabla}_staging")
+    por_fecha = {"date", "ticker"} <= set(claves)
+    lista_columnas = sql.SQL(', ').join(map(sql.Identifier, df.columns))
+    valores = [c for c in df.columns if c not in claves]
+
+    def fila(alias, nombres):
+        return sql.SQL('ROW({})').format(sql.SQL(', ').join(sql.Identifier(alias, c) for c in nombres))
+
+    filtro = sql.SQL('')
+    if actualizar and valores:
+        # Se descartan antes del INSERT las filas idénticas a las de la tabla (evita hasta el bloqueo
+        # de ON CONFLICT); el WHERE del DO UPDATE cubre lo que cambie entre medio
+        filtro = sql.SQL(
+            " WHERE NOT EXISTS (SELECT 1 FROM {tabla} AS a WHERE {claves_a} = {claves_s} "
+            "AND {valores_a} IS NOT DISTINCT FROM {valores_s})"
+        ).format(tabla=sql.Identifier(tabla), claves_a=fila('a', claves), claves_s=fila('s', claves),
+                 valores_a=fila('a', valores), valores_s=fila('s', valores))
+        conflicto = sql.SQL('DO UPDATE SET {} WHERE {} IS DISTINCT FROM {}').format(
+            sql.SQL(', ').join(sql.SQL('{0} = EXCLUDED.{0}').format(sql.Identifier(c)) for c in valores),
+            fila('t', valores), fila('excluded', valores),
+        )
+    else:
+        conflicto = sql.SQL('DO NOTHING')
+
+    with conn.cursor() as cursor:
+        cursor.execute(sql.SQL(
+            "CREATE TEMP TABLE {staging} (LIKE {tabla} INCLUDING DEFAULTS) ON COMMIT DROP;"
+        ).format(staging=staging, tabla=sql.Identifier(tabla)))
+        cursor.copy_expert(sql.SQL(
+            "COPY {staging} ({columnas}) FROM STDIN WITH (FORMAT csv)"
+        ).format(staging=staging, columnas=lista_columnas).as_string(conn), buffer)
+        # xmax = 0 solo en las filas recién insertadas: separa inserciones de actualizaciones.
+        # Con clave por fecha los conteos salen por fecha para saber qué fechas cambiaron
+        cursor.execute(sql.SQL(
+            "WITH cargadas AS ("
+            "INSERT INTO {tabla} AS t ({columnas}) SELECT {columnas} FROM {staging} AS s{filtro} "
+            "ON CONFLICT ({claves}) {conflicto} RETURNING (t.xmax = 0) AS insertada{fecha}) "
+            "SELECT {agrupar}COUNT(*) FILTER (WHERE insertada), COUNT(*) FILTER (WHERE NOT insertada) "
+            "FROM cargadas{por};"
+        ).format(
+            tabla=sql.Identifier(tabla), columnas=lista_columnas, staging=staging, filtro=filtro,
+            claves=sql.SQL(', ').join(map(sql.Identifier, claves)), conflicto=conflicto,
+            fecha=sql.SQL(', t.date') if por_fecha else sql.SQL(''),
+            agrupar=sql.SQL('date, ') if por_fecha else sql.SQL(''),
+            por=sql.SQL(' GROUP BY date ORDER BY date') if por_fecha else sql.SQL(''),
         ))
+        conteos = cursor.fetchall()
+        fechas = [fecha for fecha, *_ in conteos] if por_fecha else []
+        insertados = sum(int(c[-2] or 0) for c in conteos)
+        actualizados = sum(int(c[-1] or 0) for c in conteos)
+        if por_fecha:
+            cursor.execute(sql.SQL(
+                "INSERT INTO etl_watermarks (tabla, ticker, max_date) "
+                "SELECT %s, ticker, MAX(date) FROM {staging} GROUP BY ticker "
+                "ON CONFLICT (tabla, ticker) DO UPDATE "
+                "SET max_date = GREATEST(etl_watermarks.max_date, EXCLUDED.max_date);"
+            ).format(staging=staging), (marca_agua or tabla,))
+        if fechas:
+            cursor.execute(
+                "INSERT INTO etl_fechas_pendientes (tabla, date) SELECT %s, unnest(%s::date[]) ORDER BY 2 "
+                "ON CONFLICT DO NOTHING;", (marca_agua or tabla, fechas))
+    conn.commit()
+    registrar_escritura(insertados + actualizados, enviados)
+    return {"insertados": insertados, "actualizados": actualizados,
+            "sin_cambios": len(df) - insertados - actualizados}
+
+def _resumen_carga(conteo):
+    return (f"{conteo['insertados']} insertados, {conteo['actualizados']} actualizados, "
+            f"{conteo['sin_cambios']} sin cambios")
+
+# ================
+# Marcas de agua por ticker y detección de cambios
+# ================
+def _watermarks(conn, tabla):
+    """
+    Última fecha cargada de cada ticker en `tabla` (Serie ticker -> fecha).
 
+    Se leen de etl_watermarks; la primera vez se inicializan con un único
+    SELECT ticker, MAX(date) ... GROUP BY ticker sobre la tabla.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT ticker, max_date FROM etl_watermarks WHERE tabla = %s;", (tabla,))
+        filas = cursor.fetchall()
+        if not filas:
+            cursor.execute(sql.SQL(
+                "INSERT INTO etl_watermarks (tabla, ticker, max_date) "
+                "SELECT %s, ticker, MAX(date) FROM {} GROUP BY ticker "
+                "ON CONFLICT (tabla, ticker) DO NOTHING RETURNING ticker, max_date;"
+            ).format(sql.Identifier(tabla)), (tabla,))
+            filas = cursor.fetchall()
+    conn.commit()
+    return pd.Series(pd.to_datetime([fecha for _, fecha in filas]),
+                     index=[ticker for ticker, _ in filas], dtype="datetime64[ns]")
+
+def _leer_nuevos(conn, ruta, tabla):
+    """Lee del dataset solo las filas posteriores a la última fecha cargada de cada ticker en `tabla`."""
+    return leer_posteriores(ruta, _watermarks(conn, tabla))
+
+# Tablas con clave (date, ticker) cargadas por marca de agua
+TABLAS_POR_FECHA = ["precios_historicos", "indicadores_tecnicos", "precios_variaciones",
+                    "resumen_inversion_historico"]
+
+def retroceder_watermarks(desde, tablas=TABLAS_POR_FECHA):
+    """
+    Deja la marca de agua de cada ticker de `desde` (ticker -> fecha) justo antes de esa fecha en
+    `tablas`: la próxima carga vuelve a enviar sus filas desde ahí (p. ej. días anteriores a la
+    última fecha agregados por el relleno de huecos) y actualiza las que cambiaron.
+    """
+    if not desde:
+        return
+    conn = get_connection()
+    for tabla in tablas:
+        # Inicializa las marcas si la tabla todavía no tiene: si no, saldrían de MAX(date) después
+        _watermarks(conn, tabla)
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "UPDATE etl_watermarks AS w SET max_date = LEAST(w.max_date, d.desde - 1) "
+            "FROM unnest(%s::varchar[], %s::date[]) AS d (ticker, desde) "
+            "WHERE w.tabla = ANY(%s) AND w.ticker = d.ticker;",
+            (list(desde), list(desde.values()), list(tablas)))
     conn.commit()
-    cursor.close()
     conn.close()
-    print(f"✅ Empresas: {len(df)} registros insertados/actualizados.")
+    print(f"↩️ Marcas de agua retrocedidas para {len(desde)} tickers con días agregados en el historial.")
+
+def _huellas(df, columnas):
+    """Hash de 64 bits del contenido de cada fila (solo las columnas que se cargan)."""
+    return pd.util.hash_pandas_object(df[[c for c in columnas if c in df.columns]], index=False).to_numpy()
+
+def _leer_cambios(conn, ruta, tabla, columnas):
+    """
+    Filas del dataset nuevas o con contenido distinto al de la última carga diferencial.
+
+    Compara la huella de cada (Date, Ticker) con las guardadas en DIR_HUELLAS. Si la tabla no
+    tiene marcas (vacía o recreada) las huellas guardadas no valen y se envía todo.
+    Devuelve (filas a cargar, huellas de todo el dataset para guardar después de la carga).
+    """
+    df = leer_tabla(ruta)
+    huellas = pd.DataFrame({"Date": df["Date"], "Ticker": df["Ticker"], "Huella": _huellas(df, columnas)})
+    ruta_huellas = ruta_dataset(DIR_HUELLAS, tabla)
+    if _watermarks(conn, tabla).empty or not existe_tabla(ruta_huellas):
+        return df, huellas
+
+    iguales = huellas.merge(leer_tabla(ruta_huellas).assign(_igual=True),
+                            on=["Date", "Ticker", "Huella"], how="left")["_igual"].notna().to_numpy()
+    return df[~iguales].reset_index(drop=True), huellas
+
+def _guardar_huellas(tabla, huellas):
+    guardar_tabla(huellas, ruta_dataset(DIR_HUELLAS, tabla), en_memoria=False)
+
+def _filas_a_cargar(conn, ruta, tabla, columnas, diferencial):
+    """(filas a cargar, huellas o None) según el modo: por marca de agua o diferencial."""
+    if diferencial:
+        return _leer_cambios(conn, ruta, tabla, columnas)
+    return _leer_nuevos(conn, ruta, tabla), None
+
+def _crear_particiones_anuales(conn, tabla, fechas):
+    """Crea (si faltan) las particiones por año de `tabla` que cubren las fechas a cargar."""
+    with conn.cursor() as cursor:
+        for anio in sorted(pd.to_datetime(fechas).dt.year.unique()):
+            cursor.execute(
+                sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s);").format(
+                    sql.Identifier(f"{tabla}_{anio}"), sql.Identifier(tabla)),
+                (f"{anio}-01-01", f"{anio + 1}-01-01"),
+            )
+    conn.commit()
 
-def upsert_precios_historicos(filepath):
-    """Carga o actualiza precios históricos (solo los nuevos)."""
-    df = pd.read_csv(filepath)
-    df['Date'] = pd.to_datetime(df['Date'])
+def _esta_particionada(conn, tabla):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s);", (tabla,))
+        return cursor.fetchone() is not None
+
+def _cargar_por_particion(conn, df, tabla, columnas, claves, **opciones):
+    """
+    Carga `df` en una tabla particionada por año directamente en cada partición (tabla_AAAA),
+    creando las que falten: la carga diaria solo lee y bloquea la partición del año en curso.
+    Si la tabla todavía no fue migrada (Migracion_particiones.sql) se carga en la tabla entera.
+    """
+    if not _esta_particionada(conn, tabla):
+        return _copiar_y_upsert(conn, df, tabla, columnas, claves, **opciones)
+
+    _crear_particiones_anuales(conn, tabla, df["Date"])
+    conteo = {"insertados": 0, "actualizados": 0, "sin_cambios": 0}
+    for anio, parte in df.groupby(pd.to_datetime(df["Date"]).dt.year, sort=True):
+        parcial = _copiar_y_upsert(conn, parte, f"{tabla}_{anio}", columnas, claves, marca_agua=tabla, **opciones)
+        conteo = {clave: conteo[clave] + parcial[clave] for clave in conteo}
+    return conteo
+
+COLUMNAS_EMPRESAS = {"Ticker": "ticker", "Name": "name", "Sector": "sector", "Industry": "industry"}
+
+COLUMNAS_PRECIOS = {
+    "Date": "date", "Ticker": "ticker", "Open": "open", "High": "high",
+    "Low": "low", "Close": "close", "Volume": "volume"
+}
+
+COLUMNAS_FUNDAMENTALES = {
+    "Ticker": "ticker", "PER": "per", "ROE": "roe", "EPS Growth YoY": "eps_growth_yoy",
+    "Deuda/Patrimonio": "deuda_patrimonio", "Margen Neto": "margen_neto",
+    "Dividend Yield": "dividend_yield", "Market Cap": "market_cap",
+    "Ranking MarketCap": "ranking_marketcap", "Acciones en Circulación": "acciones_circulacion"
+}
+
+COLUMNAS_INDICADORES = {
+    "Date": "date", "Ticker": "ticker", "Close": "close",
+    "SMA_20": "sma_20", "SMA_50": "sma_50", "EMA_20": "ema_20", "RSI_14": "rsi_14",
+    "MACD": "macd", "MACD_Signal": "macd_signal", "MACD_Hist": "macd_hist",
+    "ATR_14": "atr_14", "OBV": "obv",
+    "BB_Middle": "bb_middle", "BB_Upper": "bb_upper", "BB_Lower": "bb_lower", "Volatility_20": "volatility_20",
+    "Fib_0.0%": "fib_0_0", "Fib_23.6%": "fib_23_6", "Fib_38.2%": "fib_38_2",
+    "Fib_50.0%": "fib_50_0", "Fib_61.8%": "fib_61_8", "Fib_100%": "fib_100",
+    "Nivel_Fib_Cercano": "nivel_fib_cercano", "Estado_Fibonacci": "estado_fibonacci",
+    "Fib_0.0%_6M": "fib_0_0_6m", "Fib_23.6%_6M": "fib_23_6_6m", "Fib_38.2%_6M": "fib_38_2_6m",
+    "Fib_50.0%_6M": "fib_50_0_6m", "Fib_61.8%_6M": "fib_61_8_6m", "Fib_100%_6M": "fib_100_6m",
+    "Nivel_Fib_Cercano_6M": "nivel_fib_cercano_6m", "Estado_Fibonacci_6M": "estado_fibonacci_6m"
+}
+
+COLUMNAS_RESUMEN = {
+    "Ticker": "ticker", "%_Tecnico_Buy": "pct_tecnico_buy", "%_Fundamental_Buy": "pct_fundamental_buy",
+    "Decision_Final": "decision_final", "Estado_BollingerBands": "estado_bollingerbands",
+    "SMA_vs_EMA": "sma_vs_ema", "MACD": "macd", "RSI": "rsi", "PER": "per", "ROE": "roe",
+    "EPS Growth YoY": "eps_growth_yoy", "Deuda/Patrimonio": "deuda_patrimonio",
+    "Estado_Fibonacci": "estado_fibonacci"
+}
+
+COLUMNAS_RESUMEN_HISTORICO = {"Date": "date", **COLUMNAS_RESUMEN}
+
+COLUMNAS_VARIACIONES = {
+    "Date": "date", "Ticker": "ticker", "Close": "close",
+    "var_daily": "var_daily", "var_weekly": "var_weekly", "var_monthly": "var_monthly",
+    "var_annual": "var_annual", "var_5y": "var_5y"
+}
+
+def upsert_empresas(filepath):
+    """Carga o actualiza la tabla empresas."""
+    df = leer_tabla(filepath, columnas=list(COLUMNAS_EMPRESAS))
 
     conn = get_connection()
-    cursor = conn.cursor()
+    print("\n🏢 Cargando tabla de EMPRESAS...")
+    conteo = _copiar_y_upsert(conn, df, "empresas", COLUMNAS_EMPRESAS, ["ticker"])
+    conn.close()
+    print(f"✅ Empresas: {_resumen_carga(conteo)}.")
 
-    cursor.execute("SELECT MAX(date) FROM precios_historicos;")
-    max_date_db = cursor.fetchone()[0]
+def upsert_precios_historicos(filepath, diferencial=CARGA_DIFERENCIAL):
+    """Carga precios históricos nuevos de cada ticker (y los modificados si `diferencial`)."""
+    conn = get_connection()
 
-    if max_date_db is not None:
-        df = df[df['Date'] > pd.to_datetime(max_date_db)]
+    df, huellas = _filas_a_cargar(conn, filepath, "precios_historicos", COLUMNAS_PRECIOS, diferencial)
 
     if df.empty:
         print("ℹ️ No hay nuevos precios históricos para cargar.")
         conn.close()
         return
 
-    insert_query = """
-        INSERT INTO precios_historicos (date, ticker, open, high, low, close, volume)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (date, ticker) DO NOTHING;
-    """
-
     print("\n📈 Cargando tabla de PRECIOS HISTORICOS...")
-    for _, row in tqdm(df.iterrows(), total=len(df)):
-        cursor.execute(insert_query, (
-            row['Date'], row['Ticker'], row['Open'], row['High'],
-            row['Low'], row['Close'], row['Volume']
-        ))
-
-    conn.commit()
-    cursor.close()
+    # En modo diferencial hay filas ya cargadas que cambiaron (p. ej. precios ajustados): se actualizan
+    conteo = _cargar_por_particion(conn, df, "precios_historicos", COLUMNAS_PRECIOS, ["date", "ticker"],
+                                   actualizar=diferencial, enteros=["volume"])
     conn.close()
-    print(f"✅ Precios históricos: {len(df)} registros insertados.")
+    if huellas is not None:
+        _guardar_huellas("precios_historicos", huellas)
+    print(f"✅ Precios históricos: {_resumen_carga(conteo)}.")
 
 def upsert_fundamentales(filepath):
     """Carga o actualiza los datos fundamentales."""
-    df = pd.read_csv(filepath)
-    
+    df = leer_tabla(filepath, columnas=list(COLUMNAS_FUNDAMENTALES))
+
     conn = get_connection()
-    cursor = conn.cursor()
-
-    insert_query = """
-    INSERT INTO indicadores_fundamentales (ticker, per, roe, eps_growth_yoy, deuda_patrimonio,
-                                           margen_neto, dividend_yield, market_cap, ranking_marketcap, acciones_circulacion)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    ON CONFLICT (ticker) DO UPDATE SET
-        per = EXCLUDED.per,
-        roe = EXCLUDED.roe,
-        eps_growth_yoy = EXCLUDED.eps_growth_yoy,
-        deuda_patrimonio = EXCLUDED.deuda_patrimonio,
-        margen_neto = EXCLUDED.margen_neto,
-        dividend_yield = EXCLUDED.dividend_yield,
-        market_cap = EXCLUDED.market_cap,
-        ranking_marketcap = EXCLUDED.ranking_marketcap,
-        acciones_circulacion = EXCLUDED.acciones_circulacion;
-    """
     print("\n📊 Cargando tabla de FUNDAMENTALES...")
-    for _, row in tqdm(df.iterrows(), total=len(df)):
-        cursor.execute(insert_query, (
-            row['Ticker'], row['PER'], row['ROE'], row['EPS Growth YoY'],
-            row['Deuda/Patrimonio'], row['Margen Neto'], row['Dividend Yield'],
-            row['Market Cap'], row['Ranking MarketCap'], row['Acciones en Circulación']
-        ))
-
-    conn.commit()
-    cursor.close()
+    conteo = _copiar_y_upsert(conn, df, "indicadores_fundamentales", COLUMNAS_FUNDAMENTALES, ["ticker"],
+                     enteros=["market_cap", "ranking_marketcap", "acciones_circulacion"])
     conn.close()
-    print(f"✅ Fundamentales: {len(df)} registros actualizados/insertados.")
+    print(f"✅ Fundamentales: {_resumen_carga(conteo)}.")
 
-def upsert_indicadores_tecnicos(csv_path):
+def upsert_indicadores_tecnicos(csv_path, diferencial=CARGA_DIFERENCIAL):
     """Carga incremental de indicadores técnicos incluyendo Fibonacci."""
     conn = get_connection()
-    cursor = conn.cursor()
 
-    df = pd.read_csv(csv_path)
-    df['Date'] = pd.to_datetime(df['Date'])
-
-    cursor.execute("SELECT MAX(date) FROM indicadores_tecnicos;")
-    max_date_db = cursor.fetchone()[0]
-    
-    if max_date_db:
-        max_date_db = pd.to_datetime(max_date_db)
-        df = df[df['Date'] > max_date_db]
+    df, huellas = _filas_a_cargar(conn, csv_path, "indicadores_tecnicos", COLUMNAS_INDICADORES, diferencial)
 
     if df.empty:
         print("ℹ️ No hay nuevos indicadores técnicos para cargar.")
@@ -145,121 +343,51 @@ def upsert_indicadores_tecnicos(csv_path):
         return
 
     print("📈 Cargando nuevos indicadores técnicos...")
-    for _, row in tqdm(df.iterrows(), total=len(df)):
-        insert_query = """
-            INSERT INTO indicadores_tecnicos (
-                date, ticker, close,
-                sma_20, sma_50, ema_20, rsi_14,
-                macd, macd_signal, macd_hist, atr_14, obv,
-                bb_middle, bb_upper, bb_lower, volatility_20,
-                fib_0_0, fib_23_6, fib_38_2, fib_50_0, fib_61_8, fib_100,
-                nivel_fib_cercano, estado_fibonacci
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (date, ticker) DO UPDATE SET
-                close = EXCLUDED.close,
-                sma_20 = EXCLUDED.sma_20,
-                sma_50 = EXCLUDED.sma_50,
-                ema_20 = EXCLUDED.ema_20,
-                rsi_14 = EXCLUDED.rsi_14,
-                macd = EXCLUDED.macd,
-                macd_signal = EXCLUDED.macd_signal,
-                macd_hist = EXCLUDED.macd_hist,
-                atr_14 = EXCLUDED.atr_14,
-                obv = EXCLUDED.obv,
-                bb_middle = EXCLUDED.bb_middle,
-                bb_upper = EXCLUDED.bb_upper,
-                bb_lower = EXCLUDED.bb_lower,
-                volatility_20 = EXCLUDED.volatility_20,
-                fib_0_0 = EXCLUDED.fib_0_0,
-                fib_23_6 = EXCLUDED.fib_23_6,
-                fib_38_2 = EXCLUDED.fib_38_2,
-                fib_50_0 = EXCLUDED.fib_50_0,
-                fib_61_8 = EXCLUDED.fib_61_8,
-                fib_100 = EXCLUDED.fib_100,
-                nivel_fib_cercano = EXCLUDED.nivel_fib_cercano,
-                estado_fibonacci = EXCLUDED.estado_fibonacci
-            ;
-        """
-        cursor.execute(insert_query, (
-            row['Date'], row['Ticker'], row['Close'],
-            row['SMA_20'], row['SMA_50'], row['EMA_20'], row['RSI_14'],
-            row['MACD'], row['MACD_Signal'], row['MACD_Hist'],
-            row['ATR_14'], row['OBV'],
-            row['BB_Middle'], row['BB_Upper'], row['BB_Lower'], row['Volatility_20'],
-            row['Fib_0.0%'], row['Fib_23.6%'], row['Fib_38.2%'], row['Fib_50.0%'], row['Fib_61.8%'], row['Fib_100%'],
-            row['Nivel_Fib_Cercano'], row['Estado_Fibonacci']
-        ))
-
-    conn.commit()
+    # Con actualizar=True se rehacen las filas recalculadas (ver retroceder_watermarks)
+    conteo = _cargar_por_particion(conn, df, "indicadores_tecnicos", COLUMNAS_INDICADORES, ["date", "ticker"],
+                                   actualizar=True, enteros=["obv"])
     conn.close()
-    print(f"✅ Indicadores técnicos cargados correctamente ({len(df)} registros nuevos).")
+    if huellas is not None:
+        _guardar_huellas("indicadores_tecnicos", huellas)
+    print(f"✅ Indicadores técnicos cargados correctamente ({_resumen_carga(conteo)}).")
 
 
 def upsert_resumen_inversion(csv_path):
     """Carga incremental de resumen de inversión actualizado (incluyendo Estado_Fibonacci correctamente)."""
     conn = get_connection()
-    cursor = conn.cursor()
 
-    df = pd.read_csv(csv_path)
+    df = leer_tabla(csv_path)
 
     print("🧠 Cargando resumen de inversión...")
-    for _, row in tqdm(df.iterrows(), total=len(df)):
-        insert_query = """
-            INSERT INTO resumen_inversion (
-                ticker, pct_tecnico_buy, pct_fundamental_buy, decision_final,
-                estado_bollingerbands, sma_vs_ema, macd, rsi, per, roe, 
-                eps_growth_yoy, deuda_patrimonio, estado_fibonacci
-            ) 
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (ticker) DO UPDATE SET
-                pct_tecnico_buy = EXCLUDED.pct_tecnico_buy,
-                pct_fundamental_buy = EXCLUDED.pct_fundamental_buy,
-                decision_final = EXCLUDED.decision_final,
-                estado_bollingerbands = EXCLUDED.estado_bollingerbands,
-                sma_vs_ema = EXCLUDED.sma_vs_ema,
-                macd = EXCLUDED.macd,
-                rsi = EXCLUDED.rsi,
-                per = EXCLUDED.per,
-                roe = EXCLUDED.roe,
-                eps_growth_yoy = EXCLUDED.eps_growth_yoy,
-                deuda_patrimonio = EXCLUDED.deuda_patrimonio,
-                estado_fibonacci = EXCLUDED.estado_fibonacci;
-        """
-        cursor.execute(insert_query, (
-            row['Ticker'],
-            row['%_Tecnico_Buy'],
-            row['%_Fundamental_Buy'],
-            row['Decision_Final'],
-            row.get('Estado_BollingerBands', None),
-            row.get('SMA_vs_EMA', None),
-            row.get('MACD', None),
-            row.get('RSI', None),
-            row.get('PER', None),
-            row.get('ROE', None),
-            row.get('EPS Growth YoY', None),
-            row.get('Deuda/Patrimonio', None),
-            row.get('Estado_Fibonacci', None)
-        ))
+    conteo = _copiar_y_upsert(conn, df, "resumen_inversion", COLUMNAS_RESUMEN, ["ticker"])
+    conn.close()
+    print(f"✅ Resumen de inversión cargado correctamente ({_resumen_carga(conteo)}).")
 
-    conn.commit()
-    cursor.close()
+def upsert_resumen_historico(ruta, diferencial=CARGA_DIFERENCIAL):
+    """Carga incremental del resumen de inversión histórico (tabla particionada por año)."""
+    conn = get_connection()
+
+    df, huellas = _filas_a_cargar(conn, ruta, "resumen_inversion_historico", COLUMNAS_RESUMEN_HISTORICO,
+                                  diferencial)
+
+    if df.empty:
+        print("ℹ️ No hay nuevas fechas de resumen histórico para cargar.")
+        conn.close()
+        return
+
+    print("🧠 Cargando resumen de inversión histórico...")
+    conteo = _cargar_por_particion(conn, df, "resumen_inversion_historico", COLUMNAS_RESUMEN_HISTORICO,
+                                   ["date", "ticker"], actualizar=True)
     conn.close()
-    print(f"✅ Resumen de inversión cargado correctamente ({len(df)} registros nuevos).")
+    if huellas is not None:
+        _guardar_huellas("resumen_inversion_historico", huellas)
+    print(f"✅ Resumen histórico cargado correctamente ({_resumen_carga(conteo)}).")
 
-def upsert_precios_variaciones(csv_path):
+def upsert_precios_variaciones(csv_path, diferencial=CARGA_DIFERENCIAL):
     """Carga incremental de variaciones de precios."""
     conn = get_connection()
-    cursor = conn.cursor()
-
-    df = pd.read_csv(csv_path)
-    df['Date'] = pd.to_datetime(df['Date'])
 
-    cursor.execute("SELECT MAX(date) FROM precios_variaciones;")
-    max_date_db = cursor.fetchone()[0]
-    
-    if max_date_db:
-        max_date_db = pd.to_datetime(max_date_db)
-        df = df[df['Date'] > max_date_db]
+    df, huellas = _filas_a_cargar(conn, csv_path, "precios_variaciones", COLUMNAS_VARIACIONES, diferencial)
 
     if df.empty:
         print("ℹ️ No hay nuevas variaciones de precios para cargar.")
@@ -267,30 +395,12 @@ def upsert_precios_variaciones(csv_path):
         return
 
     print("📈 Cargando nuevas variaciones de precios...")
-    for _, row in tqdm(df.iterrows(), total=len(df)):
-        insert_query = """
-            INSERT INTO precios_variaciones (
-                date, ticker, close,
-                var_daily, var_weekly, var_monthly, var_annual, var_5y
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (date, ticker) DO UPDATE SET
-                close = EXCLUDED.close,
-                var_daily = EXCLUDED.var_daily,
-                var_weekly = EXCLUDED.var_weekly,
-                var_monthly = EXCLUDED.var_monthly,
-                var_annual = EXCLUDED.var_annual,
-                var_5y = EXCLUDED.var_5y
-            ;
-        """
-        cursor.execute(insert_query, (
-            row['Date'], row['Ticker'], row['Close'],
-            row['var_daily'], row['var_weekly'], row['var_monthly'],
-            row['var_annual'], row['var_5y']
-        ))
-
-    conn.commit()
+    conteo = _copiar_y_upsert(conn, df, "precios_variaciones", COLUMNAS_VARIACIONES, ["date", "ticker"],
+                              actualizar=True)
     conn.close()
-    print(f"✅ Variaciones de precios cargadas correctamente ({len(df)} registros nuevos).")
+    if huellas is not None:
+        _guardar_huellas("precios_variaciones", huellas)
+    print(f"✅ Variaciones de precios cargadas correctamente ({_resumen_carga(conteo)}).")
 
 if __name__ == "__main__":
     print("⚙️ Ejecutando pruebas de carga manual...")
@@ -298,12 +408,13 @@ if __name__ == "__main__":
     # Actualizá los paths según necesites
     DIR_READY = "../../data/clean_data/"
 
-    upsert_empresas(DIR_READY + "empresas_ready.csv")
-    upsert_precios_historicos(DIR_READY + "precios_historicos_ready.csv")
-    upsert_fundamentales(DIR_READY + "indicadores_fundamentales_ready.csv")
-    upsert_indicadores_tecnicos(DIR_READY + "indicadores_tecnicos_ready.csv")
-    upsert_resumen_inversion(DIR_READY + "resumen_inversion_ready.csv")
-    upsert_precios_variaciones(DIR_READY + "precios_variaciones_ready.csv")
+    upsert_empresas(ruta_dataset(DIR_READY, "empresas_ready"))
+    upsert_precios_historicos(ruta_dataset(DIR_READY, "precios_historicos_ready"))
+    upsert_fundamentales(ruta_dataset(DIR_READY, "indicadores_fundamentales_ready"))
+    upsert_indicadores_tecnicos(ruta_dataset(DIR_READY, "indicadores_tecnicos_ready"))
+    upsert_resumen_inversion(ruta_dataset(DIR_READY, "resumen_inversion_ready"))
+    upsert_resumen_historico(ruta_dataset(DIR_READY, "resumen_inversion_historico_ready"))
+    upsert_precios_variaciones(ruta_dataset(DIR_READY, "precios_variaciones_ready"))
 
 
     print("\n✅ ¡Carga de todas las tablas finalizada correctamente!")
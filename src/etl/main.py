@@ -1,78 +1,124 @@
-from ext_diario import actualizar_datos_historicos, actualizar_fundamentales
-from transform import transformar_empresas, transformar_precios_historicos, transformar_indicadores_fundamentales, calcular_indicadores_tecnicos,calcular_resumen_inversion, calcular_variaciones_precios 
-from load import upsert_empresas, upsert_precios_historicos, upsert_fundamentales, upsert_indicadores_tecnicos,upsert_resumen_inversion, upsert_precios_variaciones
-from tqdm import tqdm
-import os
+from ext_diario import actualizar_datos_historicos, actualizar_fundamentales, confirmar_reescritos
+from transform import transformar_empresas, transformar_precios_historicos, transformar_indicadores_fundamentales, calcular_indicadores_tecnicos,calcular_resumen_inversion, calcular_resumen_historico, calcular_variaciones_precios, invalidar_estado_indicadores
+from load import retroceder_watermarks, upsert_empresas, upsert_precios_historicos, upsert_fundamentales, upsert_indicadores_tecnicos,upsert_resumen_inversion, upsert_resumen_historico, upsert_precios_variaciones
+from almacenamiento import ruta_dataset
+from matriz_precios import construir_matrices, DIR_MATRICES
+from analiticas import actualizar_tablas_analiticas
+from dag import Etapa, ejecutar_dag, orden_topologico
+import sys
 
 # Directorios
 DIR_RAW = "../../data/raw_data/"
 DIR_READY = "../../data/clean_data/"
 
-def main():
-    print("🚀 INICIANDO PROCESO COMPLETO DE ACTUALIZACIÓN 🚀")
+# Etapas que pueden correr a la vez (extracción, transformaciones y cargas independientes)
+MAX_ETAPAS_PARALELAS = 4
 
-    # ================
-    # EXTRACCIÓN (actualización diaria)
-    # ================
-    print("\n🔍 Etapa 1: ACTUALIZACIÓN DE DATOS")
-    actualizar_datos_historicos(
-        historicos_path=DIR_RAW + "nyse_top500_data.csv",
-        tickers_path=DIR_RAW + "top_500_marketcap.csv"
-    )
-    actualizar_fundamentales(
-        tickers_path=DIR_RAW + "top_500_marketcap.csv",
-        output_file=DIR_RAW + "nyse_top_500_fundamentals_indicators.csv"
-    )
+TOP500 = ruta_dataset(DIR_RAW, "top_500_marketcap")
+HISTORICOS_RAW = ruta_dataset(DIR_RAW, "nyse_top500_data")
+FUNDAMENTALES_RAW = ruta_dataset(DIR_RAW, "nyse_top_500_fundamentals_indicators")
+EMPRESAS = ruta_dataset(DIR_READY, "empresas_ready")
+PRECIOS = ruta_dataset(DIR_READY, "precios_historicos_ready")
+FUNDAMENTALES = ruta_dataset(DIR_READY, "indicadores_fundamentales_ready")
+TECNICOS = ruta_dataset(DIR_READY, "indicadores_tecnicos_ready")
+RESUMEN = ruta_dataset(DIR_READY, "resumen_inversion_ready")
+RESUMEN_HISTORICO = ruta_dataset(DIR_READY, "resumen_inversion_historico_ready")
+VARIACIONES = ruta_dataset(DIR_READY, "precios_variaciones_ready")
 
-    # ================
-    # TRANSFORMACIÓN
-    # ================
-    print("\n🔄 Etapa 2: TRANSFORMACIÓN DE DATOS")
-    transformar_empresas(
-        input_file=DIR_RAW + "top_500_marketcap.csv",
-        output_file=DIR_READY + "empresas_ready.csv"
-    )
+def actualizar_historicos():
+    """
+    Actualización diaria del historial. Si se rellenaron días anteriores a la última fecha de
+    algún ticker, se descartan los cálculos incrementales que partían del historial anterior y
+    se retroceden sus marcas de agua en la base para que las cargas envíen esas fechas.
+    Solo entonces se confirman: si algo falla, la próxima corrida lo vuelve a hacer.
+    """
+    reescritos = actualizar_datos_historicos(historicos_path=HISTORICOS_RAW, tickers_path=TOP500)
+    if reescritos:
+        invalidar_estado_indicadores(list(reescritos), resumen_historico_file=RESUMEN_HISTORICO)
+        retroceder_watermarks(reescritos)
+        confirmar_reescritos(HISTORICOS_RAW)
 
-    transformar_precios_historicos(
-        input_file=DIR_RAW + "nyse_top500_data.csv",
-        output_file=DIR_READY + "precios_historicos_ready.csv"
-    )
+def construir_etapas():
+    """Etapas del ETL diario con sus entradas/salidas. "db:<tabla>" marca una tabla ya cargada."""
+    return [
+        # EXTRACCIÓN (actualización diaria)
+        Etapa("actualizar_datos_historicos", actualizar_historicos,
+              entradas=[TOP500], salidas=[HISTORICOS_RAW]),
+        Etapa("actualizar_fundamentales",
+              lambda: actualizar_fundamentales(tickers_path=TOP500, output_file=FUNDAMENTALES_RAW),
+              entradas=[TOP500], salidas=[FUNDAMENTALES_RAW]),
 
-    transformar_indicadores_fundamentales(
-        input_file=DIR_RAW + "nyse_top_500_fundamentals_indicators.csv",
-        output_file=DIR_READY + "indicadores_fundamentales_ready.csv"
-    )
+        # TRANSFORMACIÓN
+        Etapa("transformar_empresas",
+              lambda: transformar_empresas(input_file=TOP500, output_file=EMPRESAS),
+              entradas=[TOP500], salidas=[EMPRESAS]),
+        Etapa("transformar_precios_historicos",
+              lambda: transformar_precios_historicos(input_file=HISTORICOS_RAW, output_file=PRECIOS),
+              entradas=[HISTORICOS_RAW], salidas=[PRECIOS]),
+        Etapa("construir_matrices_precios",
+              lambda: construir_matrices(input_file=PRECIOS, output_dir=DIR_MATRICES),
+              entradas=[PRECIOS], salidas=[DIR_MATRICES]),
+        Etapa("transformar_indicadores_fundamentales",
+              lambda: transformar_indicadores_fundamentales(input_file=FUNDAMENTALES_RAW, output_file=FUNDAMENTALES),
+              entradas=[FUNDAMENTALES_RAW], salidas=[FUNDAMENTALES]),
+        Etapa("calcular_indicadores_tecnicos",
+              lambda: calcular_indicadores_tecnicos(input_file=PRECIOS, output_file=TECNICOS, incremental=True),
+              entradas=[PRECIOS], salidas=[TECNICOS]),
+        Etapa("calcular_resumen_inversion",
+              lambda: calcular_resumen_inversion(
+                  precios_tecnicos_file=TECNICOS,
+                  fundamentales_file=FUNDAMENTALES,
+                  precios_historicos_file=PRECIOS,
+                  output_file=RESUMEN),
+              entradas=[TECNICOS, FUNDAMENTALES, PRECIOS], salidas=[RESUMEN]),
+        Etapa("calcular_resumen_historico",
+              lambda: calcular_resumen_historico(
+                  precios_tecnicos_file=TECNICOS,
+                  fundamentales_file=FUNDAMENTALES,
+                  output_file=RESUMEN_HISTORICO),
+              entradas=[TECNICOS, FUNDAMENTALES], salidas=[RESUMEN_HISTORICO]),
+        Etapa("calcular_variaciones_precios",
+              lambda: calcular_variaciones_precios(input_file=PRECIOS, output_file=VARIACIONES),
+              entradas=[PRECIOS], salidas=[VARIACIONES]),
 
-    calcular_indicadores_tecnicos(
-        input_file=DIR_READY + "precios_historicos_ready.csv",
-        output_file=DIR_READY + "indicadores_tecnicos_ready.csv"
-    )    
-    
-    calcular_resumen_inversion(  
-        precios_tecnicos_file=DIR_READY + "indicadores_tecnicos_ready.csv",
-        fundamentales_file=DIR_READY + "indicadores_fundamentales_ready.csv",
-        precios_historicos_file=DIR_READY + "precios_historicos_ready.csv",
-        output_file=DIR_READY + "resumen_inversion_ready.csv"
-    )
-    calcular_variaciones_precios(
-        input_file=DIR_READY + "precios_historicos_ready.csv",
-        output_file=DIR_READY + "precios_variaciones_ready.csv"
-    )
+        # CARGA (todas las tablas tienen FK a empresas)
+        Etapa("upsert_empresas", lambda: upsert_empresas(EMPRESAS),
+              entradas=[EMPRESAS], salidas=["db:empresas"]),
+        Etapa("upsert_precios_historicos", lambda: upsert_precios_historicos(PRECIOS),
+              entradas=[PRECIOS, "db:empresas"], salidas=["db:precios_historicos"]),
+        Etapa("upsert_fundamentales", lambda: upsert_fundamentales(FUNDAMENTALES),
+              entradas=[FUNDAMENTALES, "db:empresas"], salidas=["db:indicadores_fundamentales"]),
+        Etapa("upsert_indicadores_tecnicos", lambda: upsert_indicadores_tecnicos(TECNICOS),
+              entradas=[TECNICOS, "db:empresas"], salidas=["db:indicadores_tecnicos"]),
+        Etapa("upsert_resumen_inversion", lambda: upsert_resumen_inversion(RESUMEN),
+              entradas=[RESUMEN, "db:empresas"], salidas=["db:resumen_inversion"]),
+        Etapa("upsert_resumen_historico", lambda: upsert_resumen_historico(RESUMEN_HISTORICO),
+              entradas=[RESUMEN_HISTORICO, "db:empresas"], salidas=["db:resumen_inversion_historico"]),
+        Etapa("upsert_precios_variaciones", lambda: upsert_precios_variaciones(VARIACIONES),
+              entradas=[VARIACIONES, "db:empresas"], salidas=["db:precios_variaciones"]),
 
-    # ================
-    # CARGA
-    # ================
-    print("\n📥 Etapa 3: CARGA EN BASE DE DATOS")
-    upsert_empresas(DIR_READY + "empresas_ready.csv")
-    upsert_precios_historicos(DIR_READY + "precios_historicos_ready.csv")
-    upsert_fundamentales(DIR_READY + "indicadores_fundamentales_ready.csv")
-    upsert_indicadores_tecnicos(DIR_READY + "indicadores_tecnicos_ready.csv")
-    upsert_resumen_inversion(DIR_READY + "resumen_inversion_ready.csv")
-    upsert_precios_variaciones(DIR_READY + "precios_variaciones_ready.csv")
+        # TABLAS ANALÍTICAS (solo las fechas cargadas en esta corrida)
+        Etapa("actualizar_tablas_analiticas", actualizar_tablas_analiticas,
+              entradas=["db:precios_historicos", "db:indicadores_tecnicos", "db:precios_variaciones",
+                        "db:indicadores_fundamentales", "db:resumen_inversion"],
+              salidas=["db:tablas_analiticas"]),
+    ]
 
-    print("\n🎯 ¡PROCESO COMPLETO SIN ERRORES! 🎯")
+def main(solo=None):
+    """
+    Ejecuta el ETL completo (o solo las etapas indicadas) como un DAG: las etapas independientes
+    corren en paralelo y los datasets pasan de una etapa a otra en memoria.
+    """
+    print("🚀 INICIANDO PROCESO COMPLETO DE ACTUALIZACIÓN 🚀")
+    etapas = construir_etapas()
+    for i, nivel in enumerate(orden_topologico(etapas), 1):
+        print(f"   {i}. {', '.join(nivel)}")
 
-if __name__ == "__main__":
-    main()
+    ejecutar_dag(etapas, max_workers=MAX_ETAPAS_PARALELAS, solo=solo)
 
+    print("\n🎯 ¡PROCESO COMPLETO SIN ERRORES! 🎯")
 
+if __name__ == "__main__":
+    # python main.py                        -> todo el proceso
+    # python main.py calcular_resumen_inversion upsert_resumen_inversion -> solo esas etapas
+    main(solo=sys.argv[1:] or None)
@@ -0,0 +1,129 @@
+import os
+import json
+import shutil
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from almacenamiento import leer_tabla, ruta_dataset
+
+DIR_READY = "../../data/clean_data/"
+DIR_MATRICES = DIR_READY + "matriz_precios/"
+
+COLUMNAS_OHLCV = ["Open", "High", "Low", "Close", "Volume"]
+META = "_meta.json"
+
+def construir_matrices(input_file=ruta_dataset(DIR_READY, "precios_historicos_ready"), output_dir=DIR_MATRICES):
+    """
+    Escribe las matrices densas fechas x tickers de OHLCV como .npy (una por columna, float64 con
+    NaN donde no hay dato) más los índices de fechas y tickers.
+
+    Se escribe en un directorio temporal y se reemplaza al final: los procesos que ya tienen
+    mapeadas las matrices anteriores siguen leyéndolas sin problema.
+    """
+    print("🧮 Construyendo matrices de precios fechas x tickers...")
+    df = leer_tabla(input_file, columnas=["Date", "Ticker"] + COLUMNAS_OHLCV)
+
+    codigos_fecha, fechas = pd.factorize(df["Date"], sort=True)
+    codigos_ticker, tickers = pd.factorize(df["Ticker"], sort=True)
+    forma = (len(fechas), len(tickers))
+
+    temporal = output_dir.rstrip("/") + ".tmp"
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+
+    for columna in COLUMNAS_OHLCV:
+        matriz = np.lib.format.open_memmap(os.path.join(temporal, f"{columna}.npy"), mode="w+",
+                                           dtype="float64", shape=forma)
+        matriz[:] = np.nan
+        matriz[codigos_fecha, codigos_ticker] = df[columna].to_numpy(dtype="float64", na_value=np.nan)
+        matriz.flush()
+        del matriz
+
+    np.save(os.path.join(temporal, "fechas.npy"), pd.DatetimeIndex(fechas).to_numpy(dtype="datetime64[ns]"))
+    with open(os.path.join(temporal, "tickers.json"), "w", encoding="utf-8") as f:
+        json.dump([str(t) for t in tickers], f)
+    with open(os.path.join(temporal, META), "w", encoding="utf-8") as f:
+        json.dump({"forma": list(forma), "columnas": COLUMNAS_OHLCV,
+                   "generado": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}, f, indent=2)
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(temporal, output_dir.rstrip("/"))
+    print(f"✅ Matrices de precios guardadas en: {output_dir} ({forma[0]} fechas x {forma[1]} tickers)")
+
+class MatrizPrecios:
+    """
+    Acceso de solo lectura a las matrices de precios mapeadas en memoria.
+
+    Las matrices se abren con mmap (mmap_mode="r"): varios procesos comparten las mismas
+    páginas del sistema operativo y solo se leen del disco las partes que se usan.
+
+    Ejemplo:
+        m = MatrizPrecios()
+        close = m.ventana("Close", desde="2024-01-01")            # vista, sin copia
+        sub = m.ventana("Close", tickers=["AAPL", "MSFT"])        # copia (columnas no contiguas)
+    """
+
+    def __init__(self, directorio=DIR_MATRICES):
+        self.directorio = directorio
+        self.fechas = pd.DatetimeIndex(np.load(os.path.join(directorio, "fechas.npy")))
+        with open(os.path.join(directorio, "tickers.json"), encoding="utf-8") as f:
+            self.tickers = pd.Index(json.load(f))
+        self._matrices = {}
+
+    @property
+    def forma(self):
+        return len(self.fechas), len(self.tickers)
+
+    def matriz(self, columna):
+        """Matriz completa de `columna` (np.memmap de solo lectura)."""
+        if columna not in self._matrices:
+            self._matrices[columna] = np.load(os.path.join(self.directorio, f"{columna}.npy"), mmap_mode="r")
+        return self._matrices[columna]
+
+    def filas(self, desde=None, hasta=None):
+        """slice de filas para el rango de fechas [desde, hasta] (ambos incluidos)."""
+        inicio = 0 if desde is None else self.fechas.searchsorted(pd.Timestamp(desde), side="left")
+        fin = len(self.fechas) if hasta is None else self.fechas.searchsorted(pd.Timestamp(hasta), side="right")
+        return slice(inicio, fin)
+
+    def columnas(self, tickers=None):
+        """slice (si los tickers son contiguos en el índice) o array de posiciones de los tickers."""
+        if tickers is None:
+            return slice(0, len(self.tickers))
+        posiciones = self.tickers.get_indexer(list(tickers))
+        if (posiciones < 0).any():
+            faltan = [t for t, p in zip(tickers, posiciones) if p < 0]
+            raise KeyError(f"Tickers sin precios: {faltan}")
+        if len(posiciones) and np.array_equal(posiciones, np.arange(posiciones[0], posiciones[0] + len(posiciones))):
+            return slice(int(posiciones[0]), int(posiciones[-1]) + 1)
+        return posiciones
+
+    def ventana(self, columna, tickers=None, desde=None, hasta=None):
+        """
+        Submatriz de `columna` para un rango de fechas y un conjunto de tickers.
+
+        Es una vista sin copia sobre el archivo mapeado salvo que los tickers no sean
+        contiguos en el índice (orden alfabético), en cuyo caso NumPy tiene que copiar.
+        """
+        return self.matriz(columna)[self.filas(desde, hasta), self.columnas(tickers)]
+
+    def dataframe(self, columna, tickers=None, desde=None, hasta=None):
+        """La ventana como DataFrame ancho (índice Date, una columna por ticker), sin copiar si es vista."""
+        filas, columnas = self.filas(desde, hasta), self.columnas(tickers)
+        return pd.DataFrame(self.matriz(columna)[filas, columnas],
+                            index=self.fechas[filas], columns=self.tickers[columnas], copy=False)
+
+    def tidy(self, tickers=None, desde=None, hasta=None, columnas=COLUMNAS_OHLCV):
+        """Formato largo (Date, Ticker, columnas...) como precios_historicos_ready, sin filas vacías."""
+        filas, cols = self.filas(desde, hasta), self.columnas(tickers)
+        fechas, tickers_sel = self.fechas[filas], self.tickers[cols]
+        datos = {c: self.matriz(c)[filas, cols].ravel(order="F") for c in columnas}
+        df = pd.DataFrame({
+            "Date": np.tile(fechas.to_numpy(), len(tickers_sel)),
+            "Ticker": np.repeat(tickers_sel.to_numpy(), len(fechas)),
+            **datos,
+        })
+        return df[~np.all([np.isnan(v) for v in datos.values()], axis=0)].reset_index(drop=True)
+
+if __name__ == "__main__":
+    construir_matrices()
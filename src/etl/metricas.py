@@ -0,0 +1,305 @@
+import os
+import sys
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from dotenv import load_dotenv
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+load_dotenv()
+
+# ================
+# Métricas por etapa del ETL
+# ================
+# dag.ejecutar_dag mide cada etapa con `medir_etapa`:
+# - segundos y CPU: CPU del hilo de la etapa más la que informan sus shards de paralelo.py (cada
+#   proceso mide su process_time: son hijos del forkserver, RUSAGE_CHILDREN no los ve).
+# - filas y bytes leídos/escritos: los registra almacenamiento.py (tamaño en disco de los
+#   datasets; 0 bytes si el dataset se sirvió de la memoria compartida) y load.py (filas
+#   insertadas/actualizadas y bytes enviados por COPY).
+# - RSS pico del proceso mientras corre la etapa (muestreado; incluye las etapas simultáneas).
+# Al final de la corrida se agregan a `etapas.jsonl` (una línea por etapa) y se reescribe
+# `etl.prom` en formato textfile de Prometheus (node_exporter --collector.textfile).
+
+METRICAS = os.getenv("ETL_METRICAS", "1") == "1"
+DIR_METRICAS = os.getenv("ETL_METRICAS_DIR", "../../data/metricas/")
+# ETL_PERFILAR=calcular_indicadores_tecnicos,upsert_indicadores_tecnicos (o "*" = todas) guarda un
+# perfil por etapa en DIR_METRICAS/perfiles/ con ETL_PERFILADOR=cprofile (.prof) o pyinstrument (.html)
+PERFILAR = {e.strip() for e in os.getenv("ETL_PERFILAR", "").split(",") if e.strip()}
+PERFILADOR = os.getenv("ETL_PERFILADOR", "cprofile")
+INTERVALO_RSS = 0.05  # segundos entre muestras de memoria
+UMBRAL_REGRESION = 1.25  # `python metricas.py` marca las etapas que tardan más que esto x la mediana
+
+_etapa_actual = contextvars.ContextVar("etapa_actual", default=None)
+
+class MedicionEtapa:
+    """Métricas de una ejecución de una etapa."""
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.inicio = datetime.now()
+        self.segundos = 0.0
+        self.cpu_segundos = 0.0
+        self.filas_leidas = 0
+        self.filas_escritas = 0
+        self.bytes_leidos = 0
+        self.bytes_escritos = 0
+        self.rss_pico = 0
+        self.exito = False
+        self.error = None
+        self.perfil = None
+        self._lock = threading.Lock()
+
+    @property
+    def filas_por_segundo(self):
+        return max(self.filas_leidas, self.filas_escritas) / self.segundos if self.segundos else 0.0
+
+    def a_dict(self):
+        return {
+            "etapa": self.nombre, "inicio": self.inicio.isoformat(timespec="seconds"),
+            "segundos": round(self.segundos, 3), "cpu_segundos": round(self.cpu_segundos, 3),
+            "filas_leidas": self.filas_leidas, "filas_escritas": self.filas_escritas,
+            "filas_por_segundo": round(self.filas_por_segundo, 1),
+            "bytes_leidos": self.bytes_leidos, "bytes_escritos": self.bytes_escritos,
+            "rss_pico": self.rss_pico, "exito": self.exito, "error": self.error, "perfil": self.perfil,
+        }
+
+# ================
+# Registro desde almacenamiento.py / load.py
+# ================
+def midiendo():
+    """True si hay una etapa midiéndose en este hilo (para no calcular tamaños en vano)."""
+    return _etapa_actual.get() is not None
+
+def registrar_lectura(filas, bytes_leidos=0):
+    medicion = _etapa_actual.get()
+    if medicion is not None:
+        with medicion._lock:
+            medicion.filas_leidas += int(filas)
+            medicion.bytes_leidos += int(bytes_leidos)
+
+def registrar_cpu(segundos):
+    """CPU consumida fuera del hilo de la etapa (procesos de paralelo.py) que se le suma."""
+    medicion = _etapa_actual.get()
+    if medicion is not None:
+        with medicion._lock:
+            medicion.cpu_segundos += float(segundos)
+
+def registrar_escritura(filas, bytes_escritos=0):
+    medicion = _etapa_actual.get()
+    if medicion is not None:
+        with medicion._lock:
+            medicion.filas_escritas += int(filas)
+            medicion.bytes_escritos += int(bytes_escritos)
+
+@contextmanager
+def sin_medir():
+    """Lecturas/escrituras internas (p. ej. shards temporales) que no cuentan para la etapa."""
+    token = _etapa_actual.set(None)
+    try:
+        yield
+    finally:
+        _etapa_actual.reset(token)
+
+def tamanio_en_disco(ruta):
+    """Bytes de un archivo o de todos los archivos de un directorio (0 si no existe)."""
+    ruta = ruta.rstrip("/")
+    if os.path.isfile(ruta):
+        return os.path.getsize(ruta)
+    total = 0
+    for raiz, _, archivos in os.walk(ruta):
+        for archivo in archivos:
+            try:
+                total += os.path.getsize(os.path.join(raiz, archivo))
+            except FileNotFoundError:
+                pass
+    return total
+
+# ================
+# Medición de una etapa
+# ================
+def _rss_actual():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+class _MuestreadorRSS:
+    """Un hilo que muestrea la memoria del proceso mientras haya etapas midiéndose."""
+
+    def __init__(self):
+        self._activas = set()
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    def agregar(self, medicion):
+        with self._lock:
+            self._activas.add(medicion)
+            medicion.rss_pico = max(medicion.rss_pico, _rss_actual())
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._muestrear, name="metricas-rss", daemon=True)
+                self._hilo.start()
+
+    def quitar(self, medicion):
+        with self._lock:
+            self._activas.discard(medicion)
+            medicion.rss_pico = max(medicion.rss_pico, _rss_actual())
+
+    def _muestrear(self):
+        while True:
+            time.sleep(INTERVALO_RSS)
+            rss = _rss_actual()
+            with self._lock:
+                if not self._activas:
+                    self._hilo = None
+                    return
+                for medicion in self._activas:
+                    medicion.rss_pico = max(medicion.rss_pico, rss)
+
+_muestreador = _MuestreadorRSS()
+
+def _iniciar_perfil(nombre):
+    if not (PERFILAR & {nombre, "*"}):
+        return None
+    if PERFILADOR == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+            perfil = Profiler()
+            perfil.start()
+            return perfil
+        except ImportError:
+            print("⚠️ pyinstrument no está instalado: se usa cProfile.")
+    import cProfile
+    perfil = cProfile.Profile()
+    try:
+        perfil.enable()
+    except ValueError as e:  # Python 3.12+: un solo cProfile activo por proceso
+        print(f"⚠️ No se pudo perfilar {nombre}: {e}")
+        return None
+    return perfil
+
+def _guardar_perfil(perfil, nombre, dir_metricas):
+    directorio = os.path.join(dir_metricas, "perfiles")
+    os.makedirs(directorio, exist_ok=True)
+    base = os.path.join(directorio, f"{nombre}_{datetime.now():%Y%m%d_%H%M%S}")
+    if hasattr(perfil, "output_html"):
+        perfil.stop()
+        ruta = base + ".html"
+        with open(ruta, "w", encoding="utf-8") as f:
+            f.write(perfil.output_html())
+    else:
+        perfil.disable()
+        ruta = base + ".prof"
+        perfil.dump_stats(ruta)  # python -m pstats <ruta> / snakeviz <ruta>
+    return ruta
+
+@contextmanager
+def medir_etapa(nombre, mediciones=None, dir_metricas=DIR_METRICAS):
+    """
+    Mide la etapa que corre dentro del bloque (en el hilo actual) y agrega la medición a
+    `mediciones`, también si la etapa falla.
+    """
+    medicion = MedicionEtapa(nombre)
+    token = _etapa_actual.set(medicion)
+    _muestreador.agregar(medicion)
+    perfil = _iniciar_perfil(nombre)
+    inicio, cpu_hilo = time.perf_counter(), time.thread_time()
+    try:
+        yield medicion
+        medicion.exito = True
+    except Exception as e:
+        medicion.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        medicion.segundos = time.perf_counter() - inicio
+        medicion.cpu_segundos += time.thread_time() - cpu_hilo
+        if perfil is not None:
+            medicion.perfil = _guardar_perfil(perfil, nombre, dir_metricas)
+        _muestreador.quitar(medicion)
+        _etapa_actual.reset(token)
+        if mediciones is not None:
+            mediciones.append(medicion)
+
+# ================
+# Salidas: JSON lines y textfile de Prometheus
+# ================
+_METRICAS_PROMETHEUS = [
+    ("segundos", "etl_etapa_duracion_segundos", "Duración de la etapa"),
+    ("cpu_segundos", "etl_etapa_cpu_segundos", "CPU de la etapa (hilo + procesos de paralelo.py)"),
+    ("filas_leidas", "etl_etapa_filas_leidas", "Filas leídas de datasets"),
+    ("filas_escritas", "etl_etapa_filas_escritas", "Filas escritas en datasets o en la base"),
+    ("filas_por_segundo", "etl_etapa_filas_por_segundo", "Filas procesadas por segundo"),
+    ("rss_pico", "etl_etapa_rss_pico_bytes", "Memoria residente pico del proceso durante la etapa"),
+    ("bytes_leidos", "etl_etapa_bytes_leidos", "Bytes leídos de datasets"),
+    ("bytes_escritos", "etl_etapa_bytes_escritos", "Bytes escritos en datasets o enviados a la base"),
+    ("exito", "etl_etapa_exito", "1 si la etapa terminó sin errores"),
+]
+
+def _texto_prometheus(mediciones, fin):
+    lineas = []
+    for campo, metrica, ayuda in _METRICAS_PROMETHEUS:
+        lineas += [f"# HELP {metrica} {ayuda}", f"# TYPE {metrica} gauge"]
+        lineas += [f'{metrica}{{etapa="{m.nombre}"}} {float(getattr(m, campo)):g}' for m in mediciones]
+    lineas += ["# HELP etl_ultima_ejecucion_timestamp_segundos Fin de la última corrida del ETL",
+               "# TYPE etl_ultima_ejecucion_timestamp_segundos gauge",
+               f"etl_ultima_ejecucion_timestamp_segundos {fin:.0f}"]
+    return "\n".join(lineas) + "\n"
+
+def guardar_metricas(mediciones, dir_metricas=DIR_METRICAS):
+    """Agrega las mediciones a etapas.jsonl y reescribe etl.prom (atómico, para node_exporter)."""
+    if not mediciones:
+        return
+    os.makedirs(dir_metricas, exist_ok=True)
+    ejecucion = min(m.inicio for m in mediciones).strftime("%Y%m%d%H%M%S")
+    with open(os.path.join(dir_metricas, "etapas.jsonl"), "a", encoding="utf-8") as f:
+        for medicion in mediciones:
+            f.write(json.dumps({"ejecucion": ejecucion, **medicion.a_dict()}, ensure_ascii=False) + "\n")
+
+    ruta_prom = os.path.join(dir_metricas, "etl.prom")
+    with open(ruta_prom + ".tmp", "w", encoding="utf-8") as f:
+        f.write(_texto_prometheus(mediciones, time.time()))
+    os.replace(ruta_prom + ".tmp", ruta_prom)
+
+def resumen(mediciones):
+    """Tabla de la corrida: tiempo, CPU, filas/s y memoria por etapa."""
+    print(f"\n⏱️ {'Etapa':<38} {'seg':>8} {'CPU':>8} {'filas/s':>12} {'RSS pico':>10} {'leído':>10} {'escrito':>10}")
+    for m in sorted(mediciones, key=lambda m: -m.segundos):
+        print(f"   {m.nombre:<38} {m.segundos:>8.1f} {m.cpu_segundos:>8.1f} {m.filas_por_segundo:>12,.0f} "
+              f"{m.rss_pico / 2**20:>8.0f}MB {m.bytes_leidos / 2**20:>8.1f}MB {m.bytes_escritos / 2**20:>8.1f}MB"
+              f"{'' if m.exito else '  ❌'}")
+
+def comparar_ejecuciones(dir_metricas=DIR_METRICAS, anteriores=5, umbral=UMBRAL_REGRESION):
+    """Compara cada etapa de la última corrida con la mediana de sus `anteriores` corridas exitosas."""
+    import pandas as pd
+    ruta = os.path.join(dir_metricas, "etapas.jsonl")
+    if not os.path.exists(ruta):
+        print(f"❌ No hay métricas en {ruta}")
+        return None
+    df = pd.read_json(ruta, lines=True, dtype={"ejecucion": str})
+    ultima = df[df["ejecucion"] == df["ejecucion"].max()].set_index("etapa")
+    previas = df[(df["ejecucion"] < df["ejecucion"].max()) & df["exito"]]
+    previas = previas.sort_values("ejecucion").groupby("etapa").tail(anteriores)
+    referencia = previas.groupby("etapa")[["segundos", "cpu_segundos", "rss_pico", "filas_por_segundo"]].median()
+
+    comparacion = ultima[["segundos", "cpu_segundos", "rss_pico", "filas_por_segundo"]].join(
+        referencia, rsuffix="_mediana", how="left")
+    comparacion["x_segundos"] = comparacion["segundos"] / comparacion["segundos_mediana"]
+    comparacion["x_rss"] = comparacion["rss_pico"] / comparacion["rss_pico_mediana"]
+    comparacion["regresion"] = (comparacion["x_segundos"] > umbral) | (comparacion["x_rss"] > umbral)
+    print(comparacion[["segundos", "segundos_mediana", "x_segundos", "x_rss", "regresion"]]
+          .sort_values("x_segundos", ascending=False).round(2).to_string())
+    return comparacion
+
+if __name__ == "__main__":
+    # python metricas.py [anteriores]  -> última corrida vs mediana de las anteriores, por etapa
+    comparar_ejecuciones(anteriores=int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,111 @@
+import os
+import time
+import atexit
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from almacenamiento import leer_tabla, guardar_tabla, ruta_dataset
+from metricas import sin_medir, registrar_cpu
+
+load_dotenv()
+
+# Procesos para los cálculos por ticker (ETL_PROCESOS=1 fuerza el modo serie). Es el total del
+# ETL: las etapas que corren a la vez en el DAG comparten un único pool de este tamaño
+PROCESOS = int(os.getenv("ETL_PROCESOS", str(os.cpu_count() or 1)))
+MIN_FILAS_POR_SHARD = 100_000  # por debajo no compensa arrancar procesos
+
+_pool = None
+_lock_pool = threading.Lock()
+
+def _contexto():
+    # forkserver/spawn: no se hereda el estado de los hilos del DAG (fork con hilos puede bloquearse)
+    metodos = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in metodos else "spawn")
+
+def _pool_compartido():
+    """Pool de PROCESOS procesos compartido por todas las llamadas (se crea la primera vez)."""
+    global _pool
+    with _lock_pool:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PROCESOS, mp_context=_contexto())
+        return _pool
+
+def _descartar_pool(pool):
+    """Saca de uso un pool roto: la próxima llamada arranca uno nuevo."""
+    global _pool
+    with _lock_pool:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+@atexit.register
+def cerrar_pool():
+    """Termina los procesos del pool compartido (si se llegó a crear)."""
+    global _pool
+    with _lock_pool:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+def _ejecutar_shard(funcion, entrada, salida):
+    """
+    Trabajo de un proceso: lee su shard del disco, calcula y deja el resultado en otro archivo.
+    Devuelve también la CPU que usó, para sumarla a la etapa (ver metricas.py).
+    """
+    cpu = time.process_time()
+    guardar_tabla(funcion(leer_tabla(entrada)), salida)
+    return salida, time.process_time() - cpu
+
+def shards_por_ticker(tickers, n):
+    """Reparte los tickers ordenados en `n` rangos contiguos (el resultado no depende de `n`)."""
+    return np.array_split(np.sort(np.asarray(tickers, dtype=object)), n)
+
+def aplicar_por_ticker(funcion, df, procesos=None, min_filas=MIN_FILAS_POR_SHARD):
+    """
+    Aplica `funcion(df_shard) -> DataFrame` repartiendo el universo por ticker entre procesos.
+
+    `funcion` tiene que ser de nivel de módulo y calcular cada ticker de forma independiente
+    (rolling/ewm/pct_change por ticker). Los shards se pasan por archivos temporales (Parquet si
+    está disponible) en lugar de serializar DataFrames completos, y los resultados se unen en
+    el orden de los tickers, así que la salida es la misma que en serie. Los shards van al pool
+    compartido: dos etapas simultáneas no ocupan más de PROCESOS procesos entre las dos.
+
+    Si hay un solo proceso, pocos datos o el pool no puede arrancar, se ejecuta en serie.
+    """
+    procesos = PROCESOS if procesos is None else procesos
+    tickers = df["Ticker"].dropna().unique()
+    n = min(procesos, len(tickers), max(1, len(df) // min_filas))
+    if n <= 1:
+        return funcion(df)
+
+    shards = shards_por_ticker(tickers, n)
+    shard_de_ticker = {ticker: i for i, shard in enumerate(shards) for ticker in shard}
+    asignacion = df["Ticker"].map(shard_de_ticker)
+
+    # Los shards temporales no cuentan como lecturas/escrituras de la etapa (ver metricas.py)
+    with tempfile.TemporaryDirectory(prefix="etl_shards_") as directorio, sin_medir():
+        trabajos = []
+        for i, parte in df.groupby(asignacion, sort=True):
+            entrada = ruta_dataset(directorio, f"entrada_{int(i)}")
+            guardar_tabla(parte, entrada, en_memoria=False)
+            trabajos.append((entrada, ruta_dataset(directorio, f"salida_{int(i)}")))
+        del asignacion
+
+        pool = None
+        try:
+            pool = _pool_compartido()
+            hechos = [f.result() for f in [pool.submit(_ejecutar_shard, funcion, e, s) for e, s in trabajos]]
+        except (BrokenProcessPool, OSError) as e:
+            if pool is not None:
+                _descartar_pool(pool)
+            print(f"⚠️ No se pudo usar el pool de procesos ({e}); se calcula en serie.")
+            return funcion(df)
+
+        resultado = pd.concat([leer_tabla(salida) for salida, _ in hechos], ignore_index=True)
+    registrar_cpu(sum(cpu for _, cpu in hechos))
+    return resultado
@@ -0,0 +1,113 @@
+import json
+import operator
+import numpy as np
+import pandas as pd
+
+# ================
+# Reglas de señales del resumen de inversión
+# ================
+# Cada regla asigna una etiqueta por fila según la primera condición que se cumpla y
+# `si_no` si no se cumple ninguna. Si `columna` (o alguna columna referenciada con
+# {"columna": ...}) es nula, la señal queda vacía (NaN) y no cuenta en los porcentajes.
+# `grupo`: "tecnico" y "fundamental" votan en la decisión final; "informativo" no.
+REGLAS_POR_DEFECTO = [
+    {"senal": "SMA_vs_EMA", "grupo": "tecnico", "columna": "SMA_20",
+     "condiciones": [[">", {"columna": "EMA_20"}, "COMPRAR"]], "si_no": "VENDER"},
+    {"senal": "MACD", "grupo": "tecnico", "columna": "MACD",
+     "condiciones": [[">", {"columna": "MACD_Signal"}, "COMPRAR"]], "si_no": "VENDER"},
+    {"senal": "RSI", "grupo": "tecnico", "columna": "RSI_14",
+     "condiciones": [["<", 30, "COMPRAR"], [">", 70, "VENDER"]], "si_no": "MANTENER"},
+    {"senal": "Estado_BollingerBands", "grupo": "informativo", "columna": "Close",
+     "condiciones": [[">", {"columna": "BB_Upper"}, "Sobrecompra"], ["<", {"columna": "BB_Lower"}, "Sobreventa"]],
+     "si_no": "Normal"},
+    {"senal": "Senal_Fibonacci", "grupo": "tecnico", "columna": "Estado_Fibonacci",
+     "condiciones": [["==", "SOPORTE", "COMPRAR"], ["==", "RESISTENCIA", "VENDER"]], "si_no": "MANTENER"},
+    {"senal": "PER", "grupo": "fundamental", "columna": "PER",
+     "condiciones": [["<", 20, "COMPRAR"], [">", 30, "VENDER"]], "si_no": "MANTENER"},
+    {"senal": "ROE", "grupo": "fundamental", "columna": "ROE",
+     "condiciones": [[">", 0.15, "COMPRAR"], ["<", 0.05, "VENDER"]], "si_no": "MANTENER"},
+    {"senal": "EPS Growth YoY", "grupo": "fundamental", "columna": "EPS Growth YoY",
+     "condiciones": [[">", 0.10, "COMPRAR"], ["<", 0, "VENDER"]], "si_no": "MANTENER"},
+    {"senal": "Deuda/Patrimonio", "grupo": "fundamental", "columna": "Deuda/Patrimonio",
+     "condiciones": [["<", 100, "COMPRAR"], [">", 200, "VENDER"]], "si_no": "MANTENER"},
+]
+
+GRUPOS_VOTO = ["tecnico", "fundamental"]
+
+_OPERADORES = {
+    "==": operator.eq, "!=": operator.ne,
+    ">": operator.gt, ">=": operator.ge,
+    "<": operator.lt, "<=": operator.le,
+}
+
+def cargar_reglas(ruta=None):
+    """Reglas desde un JSON con el mismo formato que REGLAS_POR_DEFECTO (None = las por defecto)."""
+    if ruta is None:
+        return REGLAS_POR_DEFECTO
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+def _valor(df, valor):
+    return df[valor["columna"]] if isinstance(valor, dict) else valor
+
+def _categorias(codigos, etiquetas):
+    """Categórica a partir de índices en `etiquetas` (-1 = NaN); evita materializar millones de strings."""
+    unicas = list(dict.fromkeys(etiquetas))
+    remapeo = np.array([unicas.index(e) for e in etiquetas] + [-1])
+    return pd.Categorical.from_codes(remapeo[codigos], categories=unicas)
+
+def evaluar_regla(df, regla):
+    """Serie categórica con la etiqueta de la regla para cada fila (NaN si faltan datos)."""
+    columna = df[regla["columna"]]
+    valida = columna.notna().to_numpy(copy=True)
+    for _, valor, _ in regla["condiciones"]:
+        if isinstance(valor, dict):
+            valida &= df[valor["columna"]].notna().to_numpy()
+
+    mascaras = [
+        _OPERADORES[op](columna, _valor(df, valor)).to_numpy(dtype=bool) & valida
+        for op, valor, _ in regla["condiciones"]
+    ]
+    etiquetas = [etiqueta for _, _, etiqueta in regla["condiciones"]] + [regla["si_no"]]
+    codigos = np.select(mascaras, range(len(mascaras)), default=len(mascaras))
+    codigos[~valida] = -1
+    return pd.Series(_categorias(codigos, etiquetas), index=df.index, name=regla["senal"])
+
+def evaluar_reglas(df, reglas=None):
+    """DataFrame con una columna por señal."""
+    reglas = REGLAS_POR_DEFECTO if reglas is None else reglas
+    return pd.DataFrame({regla["senal"]: evaluar_regla(df, regla) for regla in reglas}, index=df.index)
+
+def _conteo(senales, etiqueta):
+    return sum(senales[c].eq(etiqueta).to_numpy() for c in senales.columns) if len(senales.columns) else 0
+
+def _pct_compra(senales):
+    """% de señales COMPRAR sobre las señales presentes (NaN si no hay ninguna)."""
+    presentes = sum(senales[c].notna().to_numpy() for c in senales.columns) if len(senales.columns) else 0
+    compras = _conteo(senales, "COMPRAR")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pct = np.where(presentes > 0, compras / np.maximum(presentes, 1) * 100, np.nan)
+    return pd.Series(pct, index=senales.index).round(2)
+
+def resumir_senales(senales, reglas=None):
+    """
+    % de compra por grupo y decisión final por mayoría simple de COMPRAR/VENDER.
+
+    Returns:
+        DataFrame: %_Tecnico_Buy, %_Fundamental_Buy, Decision_Final.
+    """
+    reglas = REGLAS_POR_DEFECTO if reglas is None else reglas
+    por_grupo = {
+        grupo: senales[[r["senal"] for r in reglas if r["grupo"] == grupo]]
+        for grupo in GRUPOS_VOTO
+    }
+    votos = pd.concat(por_grupo.values(), axis=1)
+    compras = _conteo(votos, "COMPRAR")
+    ventas = _conteo(votos, "VENDER")
+    decision = np.select([compras > ventas, ventas > compras], [0, 1], default=2)
+
+    return pd.DataFrame({
+        "%_Tecnico_Buy": _pct_compra(por_grupo["tecnico"]),
+        "%_Fundamental_Buy": _pct_compra(por_grupo["fundamental"]),
+        "Decision_Final": _categorias(decision, ["COMPRAR", "VENDER", "MANTENER"]),
+    }, index=senales.index)
@@ -3,29 +3,33 @@ import os
 from tqdm import tqdm
 from datetime import datetime
 import numpy as np
+from reglas import cargar_reglas, evaluar_reglas, resumir_senales
+from paralelo import aplicar_por_ticker
+from indicadores import PanelIndicadores
+from almacenamiento import (leer_tabla, leer_posteriores, guardar_tabla, anexar_tabla, existe_tabla, borrar_tabla,
+                            ruta_dataset, PARTICION_ANIO, leer_por_partes, guardar_por_partes)
+from esquema import TIPOS_PRECIOS
 
 # Directorios
 DIR_RAW = "../../data/raw_data/"
 DIR_READY = "../../data/clean_data/"
 os.makedirs(DIR_READY, exist_ok=True)
 
+# Modo por partes (memoria acotada) para precios y variaciones: filas por parte (0 = todo en memoria)
+FILAS_POR_PARTE = int(os.getenv("ETL_FILAS_POR_PARTE", "0")) or None
+
 def log(msg):
     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {msg}")
 
 def transformar_empresas(input_file, output_file):
     log("Transformando datos de empresas...")
-    df = pd.read_csv(input_file)
-
     columnas_finales = ["Ticker", "Name", "Sector", "Industry"]
-    df = df[columnas_finales]
+    df = leer_tabla(input_file, columnas=columnas_finales)
 
-    df.to_csv(output_file, index=False)
+    guardar_tabla(df, output_file)
     log(f"Empresas listas guardadas en: {output_file}")
 
-def transformar_precios_historicos(input_file, output_file):
-    log("Transformando precios historicos (formato tidy)...")
-    df = pd.read_csv(input_file)
-
+def _precios_tidy(df):
     df = df.rename(columns={
         "date": "Date",
         "ticker": "Ticker",
@@ -39,315 +43,468 @@ def transformar_precios_historicos(input_file, output_file):
     df = df[['Date', 'Ticker', 'Open', 'High', 'Low', 'Close', 'Volume']]
     df['Date'] = pd.to_datetime(df['Date'])
     df[['Open', 'High', 'Low', 'Close']] = df[['Open', 'High', 'Low', 'Close']].round(3)
+    return df
+
+def transformar_precios_historicos(input_file, output_file, filas_por_parte=FILAS_POR_PARTE):
+    """
+    Pasa el historial crudo al formato tidy (Date, Ticker, OHLCV) con precios redondeados.
+
+    Con `filas_por_parte` se procesa de a partes: la memoria no depende del largo del historial.
+    """
+    log("Transformando precios historicos (formato tidy)...")
+    if filas_por_parte:
+        partes = leer_por_partes(input_file, filas_por_parte, tipos=TIPOS_PRECIOS)
+        filas = guardar_por_partes(map(_precios_tidy, partes), output_file, particion=PARTICION_ANIO)
+        log(f"Precios historicos listos guardados en: {output_file} ({filas} filas, de a {filas_por_parte})")
+        return
 
-    df.to_csv(output_file, index=False)
+    guardar_tabla(_precios_tidy(leer_tabla(input_file)), output_file, particion=PARTICION_ANIO)
     log(f"Precios historicos listos guardados en: {output_file}")
 
 def transformar_indicadores_fundamentales(input_file, output_file):
     log("Transformando indicadores fundamentales...")
-    df = pd.read_csv(input_file)
-
     columnas_finales = [
         "Ticker", "Name", "PER", "ROE", "EPS Growth YoY",
         "Deuda/Patrimonio", "Margen Neto", "Dividend Yield", "Market Cap", "Acciones en Circulación"
     ]
 
-    df = df[columnas_finales]
+    df = leer_tabla(input_file, columnas=columnas_finales)
     df["Ranking MarketCap"] = df["Market Cap"].rank(ascending=False, method='first').astype(int)
 
-    df.to_csv(output_file, index=False)
+    guardar_tabla(df, output_file)
     log(f"Indicadores fundamentales listos guardados en: {output_file}")
 
-def calcular_rsi(close, window=14):
-    delta = close.diff()
-    gain = delta.clip(lower=0)
-    loss = -delta.clip(upper=0)
-    avg_gain = gain.rolling(window=window).mean()
-    avg_loss = loss.rolling(window=window).mean()
-    rs = avg_gain / avg_loss
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
-
-def calcular_macd(close, short=12, long=26, signal=9):
-    ema_short = close.ewm(span=short, adjust=False).mean()
-    ema_long = close.ewm(span=long, adjust=False).mean()
-    macd = ema_short - ema_long
-    macd_signal = macd.ewm(span=signal, adjust=False).mean()
-    macd_hist = macd - macd_signal
-    return macd, macd_signal, macd_hist
-
-def calcular_atr(high, low, close, window=14):
-    high_low = high - low
-    high_close = (high - close.shift()).abs()
-    low_close = (low - close.shift()).abs()
-    ranges = pd.concat([high_low, high_close, low_close], axis=1)
-    true_range = ranges.max(axis=1)
-    atr = true_range.rolling(window=window).mean()
-    return atr
-
-def calcular_obv(close, volume):
-    obv = (np.sign(close.diff()) * volume).fillna(0).cumsum()
-    return obv
-
-def calcular_indicadores_tecnicos(input_file, output_file):
-    """Calcula indicadores técnicos + niveles de Fibonacci sobre precios históricos."""
-    log("Calculando indicadores técnicos y niveles de Fibonacci...")
-    df = pd.read_csv(input_file)
+NIVELES_FIB = ['0.0%', '23.6%', '38.2%', '50.0%', '61.8%', '100%']
+
+# Ventanas de Fibonacci (filas = días hábiles): sufijo de las columnas -> días
+VENTANAS_FIB = {'': 252, '_6M': 126}
+
+def _columnas_fibonacci(sufijo):
+    return [f'Fib_{nivel}{sufijo}' for nivel in NIVELES_FIB] + [f'Nivel_Fib_Cercano{sufijo}', f'Estado_Fibonacci{sufijo}']
+
+COLUMNAS_INDICADORES = ['Date', 'Ticker', 'Close',
+                        'SMA_20', 'SMA_50', 'EMA_20',
+                        'RSI_14', 'MACD', 'MACD_Signal', 'MACD_Hist',
+                        'ATR_14', 'OBV',
+                        'BB_Middle', 'BB_Upper', 'BB_Lower',
+                        'Volatility_20'] + [c for sufijo in VENTANAS_FIB for c in _columnas_fibonacci(sufijo)]
+
+INDICADORES_REGISTRO = ['SMA_20', 'SMA_50', 'EMA_20', 'RSI_14', 'MACD', 'MACD_Signal', 'MACD_Hist',
+                        'ATR_14', 'OBV', 'BB_Middle', 'BB_Upper', 'BB_Lower', 'Volatility_20']
+
+def _asignar_fibonacci(df, max_close, min_close, close, sufijo=''):
+    """Agrega los niveles de Fibonacci de la ventana y, en cada fila, el nivel más cercano a su Close."""
+    diff = max_close - min_close
+
+    df[f'Fib_0.0%{sufijo}'] = max_close
+    df[f'Fib_23.6%{sufijo}'] = max_close - diff * 0.236
+    df[f'Fib_38.2%{sufijo}'] = max_close - diff * 0.382
+    df[f'Fib_50.0%{sufijo}'] = max_close - diff * 0.50
+    df[f'Fib_61.8%{sufijo}'] = max_close - diff * 0.618
+    df[f'Fib_100%{sufijo}'] = min_close
+
+    # Empates: el primer nivel, igual que min() sobre el diccionario de distancias
+    niveles = df[[f'Fib_{nivel}{sufijo}' for nivel in NIVELES_FIB]].to_numpy()
+    distancias = np.abs(np.asarray(close, dtype=float)[:, None] - niveles)
+    nivel_cercano = np.array(NIVELES_FIB, dtype=object)[np.argmin(distancias, axis=1)]
+
+    df[f'Nivel_Fib_Cercano{sufijo}'] = nivel_cercano
+    df[f'Estado_Fibonacci{sufijo}'] = np.select(
+        [np.isin(nivel_cercano, ['38.2%', '50.0%', '61.8%']), np.isin(nivel_cercano, ['0.0%', '23.6%'])],
+        ['SOPORTE', 'RESISTENCIA'],
+        default='NEUTRO'
+    )
 
-    df['Date'] = pd.to_datetime(df['Date'])
-    df = df.sort_values(by=['Ticker', 'Date'])
-
-    indicadores = []
-
-    for ticker, group in tqdm(df.groupby('Ticker')):
-        group = group.copy()
-
-        # Cálculo de indicadores tradicionales
-        group['SMA_20'] = group['Close'].rolling(window=20).mean()
-        group['SMA_50'] = group['Close'].rolling(window=50).mean()
-        group['EMA_20'] = group['Close'].ewm(span=20, adjust=False).mean()
-
-        group['RSI_14'] = calcular_rsi(group['Close'])
-        group['MACD'], group['MACD_Signal'], group['MACD_Hist'] = calcular_macd(group['Close'])
-
-        group['ATR_14'] = calcular_atr(group['High'], group['Low'], group['Close'])
-        group['OBV'] = calcular_obv(group['Close'], group['Volume'])
-
-        group['BB_Middle'] = group['Close'].rolling(window=20).mean()
-        group['BB_Upper'] = group['BB_Middle'] + 2 * group['Close'].rolling(window=20).std()
-        group['BB_Lower'] = group['BB_Middle'] - 2 * group['Close'].rolling(window=20).std()
-
-        group['Volatility_20'] = group['Close'].rolling(window=20).std()
-
-        # Cálculo de Niveles Fibonacci
-        max_close = group['Close'].max()
-        min_close = group['Close'].min()
-        diff = max_close - min_close
-
-        group['Fib_0.0%'] = max_close
-        group['Fib_23.6%'] = max_close - diff * 0.236
-        group['Fib_38.2%'] = max_close - diff * 0.382
-        group['Fib_50.0%'] = max_close - diff * 0.50
-        group['Fib_61.8%'] = max_close - diff * 0.618
-        group['Fib_100%'] = min_close
-
-        # Último Close del ticker
-        ultimo_close = group.iloc[-1]['Close']
-
-        diffs = {
-            '0.0%': abs(ultimo_close - group.iloc[-1]['Fib_0.0%']),
-            '23.6%': abs(ultimo_close - group.iloc[-1]['Fib_23.6%']),
-            '38.2%': abs(ultimo_close - group.iloc[-1]['Fib_38.2%']),
-            '50.0%': abs(ultimo_close - group.iloc[-1]['Fib_50.0%']),
-            '61.8%': abs(ultimo_close - group.iloc[-1]['Fib_61.8%']),
-            '100%': abs(ultimo_close - group.iloc[-1]['Fib_100%'])
-        }
-        nivel_cercano = min(diffs, key=diffs.get)
-
-        if nivel_cercano in ['38.2%', '50.0%', '61.8%']:
-            estado_fib = 'SOPORTE'
-        elif nivel_cercano in ['0.0%', '23.6%']:
-            estado_fib = 'RESISTENCIA'
-        else:
-            estado_fib = 'NEUTRO'
-
-        group['Nivel_Fib_Cercano'] = nivel_cercano
-        group['Estado_Fibonacci'] = estado_fib
-
-        indicadores.append(group[['Date', 'Ticker', 'Close',
-                                  'SMA_20', 'SMA_50', 'EMA_20',
-                                  'RSI_14', 'MACD', 'MACD_Signal', 'MACD_Hist',
-                                  'ATR_14', 'OBV',
-                                  'BB_Middle', 'BB_Upper', 'BB_Lower',
-                                  'Volatility_20',
-                                  'Fib_0.0%', 'Fib_23.6%', 'Fib_38.2%', 'Fib_50.0%', 'Fib_61.8%', 'Fib_100%',
-                                  'Nivel_Fib_Cercano', 'Estado_Fibonacci']])
-
-    df_indicadores = pd.concat(indicadores)
-    df_indicadores.to_csv(output_file, index=False)
-    log(f"Indicadores técnicos + Fibonacci guardados en: {output_file}")
+def calcular_panel_indicadores(df):
+    """
+    Calcula los indicadores técnicos para todos los tickers a la vez.
+
+    Usa transformaciones agrupadas (rolling/ewm/diff/cumsum por ticker) sobre el panel
+    largo, que dan exactamente los mismos valores que el cálculo ticker a ticker.
+    Para agregar un indicador: registrarlo en indicadores.py y sumarlo a INDICADORES_REGISTRO.
+    `df` debe venir ordenado por Ticker y Date.
+    """
+    df = df[df['Ticker'].notna()].reset_index(drop=True)
+
+    # Indicadores del registro (indicadores.py): los intermedios compartidos se calculan una vez
+    panel = PanelIndicadores(df)
+    for indicador in INDICADORES_REGISTRO:
+        df[indicador] = panel[indicador]
+
+    # Niveles Fibonacci con el máximo/mínimo móvil de cada ventana (valores sin look-ahead)
+    for sufijo, ventana in VENTANAS_FIB.items():
+        _asignar_fibonacci(df, panel[f'max_{ventana}'], panel[f'min_{ventana}'], df['Close'], sufijo)
+
+    return df[COLUMNAS_INDICADORES]
+
+# ================
+# Modo incremental de indicadores técnicos
+# ================
+VENTANA_COLA = 252  # filas por ticker necesarias para la ventana más larga (Fibonacci 52 semanas)
+DIR_ESTADO_INDICADORES = DIR_READY + "estado_indicadores/"
+COLUMNAS_PRECIOS = ['Date', 'Ticker', 'Open', 'High', 'Low', 'Close', 'Volume']
+SPANS_EMA = {'EMA_20': 20, 'EMA_12': 12, 'EMA_26': 26, 'MACD_Signal': 9}
+
+def _alpha_ewm(span):
+    """Mismo alpha que pandas para ewm(span=...)."""
+    com = (span - 1) / 2.0
+    return 1.0 / (1.0 + com)
+
+def _ewm_desde_estado(valores, fila_estado, paso, valor, peso, span):
+    """
+    Continúa un ewm(span, adjust=False) de pandas desde el estado (valor, peso) de cada ticker.
+
+    Reproduce la recurrencia de pandas operación por operación (incluidos los huecos NaN),
+    así que el resultado es idéntico bit a bit al de recalcular toda la historia.
+    `fila_estado` indica la fila del estado de cada valor y `paso` su orden dentro del ticker.
+    Devuelve los valores calculados y el estado actualizado.
+    """
+    alpha = _alpha_ewm(span)
+    factor = 1.0 - alpha
+    valor, peso = valor.copy(), peso.copy()
+    salida = np.empty(len(valores))
+
+    for k in range(int(paso.max()) + 1 if len(paso) else 0):
+        filas = np.flatnonzero(paso == k)
+        t = fila_estado[filas]
+        cur, w, p = valores[filas], valor[t], peso[t]
+
+        observado = ~np.isnan(cur)
+        iniciado = ~np.isnan(w)
+        p = np.where(iniciado, p * factor, p)
+        with np.errstate(invalid='ignore'):
+            ponderado = p * w + alpha * cur
+            ponderado /= (p + alpha)
+        w = np.where(iniciado & observado & (w != cur), ponderado, w)
+        w = np.where(~iniciado & observado, cur, w)
+        p = np.where(observado, 1.0, p)
+
+        valor[t], peso[t], salida[filas] = w, p, w
+
+    return salida, valor, peso
+
+def _peso_final_ewm(serie, grupos, span):
+    """Peso pendiente del ewm de cada ticker: se decae una vez por cada NaN posterior a la última observación."""
+    factor = 1.0 - _alpha_ewm(span)
+    posicion = serie.groupby(grupos, sort=False).cumcount()
+    ultima_obs = posicion.where(serie.notna()).groupby(grupos, sort=False).max()
+    largo = posicion.groupby(grupos, sort=False).max()
+    pendientes = (largo - ultima_obs).fillna(0).astype(int)
+
+    peso = np.ones(len(pendientes))
+    for k in range(int(pendientes.max()) if len(pendientes) else 0):
+        peso = np.where(pendientes.to_numpy() > k, peso * factor, peso)
+    return pd.Series(peso, index=pendientes.index)
+
+def _estado_desde_historia(df_precios, df_indicadores):
+    """Construye el estado por ticker (EMAs y OBV) tras un cálculo completo."""
+    grupos = df_precios['Ticker']
+    close = df_precios['Close']
+    ultimos = df_indicadores.groupby('Ticker', sort=False).tail(1).set_index('Ticker')
+
+    panel = PanelIndicadores(df_precios)
+    ema_12, ema_26 = panel['ema_12'], panel['ema_26']
+    estado = pd.DataFrame({
+        'Date': ultimos['Date'],
+        'EMA_20': ultimos['EMA_20'],
+        'EMA_20_peso': _peso_final_ewm(close, grupos, 20),
+        'EMA_12': ema_12.groupby(grupos, sort=False).last(),
+        'EMA_12_peso': _peso_final_ewm(close, grupos, 12),
+        'EMA_26': ema_26.groupby(grupos, sort=False).last(),
+        'EMA_26_peso': _peso_final_ewm(close, grupos, 26),
+        'MACD_Signal': ultimos['MACD_Signal'],
+        'MACD_Signal_peso': _peso_final_ewm(panel['MACD'], grupos, 9),
+        'OBV': ultimos['OBV'],
+    })
+    estado.index.name = 'Ticker'
+    return estado.reset_index()
+
+def invalidar_estado_indicadores(tickers=None, estado_dir=DIR_ESTADO_INDICADORES,
+                                 resumen_historico_file=ruta_dataset(DIR_READY, "resumen_inversion_historico_ready")):
+    """
+    Descarta el estado incremental: el próximo cálculo de indicadores recorre la historia completa.
+
+    Las filas del resumen histórico de `tickers` (los que cambiaron antes de su última fecha)
+    salieron de los indicadores anteriores: se borran para que el próximo cálculo las rehaga.
+    """
+    for nombre in ("estado", "cola"):
+        borrar_tabla(ruta_dataset(estado_dir, nombre))
+    if tickers and existe_tabla(resumen_historico_file):
+        resumen = leer_tabla(resumen_historico_file)
+        guardar_tabla(resumen[~resumen["Ticker"].astype(str).isin(tickers)], resumen_historico_file,
+                      particion=PARTICION_ANIO)
+    log("Estado incremental de indicadores descartado (el historial cambió antes de la última fecha).")
+
+def _guardar_estado(estado, cola, estado_dir):
+    guardar_tabla(estado, ruta_dataset(estado_dir, "estado"))
+    guardar_tabla(cola, ruta_dataset(estado_dir, "cola"))
+
+def _cargar_estado(estado_dir):
+    ruta_estado = ruta_dataset(estado_dir, "estado")
+    ruta_cola = ruta_dataset(estado_dir, "cola")
+    if not (existe_tabla(ruta_estado) and existe_tabla(ruta_cola)):
+        return None, None
+    return leer_tabla(ruta_estado), leer_tabla(ruta_cola)
+
+def _actualizar_indicadores(cola, nuevas, estado):
+    """
+    Calcula los indicadores solo para las filas nuevas de tickers con estado previo.
+
+    Las ventanas móviles (SMA/RSI/ATR/BB/volatilidad/Fibonacci) se calculan sobre la cola guardada
+    + filas nuevas; las medias exponenciales y el OBV continúan desde el estado.
+    Devuelve (indicadores de las filas nuevas, estado actualizado).
+    """
+    marco = pd.concat([cola, nuevas], ignore_index=True)
+    es_nueva = np.r_[np.zeros(len(cola), dtype=bool), np.ones(len(nuevas), dtype=bool)]
+    marco['_nueva'] = es_nueva
+    marco = marco.sort_values(['Ticker', 'Date'], kind='stable').reset_index(drop=True)
+    es_nueva = marco.pop('_nueva').to_numpy()
+
+    panel = calcular_panel_indicadores(marco)
+    resultado = panel[es_nueva].reset_index(drop=True)
+
+    estado = estado.set_index('Ticker')
+    fila_estado = estado.index.get_indexer(resultado['Ticker'])
+    paso = resultado.groupby('Ticker', sort=False).cumcount().to_numpy()
+    close = resultado['Close'].to_numpy(dtype=float)
+
+    def continuar(valores, nombre):
+        salida, estado[nombre], estado[f'{nombre}_peso'] = _ewm_desde_estado(
+            valores, fila_estado, paso,
+            estado[nombre].to_numpy(dtype=float), estado[f'{nombre}_peso'].to_numpy(dtype=float),
+            SPANS_EMA[nombre])
+        return salida
+
+    resultado['EMA_20'] = continuar(close, 'EMA_20')
+    macd = continuar(close, 'EMA_12') - continuar(close, 'EMA_26')
+    signal = continuar(macd, 'MACD_Signal')
+    resultado['MACD'], resultado['MACD_Signal'], resultado['MACD_Hist'] = macd, signal, macd - signal
+
+    # OBV: el acumulado previo se suma al primer incremento y se sigue con cumsum
+    incrementos = (np.sign(marco['Close'].groupby(marco['Ticker'], sort=False).diff()) * marco['Volume']).fillna(0)
+    incrementos = incrementos.to_numpy()[es_nueva]
+    primeras = paso == 0
+    incrementos[primeras] = estado['OBV'].to_numpy(dtype=float)[fila_estado[primeras]] + incrementos[primeras]
+    resultado['OBV'] = pd.Series(incrementos).groupby(resultado['Ticker'], sort=False).cumsum()
+    obv_final = resultado.groupby('Ticker', sort=False)['OBV'].last()
+    estado.loc[obv_final.index, 'OBV'] = obv_final
+
+    ultimas_fechas = resultado.groupby('Ticker', sort=False)['Date'].max()
+    estado.loc[ultimas_fechas.index, 'Date'] = ultimas_fechas
+    return resultado[COLUMNAS_INDICADORES], estado.reset_index()
+
+def calcular_indicadores_tecnicos(input_file, output_file, incremental=False,
+                                  estado_dir=DIR_ESTADO_INDICADORES):
+    """
+    Calcula indicadores técnicos + niveles de Fibonacci sobre precios históricos.
+
+    Con `incremental=True` solo se calculan los días posteriores al último procesado por cada
+    ticker, usando el estado guardado en `estado_dir` (EMAs, OBV y las últimas VENTANA_COLA
+    filas de precios), y se agregan al final de `output_file`; las filas ya guardadas no se
+    tocan. Sin estado previo se hace el cálculo completo y se guarda el estado.
+
+    El resultado coincide con el cálculo completo porque ningún indicador depende de la
+    historia más allá de VENTANA_COLA filas (Fibonacci usa ventanas de 52 semanas y 6 meses):
+    EMAs, MACD y OBV bit a bit, las ventanas móviles hasta ~1e-10 relativo (pandas acumula
+    sumas sobre toda la historia) y los estados de Fibonacci exactos.
+    """
+    log("Calculando indicadores técnicos y niveles de Fibonacci...")
+    df = leer_tabla(input_file, columnas=COLUMNAS_PRECIOS)
+    df = df[df['Ticker'].notna()].sort_values(by=['Ticker', 'Date']).reset_index(drop=True)
+
+    estado, cola = _cargar_estado(estado_dir) if incremental else (None, None)
+    if estado is not None and 'Fib_Max' in estado.columns:
+        # Estado anterior a Fibonacci por ventana móvil (cola de 50 filas): se recalcula todo una vez
+        log("Estado de indicadores de una versión anterior: se recalcula la historia completa.")
+        estado = None
+    if estado is None or not existe_tabla(output_file):
+        df_indicadores = aplicar_por_ticker(calcular_panel_indicadores, df)
+        guardar_tabla(df_indicadores, output_file, particion=PARTICION_ANIO)
+        _guardar_estado(_estado_desde_historia(df, df_indicadores),
+                        df[COLUMNAS_PRECIOS].groupby('Ticker', sort=False).tail(VENTANA_COLA),
+                        estado_dir)
+        log(f"Indicadores técnicos + Fibonacci guardados en: {output_file}")
+        return
+
+    ultima_fecha = df['Ticker'].map(estado.set_index('Ticker')['Date'])
+    conocidos = ultima_fecha.notna()
+    nuevas = df.loc[conocidos & (df['Date'] > ultima_fecha), COLUMNAS_PRECIOS]
+    tickers_nuevos = df.loc[~conocidos, COLUMNAS_PRECIOS].reset_index(drop=True)
+
+    partes, estados = [], [estado[~estado['Ticker'].isin(nuevas['Ticker'])]]
+    if not nuevas.empty:
+        cola_activa = cola[cola['Ticker'].isin(nuevas['Ticker'])]
+        df_nuevas, estado_actualizado = _actualizar_indicadores(
+            cola_activa, nuevas, estado[estado['Ticker'].isin(nuevas['Ticker'])])
+        partes.append(df_nuevas)
+        estados.append(estado_actualizado)
+    if not tickers_nuevos.empty:
+        df_tickers_nuevos = aplicar_por_ticker(calcular_panel_indicadores, tickers_nuevos)
+        partes.append(df_tickers_nuevos)
+        estados.append(_estado_desde_historia(tickers_nuevos, df_tickers_nuevos))
+
+    if not partes:
+        log("No hay fechas nuevas para calcular indicadores técnicos.")
+        return
+
+    df_indicadores = pd.concat(partes, ignore_index=True).sort_values(['Ticker', 'Date'], kind='stable')
+    anexar_tabla(df_indicadores, output_file, particion=PARTICION_ANIO)
+
+    cola = pd.concat([cola, nuevas, tickers_nuevos], ignore_index=True).sort_values(['Ticker', 'Date'], kind='stable')
+    _guardar_estado(pd.concat(estados, ignore_index=True).sort_values('Ticker'),
+                    cola.groupby('Ticker', sort=False).tail(VENTANA_COLA),
+                    estado_dir)
+    log(f"Indicadores técnicos incrementales agregados a: {output_file} ({len(df_indicadores)} filas nuevas)")
+
+COLUMNAS_RESUMEN = [
+    "Ticker", "%_Tecnico_Buy", "%_Fundamental_Buy", "Decision_Final", "Estado_BollingerBands",
+    "SMA_vs_EMA", "MACD", "RSI", "PER", "ROE", "EPS Growth YoY", "Deuda/Patrimonio", "Estado_Fibonacci"
+]
+
+COLUMNAS_TECNICOS_RESUMEN = [
+    'Date', 'Ticker', 'Close', 'SMA_20', 'EMA_20', 'RSI_14', 'MACD', 'MACD_Signal',
+    'BB_Upper', 'BB_Lower', 'Estado_Fibonacci'
+]
+
+def _puntuar_senales(df, reglas, columnas):
+    """Evalúa las reglas fila a fila (vectorizado) y devuelve las columnas del resumen."""
+    senales = evaluar_reglas(df, reglas)
+    df_resultado = pd.concat([df[['Date', 'Ticker', 'Estado_Fibonacci']], senales, resumir_senales(senales, reglas)], axis=1)
+    return df_resultado.reindex(columns=columnas).reset_index(drop=True)
 
 def calcular_resumen_inversion(
-    precios_tecnicos_file=DIR_READY + "indicadores_tecnicos_ready.csv",
-    fundamentales_file=DIR_READY + "indicadores_fundamentales_ready.csv",
-    precios_historicos_file=DIR_READY + "precios_historicos_ready.csv",
-    output_file=DIR_READY + "resumen_inversion_ready.csv"
+    precios_tecnicos_file=ruta_dataset(DIR_READY, "indicadores_tecnicos_ready"),
+    fundamentales_file=ruta_dataset(DIR_READY, "indicadores_fundamentales_ready"),
+    precios_historicos_file=ruta_dataset(DIR_READY, "precios_historicos_ready"),
+    output_file=ruta_dataset(DIR_READY, "resumen_inversion_ready"),
+    reglas_file=None
 ):
+    """
+    Resumen de señales por ticker con el último registro técnico y los fundamentales.
+
+    Las señales se evalúan por columnas con la tabla de reglas de reglas.py (o la de
+    `reglas_file`, un JSON con el mismo formato) para cambiar umbrales sin tocar código.
+    """
     print("🔍 Calculando resumen detallado de inversión...")
+    reglas = cargar_reglas(reglas_file)
 
     # Cargar datasets
-    df_tecnicos = pd.read_csv(precios_tecnicos_file)
-    df_fundamentales = pd.read_csv(fundamentales_file)
-    df_precios = pd.read_csv(precios_historicos_file)
+    df_tecnicos = leer_tabla(precios_tecnicos_file, columnas=COLUMNAS_TECNICOS_RESUMEN)
+    df_fundamentales = leer_tabla(fundamentales_file)
 
     # Tomar último registro por ticker
     df_ultimos_tecnicos = df_tecnicos.sort_values('Date').groupby('Ticker').tail(1)
-    df_ultimos_precios = df_precios.sort_values('Date').groupby('Ticker').tail(1)[['Ticker', 'Close']]
-
-    # Merge
     df = pd.merge(df_ultimos_tecnicos, df_fundamentales, on='Ticker', how='inner')
-    # Elimina esta línea, porque no hace falta:
-    # df = pd.merge(df, df_ultimos_precios, on='Ticker', how='left')
-
-    resultados = []
-
-    for _, row in tqdm(df.iterrows(), total=len(df)):
-
-        ticker = row['Ticker']
-
-        ### Análisis Técnico ###
-        señales_tec = {}
-        
-        # SMA vs EMA
-        if pd.notna(row['SMA_20']) and pd.notna(row['EMA_20']):
-            señales_tec['SMA_vs_EMA'] = 'COMPRAR' if row['SMA_20'] > row['EMA_20'] else 'VENDER'
-
-        # MACD
-        if pd.notna(row['MACD']) and pd.notna(row['MACD_Signal']):
-            señales_tec['MACD'] = 'COMPRAR' if row['MACD'] > row['MACD_Signal'] else 'VENDER'
-
-        # RSI
-        if pd.notna(row['RSI_14']):
-            if row['RSI_14'] < 30:
-                señales_tec['RSI'] = 'COMPRAR'
-            elif row['RSI_14'] > 70:
-                señales_tec['RSI'] = 'VENDER'
-            else:
-                señales_tec['RSI'] = 'MANTENER'
-
-        ### Estado de Bollinger Bands (solo informativo)
-        estado_bb = np.nan
-        if pd.notna(row['BB_Upper']) and pd.notna(row['BB_Lower']) and pd.notna(row['Close']):
-            if row['Close'] > row['BB_Upper']:
-                estado_bb = "Sobrecompra"
-            elif row['Close'] < row['BB_Lower']:
-                estado_bb = "Sobreventa"
-            else:
-                estado_bb = "Normal"
-        
-        ### Estado de Fibonacci ###
-        estado_fib = np.nan
-        if 'Estado_Fibonacci' in row and pd.notna(row['Estado_Fibonacci']):
-            if row['Estado_Fibonacci'] == 'SOPORTE':
-                señales_tec['Estado_Fibonacci'] = 'COMPRAR'
-            elif row['Estado_Fibonacci'] == 'RESISTENCIA':
-                señales_tec['Estado_Fibonacci'] = 'VENDER'
-            else:
-                señales_tec['Estado_Fibonacci'] = 'MANTENER'
-
-        ### Análisis Fundamental ###
-        señales_fund = {}
-
-        # PER
-        if pd.notna(row['PER']):
-            if row['PER'] < 20:
-                señales_fund['PER'] = 'COMPRAR'
-            elif row['PER'] > 30:
-                señales_fund['PER'] = 'VENDER'
-            else:
-                señales_fund['PER'] = 'MANTENER'
-
-        # ROE
-        if pd.notna(row['ROE']):
-            if row['ROE'] > 0.15:
-                señales_fund['ROE'] = 'COMPRAR'
-            elif row['ROE'] < 0.05:
-                señales_fund['ROE'] = 'VENDER'
-            else:
-                señales_fund['ROE'] = 'MANTENER'
-
-        # EPS Growth
-        if pd.notna(row['EPS Growth YoY']):
-            if row['EPS Growth YoY'] > 0.10:
-                señales_fund['EPS Growth YoY'] = 'COMPRAR'
-            elif row['EPS Growth YoY'] < 0:
-                señales_fund['EPS Growth YoY'] = 'VENDER'
-            else:
-                señales_fund['EPS Growth YoY'] = 'MANTENER'
-
-        # Deuda/Patrimonio
-        if pd.notna(row['Deuda/Patrimonio']):
-            if row['Deuda/Patrimonio'] < 100:
-                señales_fund['Deuda/Patrimonio'] = 'COMPRAR'
-            elif row['Deuda/Patrimonio'] > 200:
-                señales_fund['Deuda/Patrimonio'] = 'VENDER'
-            else:
-                señales_fund['Deuda/Patrimonio'] = 'MANTENER'
-
-        ### 3. Conteo de Señales de Compra y Venta
-
-        compras = list(señales_tec.values()).count('COMPRAR') + list(señales_fund.values()).count('COMPRAR')
-        ventas = list(señales_tec.values()).count('VENDER') + list(señales_fund.values()).count('VENDER')
-
-        pct_tecnico_buy = round(
-            list(señales_tec.values()).count('COMPRAR') / len(señales_tec) * 100, 2
-        ) if len(señales_tec) > 0 else np.nan
-
-        pct_fundamental_buy = round(
-            list(señales_fund.values()).count('COMPRAR') / len(señales_fund) * 100, 2
-        ) if len(señales_fund) > 0 else np.nan
-
-        ### 4. Decisión Final basada en mayoría simple
-        if compras > ventas:
-            decision = "COMPRAR"
-        elif ventas > compras:
-            decision = "VENDER"
-        else:
-            decision = "MANTENER"
-
-        ### Resultado ###
-        resultados.append({
-            "Ticker": ticker,
-            "%_Tecnico_Buy": pct_tecnico_buy,
-            "%_Fundamental_Buy": pct_fundamental_buy,
-            "Decision_Final": decision,
-            "Estado_BollingerBands": estado_bb,
-            "SMA_vs_EMA": señales_tec.get('SMA_vs_EMA', np.nan),
-            "MACD": señales_tec.get('MACD', np.nan),
-            "RSI": señales_tec.get('RSI', np.nan),
-            "PER": señales_fund.get('PER', np.nan),
-            "ROE": señales_fund.get('ROE', np.nan),
-            "EPS Growth YoY": señales_fund.get('EPS Growth YoY', np.nan),
-            "Deuda/Patrimonio": señales_fund.get('Deuda/Patrimonio', np.nan),
-            "Estado_Fibonacci": row['Estado_Fibonacci']
-        })
-
-    # Guardar CSV
-    df_resultado = pd.DataFrame(resultados)
-    df_resultado.to_csv(output_file, index=False)
+
+    df_resultado = _puntuar_senales(df, reglas, COLUMNAS_RESUMEN)
+    guardar_tabla(df_resultado, output_file)
 
     print(f"✅ Resumen de inversión detallado generado: {output_file}")
 
-def calcular_variaciones_precios(input_file=DIR_READY + "precios_historicos_ready.csv",
-                                 output_file=DIR_READY + "precios_variaciones_ready.csv"):
+def calcular_resumen_historico(
+    precios_tecnicos_file=ruta_dataset(DIR_READY, "indicadores_tecnicos_ready"),
+    fundamentales_file=ruta_dataset(DIR_READY, "indicadores_fundamentales_ready"),
+    output_file=ruta_dataset(DIR_READY, "resumen_inversion_historico_ready"),
+    reglas_file=None,
+    incremental=True
+):
+    """
+    Resumen de inversión para cada (Date, Ticker) de los indicadores técnicos, en una sola pasada.
+
+    Usa las mismas reglas que calcular_resumen_inversion. Los fundamentales no tienen historia:
+    cada fecha se puntúa con los fundamentales vigentes al momento de calcularla. En modo
+    incremental solo se calculan las fechas posteriores a la última ya guardada de cada ticker
+    (así las filas antiguas conservan los fundamentales de su día); los tickers sin filas
+    guardadas, nuevos o descartados por invalidar_estado_indicadores, se calculan completos.
+    """
+    print("🔍 Calculando resumen de inversión histórico...")
+    reglas = cargar_reglas(reglas_file)
+
+    marcas = None
+    if incremental and existe_tabla(output_file):
+        guardado = leer_tabla(output_file, columnas=["Date", "Ticker"])
+        marcas = guardado.groupby(guardado["Ticker"].astype(str))["Date"].max()
+
+    if marcas is None or marcas.empty:
+        marcas = None
+        df_tecnicos = leer_tabla(precios_tecnicos_file, columnas=COLUMNAS_TECNICOS_RESUMEN)
+    else:
+        df_tecnicos = leer_posteriores(precios_tecnicos_file, marcas, columnas=COLUMNAS_TECNICOS_RESUMEN)
+    if df_tecnicos.empty:
+        log("No hay fechas nuevas para el resumen histórico.")
+        return
+
+    df_fundamentales = leer_tabla(fundamentales_file)
+    df = pd.merge(df_tecnicos, df_fundamentales, on='Ticker', how='inner')
+    df = df.sort_values(['Date', 'Ticker'], kind='mergesort').reset_index(drop=True)
+
+    df_resultado = _puntuar_senales(df, reglas, ['Date'] + COLUMNAS_RESUMEN)
+    if marcas is None:
+        guardar_tabla(df_resultado, output_file, particion=PARTICION_ANIO)
+    else:
+        anexar_tabla(df_resultado, output_file, particion=PARTICION_ANIO)
+
+    log(f"Resumen histórico guardado en: {output_file} ({len(df_resultado)} filas)")
+
+PERIODOS_VARIACION = {
+    "daily": 1,
+    "weekly": 5,
+    "monthly": 21,
+    "annual": 252,
+    "5y": 252 * 5
+}
+
+def calcular_panel_variaciones(df):
+    """Variaciones porcentuales por ticker sobre el panel largo (Date, Ticker, Close)."""
+    df = df.sort_values(["Ticker", "Date"])
+
+    for name, days in PERIODOS_VARIACION.items():
+        df[f"var_{name}"] = df.groupby("Ticker")["Close"].pct_change(periods=days).round(4)
+
+    cols = ["Date", "Ticker", "Close"] + [f"var_{name}" for name in PERIODOS_VARIACION]
+    return df[cols]
+
+VENTANA_VARIACIONES = max(PERIODOS_VARIACION.values())  # 1260 filas: la mayor ventana (var_5y)
+
+def _variaciones_por_partes(partes):
+    """
+    Variaciones de cada parte del historial, arrastrando entre partes las últimas
+    VENTANA_VARIACIONES filas de cada ticker: el resultado es el mismo que con todo en memoria
+    siempre que las filas de cada ticker lleguen en orden de fecha (historial y datasets por año).
+    """
+    cola = None
+    for parte in partes:
+        parte = parte[["Date", "Ticker", "Close"]]
+        marco = parte if cola is None else pd.concat([cola, parte], ignore_index=True)
+        previas = 0 if cola is None else len(cola)
+        resultado = calcular_panel_variaciones(marco.reset_index(drop=True))
+        yield resultado[resultado.index >= previas]
+        # resultado está ordenado por Ticker y Date: la cola sale de ahí sin volver a ordenar
+        cola = resultado[["Date", "Ticker", "Close"]].groupby("Ticker", sort=False).tail(VENTANA_VARIACIONES)
+
+def calcular_variaciones_precios(input_file=ruta_dataset(DIR_READY, "precios_historicos_ready"),
+                                 output_file=ruta_dataset(DIR_READY, "precios_variaciones_ready"),
+                                 filas_por_parte=FILAS_POR_PARTE):
     """
     Calcula variaciones porcentuales diarias, semanales, mensuales, anuales y a 5 años de los precios de cierre.
 
     Args:
         input_file (str): Ruta del archivo de precios históricos limpio.
         output_file (str): Ruta donde guardar el nuevo archivo de variaciones.
+        filas_por_parte (int): Si se indica, se procesa de a partes con memoria acotada.
     """
     log("Calculando variaciones porcentuales de precios...")
+    if filas_por_parte:
+        partes = leer_por_partes(input_file, filas_por_parte, columnas=["Date", "Ticker", "Close"],
+                                 tipos=TIPOS_PRECIOS)
+        filas = guardar_por_partes(_variaciones_por_partes(partes), output_file, particion=PARTICION_ANIO)
+        log(f"Variaciones de precios guardadas en: {output_file} ({filas} filas, de a {filas_por_parte})")
+        return
 
-    df = pd.read_csv(input_file, parse_dates=["Date"])[["Date", "Ticker", "Close"]]
-
-    df = df.sort_values(["Ticker", "Date"])
-
-    periods = {
-        "daily": 1,
-        "weekly": 5,
-        "monthly": 21,
-        "annual": 252,
-        "5y": 252 * 5
-    }
-
-    for name, days in periods.items():
-        df[f"var_{name}"] = df.groupby("Ticker")["Close"].pct_change(periods=days).round(4)
-
-    cols = ["Date", "Ticker", "Close"] + [f"var_{name}" for name in periods]
-    df_variaciones = df[cols]
+    df = leer_tabla(input_file, columnas=["Date", "Ticker", "Close"])
+    df_variaciones = aplicar_por_ticker(calcular_panel_variaciones, df)
 
-    df_variaciones.to_csv(output_file, index=False)
+    guardar_tabla(df_variaciones, output_file, particion=PARTICION_ANIO)
     log(f"Variaciones de precios guardadas en: {output_file}")
 
 
@@ -355,30 +512,30 @@ if __name__ == "__main__":
     tqdm.pandas()
 
     transformar_empresas(
-        input_file=DIR_RAW + "top_500_marketcap.csv",
-        output_file=DIR_READY + "empresas_ready.csv"
+        input_file=ruta_dataset(DIR_RAW, "top_500_marketcap"),
+        output_file=ruta_dataset(DIR_READY, "empresas_ready")
     )
 
     transformar_precios_historicos(
-        input_file=DIR_RAW + "nyse_top500_data.csv",
-        output_file=DIR_READY + "precios_historicos_ready.csv"
+        input_file=ruta_dataset(DIR_RAW, "nyse_top500_data"),
+        output_file=ruta_dataset(DIR_READY, "precios_historicos_ready")
     )
 
     transformar_indicadores_fundamentales(
-        input_file=DIR_RAW + "nyse_top_500_fundamentals_indicators.csv",
-        output_file=DIR_READY + "indicadores_fundamentales_ready.csv"
+        input_file=ruta_dataset(DIR_RAW, "nyse_top_500_fundamentals_indicators"),
+        output_file=ruta_dataset(DIR_READY, "indicadores_fundamentales_ready")
     )
 
     calcular_indicadores_tecnicos(
-        input_file=DIR_READY + "precios_historicos_ready.csv",
-        output_file=DIR_READY + "indicadores_tecnicos_ready.csv"
+        input_file=ruta_dataset(DIR_READY, "precios_historicos_ready"),
+        output_file=ruta_dataset(DIR_READY, "indicadores_tecnicos_ready")
     )
 
     calcular_resumen_inversion()
 
     calcular_variaciones_precios(
-    input_file=DIR_READY + "precios_historicos_ready.csv",
-    output_file=DIR_READY + "precios_variaciones_ready.csv"
+    input_file=ruta_dataset(DIR_READY, "precios_historicos_ready"),
+    output_file=ruta_dataset(DIR_READY, "precios_variaciones_ready")
 )
 
 